@@ -15,44 +15,47 @@
  * ------------------------------------------------------------------------------
  */
 
+const http = require('http')
 const express = require('express')
 const app = express()
 
-let {OmiClient} = require('omi-client')
-// let {signer} = require('sawtooth-sdk')
-
-const BASE_SAWTOOTH_URL = 'http://localhost:8080'
-// This should either be generated once per rest user, or, in the case of reads,
-// is unecessary.
-const PRIVATE_KEY = ''
-
-app.get('/individuals', (req, res) => {
-  let omiClient = new OmiClient(BASE_SAWTOOTH_URL, PRIVATE_KEY)
-
-  return omiClient.getIndividuals().all()
-                  .then(individuals => res.send(individuals))
-})
-
-app.get('/organizations', (req, res) => {
-  let omiClient = new OmiClient(BASE_SAWTOOTH_URL, PRIVATE_KEY)
-
-  return omiClient.getOrganizations().all()
-                  .then(organizations => res.send(organizations))
-})
-
-app.get('/works', (req, res) => {
-  let omiClient = new OmiClient(BASE_SAWTOOTH_URL, PRIVATE_KEY)
-
-  return omiClient.getWorks().all()
-                  .then(works => res.send(works))
-})
-
-app.get('/recordings', (req, res) => {
-  let omiClient = new OmiClient(BASE_SAWTOOTH_URL, PRIVATE_KEY)
-
-  return omiClient.getRecordings().all()
-                  .then(recordings => res.send(recordings))
-})
+// Reads are served by omi-read-service, which keeps a cached, paginated
+// copy of OMI state; see omi/sawtooth_omi/read_service.py.  Each request
+// here is forwarded to it, rather than scanning the namespace through the
+// REST API.
+const READ_SERVICE_URL =
+  process.env.OMI_READ_SERVICE_URL || 'http://localhost:8090'
+
+const forward = (req, res) => {
+  let headers = {}
+  if (req.get('If-None-Match')) {
+    headers['If-None-Match'] = req.get('If-None-Match')
+  }
+
+  http.get(READ_SERVICE_URL + req.originalUrl, {headers}, (upstream) => {
+    res.status(upstream.statusCode)
+    for (let name of ['content-type', 'etag']) {
+      if (upstream.headers[name]) {
+        res.set(name, upstream.headers[name])
+      }
+    }
+    upstream.pipe(res)
+  }).on('error', (err) => {
+    res.status(502).send({error: err.message})
+  })
+}
+
+app.get('/individuals', forward)
+app.get('/individuals/:name', forward)
+
+app.get('/organizations', forward)
+app.get('/organizations/:name', forward)
+
+app.get('/works', forward)
+app.get('/works/:title', forward)
+
+app.get('/recordings', forward)
+app.get('/recordings/:title', forward)
 
 app.listen(3000, () => {
   console.log('Example app listening on port 3000')
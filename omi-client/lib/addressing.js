@@ -38,6 +38,12 @@ Object.seal(TYPE_SPACE)
 
 const ADDRESS_HASH_LENGTH = 62
 
+// Each public key's index of the objects it registered is split into
+// shards, picked by the last two hex digits of the object's address
+const OWNER_INDEX_SPACE = 'f0'
+const OWNER_INDEX_HASH_LENGTH = 60
+const OWNER_INDEX_SHARDS = 256
+
 function getObjectAddress (type, naturalKey) {
   if (!TYPE_SPACE[type]) {
     throw new Error(`Invalid type "${type}"`)
@@ -52,6 +58,15 @@ function getTypePrefix (type) {
   return NAMESPACE + TYPE_SPACE[type]
 }
 
+function getOwnerIndexPrefix (publicKey) {
+  return NAMESPACE + OWNER_INDEX_SPACE + _sha512(publicKey).substring(0, OWNER_INDEX_HASH_LENGTH)
+}
+
+function getOwnerIndexAddress (publicKey, objectAddress) {
+  let shard = parseInt(objectAddress.slice(-2), 16) % OWNER_INDEX_SHARDS
+  return getOwnerIndexPrefix(publicKey) + ('0' + shard.toString(16)).slice(-2)
+}
+
 module.exports = {
   /**
    * Produces an address of an object.
@@ -74,5 +89,28 @@ module.exports = {
    * @param {string} type = the object type
    * @returns {string} the address prefix for objects of the given type
    */
-  getTypePrefix
+  getTypePrefix,
+
+  /**
+   * Produces an address filter for a public key's owner index.
+   *
+   * Every shard of the index of objects registered under the public key
+   * shares this prefix.
+   *
+   * @param {string} publicKey - the registering public key, in hex
+   * @returns {string} the address prefix for the key's index shards
+   */
+  getOwnerIndexPrefix,
+
+  /**
+   * Produces the address of the owner index shard listing an object.
+   *
+   * Version 1.1 transactions that set an object must declare this address as
+   * both an input and an output.
+   *
+   * @param {string} publicKey - the registering public key, in hex
+   * @param {string} objectAddress - the object's address
+   * @returns {string} the address of the index shard
+   */
+  getOwnerIndexAddress
 }
@@ -21,7 +21,11 @@
 
 const request = require('superagent')
 
-const {getObjectAddress, getTypePrefix} = require('./addressing')
+const {
+  getObjectAddress,
+  getOwnerIndexAddress,
+  getTypePrefix
+} = require('./addressing')
 
 const {TransactionEncoder, BatchEncoder, signer} = require('sawtooth-sdk')
 const {
@@ -101,6 +105,7 @@ class OmiClient {
     return _submitOmiTransaction(
       this._sawtoothRestUrl,
       this._privateKey,
+      this._publicKey,
       'SetIndividualIdentity',
       IndividualIdentity,
       'name',
@@ -136,9 +141,14 @@ class OmiClient {
 
   /**
    * Returns a cursor for all the users.
+   *
+   * @param {number} [readAhead] - the number of pages the cursor fetches
+   * ahead of the one being read
+   *
+   * @returns {Cursor} a cursor of IndividualIdentity values
    */
-  getIndividuals () {
-    return _omiStateCursor(this._sawtoothRestUrl, IndividualIdentity)
+  getIndividuals (readAhead) {
+    return _omiStateCursor(this._sawtoothRestUrl, IndividualIdentity, readAhead)
   }
 
   /**
@@ -177,6 +187,7 @@ class OmiClient {
     return _submitOmiTransaction(
       this._sawtoothRestUrl,
       this._privateKey,
+      this._publicKey,
       'SetOrganizationalIdentity',
       OrganizationalIdentity,
       'name',
@@ -209,8 +220,16 @@ class OmiClient {
     return _omiStateEntry(this._sawtoothRestUrl, OrganizationalIdentity, name)
   }
 
-  getOrganizations () {
-    return _omiStateCursor(this._sawtoothRestUrl, OrganizationalIdentity)
+  /**
+   * Returns a cursor for all the organizations.
+   *
+   * @param {number} [readAhead] - the number of pages the cursor fetches
+   * ahead of the one being read
+   *
+   * @returns {Cursor} a cursor of OrganizationalIdentity values
+   */
+  getOrganizations (readAhead) {
+    return _omiStateCursor(this._sawtoothRestUrl, OrganizationalIdentity, readAhead)
   }
 
   /**
@@ -290,6 +309,7 @@ class OmiClient {
     return _submitOmiTransaction(
       this._sawtoothRestUrl,
       this._privateKey,
+      this._publicKey,
       'SetRecording',
       Recording,
       'title',
@@ -352,8 +372,16 @@ class OmiClient {
     return _omiStateEntry(this._sawtoothRestUrl, Recording, title)
   }
 
-  getRecordings () {
-    return _omiStateCursor(this._sawtoothRestUrl, Recording)
+  /**
+   * Returns a cursor for all the recordings.
+   *
+   * @param {number} [readAhead] - the number of pages the cursor fetches
+   * ahead of the one being read
+   *
+   * @returns {Cursor} a cursor of Recording values
+   */
+  getRecordings (readAhead) {
+    return _omiStateCursor(this._sawtoothRestUrl, Recording, readAhead)
   }
 
   /**
@@ -405,6 +433,7 @@ class OmiClient {
     return _submitOmiTransaction(
       this._sawtoothRestUrl,
       this._privateKey,
+      this._publicKey,
       'SetWork',
       Work,
       'title',
@@ -447,8 +476,16 @@ class OmiClient {
     return _omiStateEntry(this._sawtoothRestUrl, Work, title)
   }
 
-  getWorks () {
-    return _omiStateCursor(this._sawtoothRestUrl, Work)
+  /**
+   * Returns a cursor for all the works.
+   *
+   * @param {number} [readAhead] - the number of pages the cursor fetches
+   * ahead of the one being read
+   *
+   * @returns {Cursor} a cursor of Work values
+   */
+  getWorks (readAhead) {
+    return _omiStateCursor(this._sawtoothRestUrl, Work, readAhead)
   }
 }
 
@@ -494,11 +531,23 @@ class StatusChecker {
     ])
   }
 }
+/**
+ * The symbol for async iteration; `Symbol.asyncIterator` where the runtime
+ * provides it, otherwise the registered symbol polyfills use.
+ *
+ * @private
+ */
+const _asyncIterator = Symbol.asyncIterator || Symbol.for('Symbol.asyncIterator')
+
 /**
  * A cursor provides a way to traverse through the objects stored in global
  * state.  Generally, this should not be created, but are returned from the
  * various plural `get` methods.
  *
+ * While one page is being transformed and handed out, the cursor fetches the
+ * pages after it, up to its read-ahead depth.  A cursor is also an async
+ * iterable, for use with `for await`.
+ *
  * @see {@link OmiClient.getIndividuals}
  * @see {@link OmiClient.getOrganizations}
  * @see {@link OmiClient.getWorks}
@@ -512,12 +561,13 @@ class Cursor {
    * @param {string} endpoint - the query endpoint
    * @param {Cursor~xform} [xform] - an optional transform; defaults to
    * identity
+   * @param {number} [readAhead=2] - the number of pages to fetch ahead of the
+   * one being read
    */
-  constructor (endpoint, xform = (x) => x) {
+  constructor (endpoint, xform = (x) => x, readAhead = 2) {
     this._initialEndpoint = endpoint
     this._dataXform = xform
-
-    this._data_buffer = []
+    this._readAhead = readAhead
   }
   /**
    * A transform converts a raw state value, which consists of an * address and
@@ -538,33 +588,40 @@ class Cursor {
    * @param {Cursor~eachCallback} f - called on each element
    * @param {Cursor~onFinishedCallback} [onFinishedCallback] - optional
    * callback, called when the iteration is complete
+   *
+   * @returns {Promise} a promise that resolves after the last element, or
+   * rejects if a page cannot be fetched
    */
   each (f, onFinishedCallback = () => null) {
-    let __doFetch = (url) =>
-      _promiseGet(url, null).then((body) => {
-        body.data.map((x) => {
-          try {
-            return [null, this._dataXform(x)]
-          } catch (e) {
-            return [e, null]
-          }
-        })
-        .forEach(([err, value]) => f(err, value))
+    let pages = new _PageReader(this._initialEndpoint, this._readAhead)
 
-        let nextPage = body.paging.next
-        if (nextPage) {
-          return __doFetch(nextPage)
-        } else {
+    let __doRead = () =>
+      pages.read().then((data) => {
+        if (data === null) {
           try {
             onFinishedCallback()
           } catch (e) {
             // this should be logged
             console.log(e)
           }
+          return
         }
+
+        data.forEach((x) => {
+          let value
+          try {
+            value = this._dataXform(x)
+          } catch (e) {
+            f(e, null)
+            return
+          }
+          f(null, value)
+        })
+
+        return __doRead()
       })
 
-    __doFetch(this._initialEndpoint)
+    return __doRead()
   }
 
   /**
@@ -590,20 +647,7 @@ class Cursor {
    * @returns {Promise<T[]>}
    */
   take (n) {
-    let __doFetch = (url, accumulator) =>
-      _promiseGet(url, null).then((body) => {
-        let data = body.data.map(this._dataXform)
-        let nextPage = body.paging.next
-        let nextAccumulator = accumulator.concat(data)
-        let complete = nextAccumulator.length > n
-        if (!complete && nextPage) {
-          return __doFetch(nextPage, nextAccumulator)
-        } else {
-          return nextAccumulator.slice(0, n)
-        }
-      })
-
-    return __doFetch(this._initialEndpoint, [])
+    return this._collect(n)
   }
 
   /**
@@ -612,19 +656,146 @@ class Cursor {
    * @returns {Promise<T[]>} - promise for the array of elements from the cursor
    */
   all () {
-    let __doFetch = (url, accumulator) =>
-      _promiseGet(url, null).then((body) => {
-        let data = body.data.map(this._dataXform)
-        let nextPage = body.paging.next
-        let nextAccumulator = accumulator.concat(data)
-        if (nextPage) {
-          return __doFetch(nextPage, nextAccumulator)
-        } else {
-          return nextAccumulator
+    return this._collect(Infinity)
+  }
+
+  /**
+   * Returns an async iterator over the elements of the cursor.  A transform
+   * error, or a failed page fetch, rejects the pending `next()`.
+   *
+   * @returns {{next: function(): Promise<{value: T, done: boolean}>, return: function(): Promise}}
+   */
+  [_asyncIterator] () {
+    let pages = new _PageReader(this._initialEndpoint, this._readAhead)
+    let data = []
+    let index = 0
+
+    let next = () => {
+      if (index < data.length) {
+        return new Promise((resolve) => {
+          resolve({value: this._dataXform(data[index++]), done: false})
+        })
+      }
+
+      return pages.read().then((page) => {
+        if (page === null) {
+          return {value: undefined, done: true}
+        }
+        data = page
+        index = 0
+        return next()
+      })
+    }
+
+    return {
+      next,
+      return: (value) => {
+        pages.cancel()
+        data = []
+        return Promise.resolve({value, done: true})
+      },
+      [_asyncIterator] () {
+        return this
+      }
+    }
+  }
+
+  /**
+   * @private
+   */
+  _collect (n) {
+    let pages = new _PageReader(this._initialEndpoint, this._readAhead)
+    let result = []
+
+    let __doRead = () =>
+      pages.read().then((data) => {
+        if (data === null) {
+          return result
+        }
+
+        let count = Math.min(data.length, n - result.length)
+        for (let i = 0; i < count; i++) {
+          result.push(this._dataXform(data[i]))
+        }
+
+        if (result.length >= n) {
+          pages.cancel()
+          return result
         }
+        return __doRead()
       })
 
-    return __doFetch(this._initialEndpoint, [])
+    return __doRead().catch((e) => {
+      pages.cancel()
+      throw e
+    })
+  }
+}
+
+/**
+ * Fetches the pages of a paging endpoint in order, keeping up to `depth`
+ * pages requested or buffered ahead of the reader.  As the next page's URL
+ * comes from the current page's body, the fetches themselves are sequential;
+ * the read-ahead overlaps them with the reader's work.
+ *
+ * @private
+ */
+class _PageReader {
+  constructor (url, depth) {
+    this._nextUrl = url
+    this._depth = Math.max(1, depth)
+    this._fetching = false
+    this._pages = []
+
+    this._fill()
+  }
+
+  /**
+   * Returns a promise for the data of the next page, or null after the last.
+   */
+  read () {
+    if (this._pages.length === 0) {
+      return Promise.resolve(null)
+    }
+
+    let page = this._pages.shift()
+    this._fill()
+    return page
+  }
+
+  /**
+   * Stops fetching further pages.
+   */
+  cancel () {
+    this._nextUrl = null
+    this._pages = []
+  }
+
+  _fill () {
+    if (this._fetching || !this._nextUrl ||
+        this._pages.length >= this._depth) {
+      return
+    }
+
+    this._fetching = true
+    let page = _promiseGet(this._nextUrl, null).then(
+      (body) => {
+        this._fetching = false
+        if (this._nextUrl !== null) {
+          this._nextUrl = body.paging.next
+          this._fill()
+        }
+        return body.data
+      },
+      (err) => {
+        this._fetching = false
+        this._nextUrl = null
+        throw err
+      })
+    // Rejections are reported to the reader; don't let pages read ahead of
+    // a cancelled reader report them as unhandled
+    page.catch(() => null)
+    this._pages.push(page)
   }
 }
 
@@ -692,14 +863,14 @@ const _omiStateEntry = (baseUrl, messageType, naturalKey) =>
 /**
  * @private
  */
-const _omiStateCursor = (baseUrl, messageType) =>
+const _omiStateCursor = (baseUrl, messageType, readAhead) =>
   new Cursor(`${baseUrl}/state?address=${getTypePrefix(messageType.name)}`,
-             _omiStateXform(messageType))
+             _omiStateXform(messageType), readAhead)
 
 /**
  * @private
  */
-const _submitOmiTransaction = (baseUrl, privateKey, action, messageType, naturalKeyField, omiObj, additionalInputs = []) => {
+const _submitOmiTransaction = (baseUrl, privateKey, publicKey, action, messageType, naturalKeyField, omiObj, additionalInputs = []) => {
   let err = messageType.verify(omiObj)
   if (err) {
     return Promise.reject(new Error(err))
@@ -707,7 +878,8 @@ const _submitOmiTransaction = (baseUrl, privateKey, action, messageType, natural
 
   const encoder = new TransactionEncoder(privateKey, {
     familyName: 'OMI',
-    familyVersion: '1.0',
+    // 1.1 transactions keep the owner index, and declare its shard
+    familyVersion: '1.1',
     payloadEncoding: 'application/protobuf',
     payloadEncoder: (payload) => OMITransactionPayload.encode(payload).finish()
   })
@@ -716,6 +888,8 @@ const _submitOmiTransaction = (baseUrl, privateKey, action, messageType, natural
   let address = getObjectAddress(messageType.name,
                                  omiObj[naturalKeyField])
 
+  let indexAddress = getOwnerIndexAddress(publicKey, address)
+
   let data = messageType.encode(messageType.fromObject(omiObj)).finish()
 
   let payload = OMITransactionPayload.fromObject({
@@ -724,8 +898,8 @@ const _submitOmiTransaction = (baseUrl, privateKey, action, messageType, natural
   })
 
   let batch = batcher.create([encoder.create(payload, {
-    inputs: [address].concat(additionalInputs),
-    outputs: [address]
+    inputs: [address, indexAddress].concat(additionalInputs),
+    outputs: [address, indexAddress]
   })])
 
   let batchId = batch.headerSignature
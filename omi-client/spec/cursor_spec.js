@@ -24,6 +24,37 @@ const mock = require('superagent-mocker')(request)
 
 const {Cursor} = require('../lib')
 
+const asyncIterator = Symbol.asyncIterator || Symbol.for('Symbol.asyncIterator')
+
+const mockPages = (requested = []) => {
+  let data = {
+    0: [ 'a', 'b', 'c' ],
+    3: [ 'd', 'e', 'f' ],
+    6: [ 'g' ]
+  }
+  mock.get('/paging_endpoint/:query', (req) => {
+    // We're hacking the query, as the real URL isn't submtted
+    let query = querystring.parse(req.params.query)
+    let startIndex = parseInt(query.start)
+    let next = startIndex < 6
+      ? '/paging_endpoint/?&start=' + (startIndex + data[startIndex].length)
+      : null
+    requested.push(startIndex)
+
+    return {
+      body: {
+        data: data[startIndex],
+        paging: {
+          start_index: startIndex,
+          total_count: 7,
+          next: next
+        }
+      }
+    }
+  })
+  return requested
+}
+
 describe('Cursor', () => {
   beforeEach(() => {
     mock.clearRoutes()
@@ -361,4 +392,77 @@ describe('Cursor', () => {
         })
     })
   })
+
+  describe('read-ahead', () => {
+    it('should request the next page before the current one is read', () => {
+      let events = mockPages()
+
+      let cursor = new Cursor('/paging_endpoint/?&start=0', (x) => {
+        events.push(x)
+        return x
+      })
+
+      return cursor.all().then(strs => {
+        assert.deepEqual(['a', 'b', 'c', 'd', 'e', 'f', 'g'], strs)
+        assert(events.indexOf(3) < events.indexOf('a'))
+        assert(events.indexOf(6) < events.indexOf('d'))
+      })
+    })
+
+    it('should stop fetching once take has enough', () => {
+      let requested = mockPages()
+
+      let cursor = new Cursor('/paging_endpoint/?&start=0', (x) => x, 1)
+      return cursor.take(2).then(values => {
+        assert.deepEqual(['a', 'b'], values)
+        assert.deepEqual([0, 3], requested)
+      })
+    })
+  })
+
+  describe('async iteration', () => {
+    it('should iterate accross pages', () => {
+      mockPages()
+
+      let iterator = new Cursor('/paging_endpoint/?&start=0')[asyncIterator]()
+      let accumulator = []
+      let __doNext = () => iterator.next().then(({value, done}) => {
+        if (done) {
+          return accumulator
+        }
+        accumulator.push(value)
+        return __doNext()
+      })
+
+      return __doNext().then(strs => {
+        assert.deepEqual(['a', 'b', 'c', 'd', 'e', 'f', 'g'], strs)
+      })
+    })
+
+    it('should reject next on a bad xform', () => {
+      mockPages()
+
+      let iterator = new Cursor('/paging_endpoint/?&start=0',
+                                () => { throw new Error('Bad xform') })[asyncIterator]()
+      return iterator.next().catch(e => e)
+        .then(err => {
+          assert.equal('Bad xform', err.message)
+        })
+    })
+
+    it('should finish after return', () => {
+      mockPages()
+
+      let iterator = new Cursor('/paging_endpoint/?&start=0')[asyncIterator]()
+      return iterator.next()
+        .then(({value}) => {
+          assert.equal('a', value)
+          return iterator.return()
+        })
+        .then(() => iterator.next())
+        .then(({done}) => {
+          assert.equal(true, done)
+        })
+    })
+  })
 })
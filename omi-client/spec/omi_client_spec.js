@@ -65,10 +65,15 @@ describe('OmiClient', () => {
 
         assert.equal(batchId, statusChecker.batchId)
 
-        assert.deepEqual([_workAddress('TestSong')], transactionHeader.outputs)
+        let indexAddress = _indexAddress(transactionHeader,
+                                         _workAddress('TestSong'))
+
+        assert.deepEqual([_workAddress('TestSong'), indexAddress],
+                         transactionHeader.outputs)
         assert.deepEqual(
           [
             _workAddress('TestSong'),
+            indexAddress,
             _individualAddress('TestSinger'),
             _orgAddress('TestPublisher')
           ],
@@ -122,12 +127,16 @@ describe('OmiClient', () => {
 
         assert.equal(batchId, statusChecker.batchId)
 
-        assert.deepEqual([_recordingAddress('TestRecording')],
+        let indexAddress = _indexAddress(transactionHeader,
+                                         _recordingAddress('TestRecording'))
+
+        assert.deepEqual([_recordingAddress('TestRecording'), indexAddress],
                          transactionHeader.outputs)
 
         assert.deepEqual(
           [
             _recordingAddress('TestRecording'),
+            indexAddress,
             _orgAddress('TestLabel'),
             _individualAddress('TestSinger'),
             _workAddress('TestWork'),
@@ -174,3 +183,5 @@ let _workAddress = (title) => addressing.getObjectAddress('Work', title)
 let _recordingAddress = (title) => addressing.getObjectAddress('Recording', title)
 let _individualAddress = (name) => addressing.getObjectAddress('IndividualIdentity', name)
 let _orgAddress = (name) => addressing.getObjectAddress('OrganizationalIdentity', name)
+let _indexAddress = (transactionHeader, address) =>
+  addressing.getOwnerIndexAddress(transactionHeader.signerPubkey, address)
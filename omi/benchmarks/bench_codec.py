@@ -0,0 +1,171 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+'''
+Parse and serialize throughput of each message the transaction handler
+decodes or encodes, for every protobuf backend that can be loaded here.
+
+The backend is fixed when google.protobuf is first imported, so each one
+is measured in a child process started with
+PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION set. A backend whose extension
+isn't installed is reported as unavailable rather than measured as the
+pure-Python fallback.
+
+    python3 benchmarks/bench_codec.py [--count N] [--repeat N]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))))
+
+
+BACKENDS = ('python', 'upb', 'cpp')
+
+
+def samples(count):
+    '''
+    return {message name: (message type, [serialized messages])} for
+    the messages in bench_handler's workload
+    '''
+    from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+    from sawtooth_omi.handler import get_object_type
+    from sawtooth_omi.handler import get_tag
+    from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+
+    from bench_handler import workload
+
+    found = {
+        'TransactionHeader': (TransactionHeader, []),
+        'OMITransactionPayload': (OMITransactionPayload, []),
+    }
+    for action, request in workload(count):
+        found['TransactionHeader'][1].append(request.header)
+        found['OMITransactionPayload'][1].append(request.payload)
+
+        payload = OMITransactionPayload()
+        payload.ParseFromString(request.payload)
+        obj_type = get_object_type(get_tag(action))
+        found.setdefault(
+            obj_type.__name__, (obj_type, []))[1].append(payload.data)
+
+    return found
+
+
+def measure(count, repeat):
+    '''
+    return the detected backend and, per message name, the best
+    messages per second for parse and serialize over repeat runs
+    '''
+    from sawtooth_omi import codec
+
+    results = {}
+    for name, (message_type, data) in samples(count).items():
+        messages = [codec.parse(message_type, item) for item in data]
+
+        parse = serialize = 0.0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for item in data:
+                codec.parse(message_type, item)
+            parse = max(parse, len(data) / (time.perf_counter() - start))
+
+            start = time.perf_counter()
+            for message in messages:
+                codec.serialize(message)
+            serialize = max(
+                serialize, len(data) / (time.perf_counter() - start))
+
+        results[name] = {
+            'count': len(data),
+            'bytes': sum(len(item) for item in data) / len(data),
+            'parse': parse,
+            'serialize': serialize,
+        }
+
+    return codec.get_codec().backend, results
+
+
+def run_backend(backend, count, repeat):
+    '''
+    return the results measured in a child process using backend, or
+    None if that backend can't be loaded
+    '''
+    env = dict(os.environ, PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION=backend)
+    child = subprocess.run(
+        [sys.executable, '-W', 'ignore', os.path.realpath(__file__),
+         '--child', '--count', str(count), '--repeat', str(repeat)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        universal_newlines=True)
+    if child.returncode != 0:
+        return None
+
+    detected, results = json.loads(child.stdout)
+    if detected != backend:
+        return None
+    return results
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument(
+        '--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(args)
+
+    if args.child:
+        json.dump(measure(args.count, args.repeat), sys.stdout)
+        return
+
+    measured = {}
+    for backend in BACKENDS:
+        results = run_backend(backend, args.count, args.repeat)
+        if results is None:
+            print('{}: unavailable'.format(backend))
+        else:
+            measured[backend] = results
+    if not measured:
+        return
+
+    print()
+    print('{:24s} {:>6s} {:8s} {:>12s} {:>12s} {:>8s} {:>8s}'.format(
+        'message', 'bytes', 'backend', 'parse/s', 'serialize/s',
+        'parse x', 'ser x'))
+    baseline = measured.get('python')
+    names = next(iter(measured.values()))
+    for name in names:
+        for backend, results in measured.items():
+            result = results[name]
+            speedup = ('', '')
+            if baseline is not None:
+                speedup = (
+                    '{:.1f}'.format(result['parse'] / baseline[name]['parse']),
+                    '{:.1f}'.format(
+                        result['serialize'] / baseline[name]['serialize']))
+            print(
+                '{:24s} {:6.0f} {:8s} {:12.0f} {:12.0f} {:>8s} {:>8s}'.format(
+                    name, result['bytes'], backend, result['parse'],
+                    result['serialize'], *speedup))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+'''
+Time and memory cost of OMITransactionHandler.apply per transaction,
+against in-memory state. For each action type it reports the mean wall
+time, the transient memory allocated during an apply (the tracemalloc
+peak above the starting point) and the memory left behind.
+
+    python3 benchmarks/bench_handler.py [--count N]
+'''
+
+import argparse
+import collections
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))))
+
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.work_pb2 import Work
+from sawtooth_omi.protobuf.recording_pb2 import Recording
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+
+
+Request = collections.namedtuple('Request', ['header', 'payload', 'signature'])
+
+SIGNER = '02' + '5e' * 32
+SPLITS = 4
+
+
+def _request(index, action, obj):
+    return Request(
+        header=TransactionHeader(signer_pubkey=SIGNER).SerializeToString(),
+        payload=OMITransactionPayload(
+            action=action, data=obj.SerializeToString()).SerializeToString(),
+        signature='{:0128x}'.format(index))
+
+
+def _even(count):
+    splits = [100 // count] * count
+    splits[0] += 100 - sum(splits)
+    return splits
+
+
+def workload(count):
+    '''
+    yield (action, request) pairs: identities first, then works that
+    reference them, then recordings that reference the works
+    '''
+    index = 0
+    for i in range(SPLITS):
+        index += 1
+        yield 'SetIndividualIdentity', _request(
+            index, 'SetIndividualIdentity',
+            IndividualIdentity(name='songwriter {}'.format(i), pubkey=SIGNER))
+        index += 1
+        yield 'SetOrganizationalIdentity', _request(
+            index, 'SetOrganizationalIdentity',
+            OrganizationalIdentity(
+                name='publisher {}'.format(i), pubkey=SIGNER))
+
+    for i in range(count):
+        index += 1
+        yield 'SetWork', _request(index, 'SetWork', Work(
+            title='work {}'.format(i),
+            songwriter_publisher_splits=[
+                Work.SongwriterPublisherSplit(
+                    split=split,
+                    songwriter_publisher=Work.SongwriterPublisher(
+                        songwriter_name='songwriter {}'.format(j),
+                        publisher_name='publisher {}'.format(j)))
+                for j, split in enumerate(_even(SPLITS))
+            ],
+            registering_pubkey=SIGNER))
+
+    for i in range(count):
+        index += 1
+        yield 'SetRecording', _request(index, 'SetRecording', Recording(
+            title='recording {}'.format(i),
+            contributor_splits=[
+                Recording.ContributorSplit(
+                    split=split, contributor_name='songwriter {}'.format(j))
+                for j, split in enumerate(_even(SPLITS))
+            ],
+            derived_work_splits=[
+                Recording.DerivedWorkSplit(
+                    split=100, work_name='work {}'.format(i))
+            ],
+            overall_split=Recording.RecordingOverallSplit(
+                derived_work_portion=50, contributor_portion=50),
+            registering_pubkey=SIGNER))
+
+
+def run(count):
+    handler = OMITransactionHandler()
+    state = LocalState()
+    requests = list(workload(count))
+
+    results = collections.defaultdict(lambda: [0, 0.0, 0, 0])
+
+    tracemalloc.start()
+    for action, request in requests:
+        start_size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        handler.apply(request, state)
+        elapsed = time.perf_counter() - start
+
+        end_size, peak = tracemalloc.get_traced_memory()
+
+        result = results[action]
+        result[0] += 1
+        result[1] += elapsed
+        result[2] += peak - start_size
+        result[3] += end_size - start_size
+    tracemalloc.stop()
+
+    return results
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000)
+    args = parser.parse_args(args)
+
+    print('{:28s} {:>7s} {:>10s} {:>14s} {:>14s}'.format(
+        'action', 'txns', 'us/txn', 'transient B', 'retained B'))
+    for action, (n, elapsed, transient, retained) in run(args.count).items():
+        print('{:28s} {:7d} {:10.1f} {:14.0f} {:14.0f}'.format(
+            action, n, elapsed / n * 1e6, transient / n, retained / n))
+
+
+if __name__ == '__main__':
+    main()
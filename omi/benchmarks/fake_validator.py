@@ -0,0 +1,334 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+'''
+A fake validator for measuring whole omi-tp processes.
+
+It binds a ZMQ ROUTER socket and speaks the validator side of the
+transaction processor protocol: it answers TP_REGISTER_REQUESTs, sends
+TP_PROCESS_REQUESTs for the bench_handler workload, and serves
+TP_STATE_GET/SET_REQUESTs from memory, after an injectable delay. A
+transaction's writes are kept only if its response is OK.
+
+Transactions are dispatched in phases (identities, works, recordings),
+so that references are always committed before they're read; within a
+phase they go out at a fixed rate or as fast as --in-flight allows,
+round-robin across every registered processor. Per-transaction timings
+from dispatch to response, and state round trips, are reported per
+action.
+
+    python3 benchmarks/fake_validator.py --processors 2 --spawn 2
+'''
+
+import argparse
+import collections
+import heapq
+import itertools
+import os
+import subprocess
+import sys
+import time
+
+import zmq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))))
+
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessRequest
+from sawtooth_sdk.protobuf.processor_pb2 import TpProcessResponse
+from sawtooth_sdk.protobuf.processor_pb2 import TpRegisterRequest
+from sawtooth_sdk.protobuf.processor_pb2 import TpRegisterResponse
+from sawtooth_sdk.protobuf.state_context_pb2 import Entry
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateGetRequest
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateGetResponse
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateSetRequest
+from sawtooth_sdk.protobuf.state_context_pb2 import TpStateSetResponse
+from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+from sawtooth_omi.handler import FAMILY_NAME
+from sawtooth_omi.loadgen import LatencyHistogram
+
+from bench_handler import workload
+
+
+BIN_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.realpath(__file__)))),
+    'bin')
+
+
+class _Context:
+    __slots__ = ('action', 'processor', 'writes', 'sent', 'round_trips')
+
+    def __init__(self, action, processor, sent):
+        self.action = action
+        self.processor = processor
+        self.writes = {}
+        self.sent = sent
+        self.round_trips = 0
+
+
+class _ActionStats:
+    __slots__ = ('latencies', 'ok', 'invalid', 'errors', 'round_trips')
+
+    def __init__(self):
+        self.latencies = LatencyHistogram()
+        self.ok = 0
+        self.invalid = 0
+        self.errors = 0
+        self.round_trips = 0
+
+
+class FakeValidator:
+    def __init__(self, url, state_latency=0.0, rate=None, in_flight=100):
+        '''
+        state_latency -- seconds to hold each state get/set response
+        rate -- transactions per second to dispatch, or None for as fast
+            as in_flight allows
+        in_flight -- the most transactions outstanding at once
+        '''
+        self._state_latency = state_latency
+        self._rate = rate
+        self._in_flight = in_flight
+
+        self._context = zmq.Context()
+        self._socket = self._context.socket(zmq.ROUTER)
+        self._socket.bind(url)
+
+        self._processors = []
+        self._state = {}
+        self._contexts = {}
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._round_robin = itertools.count()
+        self.stats = collections.defaultdict(_ActionStats)
+
+    def wait_for_processors(self, count, timeout=60):
+        deadline = time.monotonic() + timeout
+        while len(self._processors) < count:
+            if time.monotonic() > deadline:
+                raise RuntimeError('Only {} of {} processors registered'
+                                   .format(len(self._processors), count))
+            self._poll(0.1)
+
+    def run(self, phases):
+        '''
+        dispatch each phase of (action, request) pairs, waiting for one
+        to finish before starting the next; return the elapsed seconds
+        '''
+        start = time.monotonic()
+        for phase in phases:
+            self._run_phase(phase)
+        return time.monotonic() - start
+
+    def close(self):
+        self._socket.close(linger=0)
+        self._context.term()
+
+    def _run_phase(self, phase):
+        pending = collections.deque(phase)
+        next_send = time.monotonic()
+
+        while pending or self._contexts:
+            now = time.monotonic()
+            while (pending and len(self._contexts) < self._in_flight
+                   and now >= next_send):
+                self._dispatch(*pending.popleft(), now=now)
+                if self._rate is not None:
+                    next_send += 1 / self._rate
+
+            timeout = 0.1
+            if pending and self._rate is not None:
+                timeout = max(next_send - time.monotonic(), 0)
+            self._poll(timeout)
+
+    def _dispatch(self, action, request, now):
+        processor = self._processors[
+            next(self._round_robin) % len(self._processors)]
+        context_id = '{:016x}'.format(next(self._sequence))
+        self._contexts[context_id] = _Context(action, processor, now)
+
+        self._send(processor, Message.TP_PROCESS_REQUEST, context_id,
+                   TpProcessRequest(
+                       header=request.header,
+                       payload=request.payload,
+                       signature=request.signature,
+                       context_id=context_id))
+
+    def _poll(self, timeout):
+        if self._delayed:
+            timeout = min(
+                timeout, max(self._delayed[0][0] - time.monotonic(), 0))
+
+        if self._socket.poll(timeout * 1000):
+            while True:
+                try:
+                    identity, data = self._socket.recv_multipart(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                message = Message()
+                message.ParseFromString(data)
+                self._handle(identity, message)
+
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, frames = heapq.heappop(self._delayed)
+            self._socket.send_multipart(frames)
+
+    def _handle(self, identity, message):
+        if message.message_type == Message.TP_REGISTER_REQUEST:
+            request = TpRegisterRequest()
+            request.ParseFromString(message.content)
+
+            status = TpRegisterResponse.OK
+            if request.family != FAMILY_NAME:
+                status = TpRegisterResponse.ERROR
+            elif identity not in self._processors:
+                self._processors.append(identity)
+
+            self._reply(identity, message, Message.TP_REGISTER_RESPONSE,
+                        TpRegisterResponse(status=status))
+
+        elif message.message_type == Message.TP_STATE_GET_REQUEST:
+            request = TpStateGetRequest()
+            request.ParseFromString(message.content)
+            context = self._contexts[request.context_id]
+            context.round_trips += 1
+
+            entries = []
+            for address in request.addresses:
+                data = context.writes.get(address, self._state.get(address))
+                if data is not None:
+                    entries.append(Entry(address=address, data=data))
+
+            self._reply(identity, message, Message.TP_STATE_GET_RESPONSE,
+                        TpStateGetResponse(
+                            entries=entries, status=TpStateGetResponse.OK),
+                        self._state_latency)
+
+        elif message.message_type == Message.TP_STATE_SET_REQUEST:
+            request = TpStateSetRequest()
+            request.ParseFromString(message.content)
+            context = self._contexts[request.context_id]
+            context.round_trips += 1
+
+            for entry in request.entries:
+                context.writes[entry.address] = entry.data
+
+            self._reply(identity, message, Message.TP_STATE_SET_RESPONSE,
+                        TpStateSetResponse(
+                            addresses=[e.address for e in request.entries],
+                            status=TpStateSetResponse.OK),
+                        self._state_latency)
+
+        elif message.message_type == Message.TP_PROCESS_RESPONSE:
+            response = TpProcessResponse()
+            response.ParseFromString(message.content)
+            self._finish(message.correlation_id, response)
+
+    def _finish(self, context_id, response):
+        context = self._contexts.pop(context_id)
+        stats = self.stats[context.action]
+        stats.latencies.record((time.monotonic() - context.sent) * 1000000)
+        stats.round_trips += context.round_trips
+
+        if response.status == TpProcessResponse.OK:
+            stats.ok += 1
+            self._state.update(context.writes)
+        elif response.status == TpProcessResponse.INVALID_TRANSACTION:
+            stats.invalid += 1
+        else:
+            stats.errors += 1
+
+    def _reply(self, identity, request, message_type, content, delay=0.0):
+        self._send(identity, message_type, request.correlation_id, content,
+                   delay)
+
+    def _send(self, identity, message_type, correlation_id, content,
+              delay=0.0):
+        frames = [identity, Message(
+            message_type=message_type,
+            correlation_id=correlation_id,
+            content=content.SerializeToString()).SerializeToString()]
+
+        if delay:
+            heapq.heappush(
+                self._delayed,
+                (time.monotonic() + delay, next(self._sequence), frames))
+        else:
+            self._socket.send_multipart(frames)
+
+
+def _phases(count):
+    phases = collections.OrderedDict()
+    for action, request in workload(count):
+        phase = 'identities' if 'Identity' in action else action
+        phases.setdefault(phase, []).append((action, request))
+    return list(phases.values())
+
+
+def main(args=sys.argv[1:]):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='tcp://127.0.0.1:4004')
+    parser.add_argument('--count', type=int, default=2000,
+                        help='works, and recordings, to process')
+    parser.add_argument('--processors', type=int, default=1,
+                        help='processors to wait for before dispatching')
+    parser.add_argument('--spawn', type=int, default=0,
+                        help='start this many omi-tp processes')
+    parser.add_argument('--rate', type=float,
+                        help='transactions per second; unlimited if unset')
+    parser.add_argument('--in-flight', type=int, default=100,
+                        help='the most transactions outstanding at once')
+    parser.add_argument('--state-latency', type=float, default=0.0,
+                        help='seconds to delay each state response')
+    args = parser.parse_args(args)
+
+    validator = FakeValidator(
+        args.url, args.state_latency, args.rate, args.in_flight)
+
+    spawned = [
+        subprocess.Popen([
+            sys.executable, os.path.join(BIN_DIR, 'omi-tp'), args.url])
+        for _ in range(args.spawn)
+    ]
+
+    try:
+        validator.wait_for_processors(max(args.processors, args.spawn))
+        elapsed = validator.run(_phases(args.count))
+    finally:
+        for process in spawned:
+            process.terminate()
+        validator.close()
+
+    print('{:28s} {:>6s} {:>6s} {:>6s} {:>8s} {:>8s} {:>8s} {:>8s}'.format(
+        'action', 'ok', 'inval', 'error', 'p50 ms', 'p99 ms', 'max ms',
+        'trips'))
+    total = 0
+    for action, stats in validator.stats.items():
+        count = stats.latencies.count
+        total += count
+        print('{:28s} {:6d} {:6d} {:6d} {:8.2f} {:8.2f} {:8.2f} {:8.1f}'
+              .format(action, stats.ok, stats.invalid, stats.errors,
+                      stats.latencies.percentile(50) / 1000,
+                      stats.latencies.percentile(99) / 1000,
+                      stats.latencies.max / 1000,
+                      stats.round_trips / count))
+    print('{} transactions in {:.2f}s, {:.0f} txn/s'.format(
+        total, elapsed, total / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Bulk submission that sizes itself to what the REST API and validator
+can take.
+
+An AimdController steers two knobs with additive-increase,
+multiplicative-decrease (AIMD) rules, as TCP does its congestion
+window:
+
+- the window, the number of BatchLists in flight, grows by one after a
+  window's worth of requests in a row are accepted, and is cut by the
+  decrease factor when the REST API pushes back (429 or 503, e.g. a
+  full batch queue) or a request times out
+- the batch size, the number of batches per BatchList, grows by the
+  increase step after a window's worth of requests in a row commit
+  within the target latency, and is cut when one takes longer
+
+A request only cuts a knob if it was sent after that knob was last cut,
+so the requests already in flight when the validator falls behind
+count as one signal rather than many.
+
+An AdaptiveSubmitter posts batches in order, grouped and overlapped as
+the controller allows, waits for each BatchList to be final and
+retries the ones pushed back. Later batches may reference objects that
+earlier ones create, so BatchLists are posted strictly in stream order:
+one is only posted once the one before it has been accepted, and one
+pushed back is retried before anything after it is posted. Only the
+waits for commits overlap. Batches already signed into a stream
+can't be regrouped into other batches, so the batch size counts
+batches per BatchList; for streams of one-transaction batches, as
+omi_message_factory makes, that is transactions per request.
+
+Every change of either knob is logged and, with a metrics file, written
+to it as a JSON line along with the controller's counters.
+'''
+
+import json
+import logging
+import socket
+import threading
+import time
+import urllib.error
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+PENDING = 'PENDING'
+UNKNOWN = 'UNKNOWN'
+
+# HTTP statuses the REST API pushes back with
+BACK_PRESSURE = (429, 503)
+
+# Weight of the newest sample in the latency and rejection averages
+_SMOOTHING = 0.2
+
+
+class AimdController:
+    def __init__(self, target_latency=5.0, min_batch=1, max_batch=1000,
+                 max_window=32, increase=1, decrease=0.5, metrics=None,
+                 clock=time.monotonic):
+        '''
+        target_latency -- seconds from posting a BatchList to its last
+            batch being final
+        increase -- batches added to the batch size per round
+        decrease -- factor both knobs are cut by
+        metrics -- a text file to write decisions to as JSON lines
+        '''
+        self.target_latency = target_latency
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.max_window = max_window
+        self.increase = increase
+        self.decrease = decrease
+        self._metrics = metrics
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.batch_size = min_batch
+        self.window = 1
+
+        # requests in a row that were accepted, or committed in time
+        self._accepted_run = 0
+        self._fast_run = 0
+        self._window_cut_at = float('-inf')
+        self._batch_cut_at = float('-inf')
+
+        self.requests = 0
+        self.completed = 0
+        self.rejected = 0
+        self.latency = None
+        self.rejection_rate = 0.0
+
+    def sent(self):
+        '''
+        return a ticket for a request about to be sent, to pass back
+        with its outcome
+        '''
+        return self._clock()
+
+    def on_completed(self, ticket, batches):
+        '''
+        a request of this many batches was accepted and every batch in
+        it is final
+        '''
+        latency = self._clock() - ticket
+        with self._lock:
+            self._count(rejected=False)
+            self.completed += batches
+            self.latency = latency if self.latency is None else \
+                self.latency + _SMOOTHING * (latency - self.latency)
+
+            window = self.window
+            self._accepted_run += 1
+            if self._accepted_run >= window:
+                self._accepted_run = 0
+                if self.window < self.max_window:
+                    self.window += 1
+                    self._decided('accepted', latency)
+
+            if latency > self.target_latency:
+                self._fast_run = 0
+                if ticket > self._batch_cut_at:
+                    self._batch_cut_at = self._clock()
+                    self.batch_size = max(
+                        self.min_batch, int(self.batch_size * self.decrease))
+                    self._decided('slow', latency)
+                return
+
+            self._fast_run += 1
+            if self._fast_run >= window:
+                self._fast_run = 0
+                if self.batch_size < self.max_batch:
+                    self.batch_size = min(
+                        self.max_batch, self.batch_size + self.increase)
+                    self._decided('fast', latency)
+
+    def on_rejected(self, ticket):
+        '''
+        a request was pushed back or timed out
+        '''
+        with self._lock:
+            self._count(rejected=True)
+            self.rejected += 1
+            self._accepted_run = 0
+            if ticket > self._window_cut_at:
+                self._window_cut_at = self._clock()
+                self.window = max(1, int(self.window * self.decrease))
+                self._decided('rejected', None)
+
+    def snapshot(self):
+        return {
+            'batch_size': self.batch_size,
+            'window': self.window,
+            'latency': self.latency,
+            'rejection_rate': self.rejection_rate,
+            'requests': self.requests,
+            'completed': self.completed,
+            'rejected': self.rejected,
+        }
+
+    def _count(self, rejected):
+        self.requests += 1
+        self.rejection_rate += _SMOOTHING * (
+            float(rejected) - self.rejection_rate)
+
+    def _decided(self, reason, latency):
+        LOGGER.debug(
+            'Batch size %s, window %s (%s)',
+            self.batch_size, self.window, reason)
+        if self._metrics is not None:
+            record = self.snapshot()
+            record.update(time=time.time(), reason=reason,
+                          request_latency=latency)
+            self._metrics.write(json.dumps(record, sort_keys=True) + '\n')
+            self._metrics.flush()
+
+
+class AdaptiveSubmitter:
+    def __init__(self, client, controller, wait=30, poll_interval=0.5):
+        '''
+        client -- submits BatchLists and queries batch statuses, like
+            client.OMIRestClient
+        wait -- seconds the REST API may wait for commits per request
+        '''
+        self._client = client
+        self._controller = controller
+        self._wait = wait
+        self._poll_interval = poll_interval
+
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._error = None
+        # sequence numbers of the next group to send, and to be posted
+        self._sent = 0
+        self._posting = 0
+
+    def submit(self, batches, on_status=None):
+        '''
+        submit Batches and wait for every one to be final; call
+        on_status(batch ID, status) for each, or return {batch ID:
+        status} without it
+        '''
+        statuses = {}
+        if on_status is None:
+            on_status = statuses.__setitem__
+
+        batches = iter(batches)
+        exhausted = False
+        condition = self._condition
+        controller = self._controller
+
+        with ThreadPoolExecutor(controller.max_window) as executor:
+            while True:
+                with condition:
+                    while self._error is None and (
+                            self._in_flight >= controller.window or
+                            (exhausted and self._in_flight)):
+                        condition.wait()
+                    if self._error is not None:
+                        raise self._error
+
+                    group = []
+                    if not exhausted:
+                        for batch in batches:
+                            group.append(batch)
+                            if len(group) >= controller.batch_size:
+                                break
+                        else:
+                            exhausted = True
+
+                    if not group:
+                        if exhausted and not self._in_flight:
+                            break
+                        continue
+                    self._in_flight += 1
+                    sequence = self._sent
+                    self._sent += 1
+
+                executor.submit(self._send, sequence, group, on_status)
+
+        return statuses
+
+    def _send(self, sequence, group, on_status):
+        controller = self._controller
+        try:
+            with self._condition:
+                while self._error is None and self._posting != sequence:
+                    self._condition.wait()
+                if self._error is not None:
+                    return
+
+            ticket, statuses = self._post(group)
+
+            with self._condition:
+                self._posting += 1
+                self._condition.notify_all()
+
+            pending = [
+                batch_id for batch_id, status in statuses.items()
+                if status == PENDING]
+            while pending:
+                time.sleep(self._poll_interval)
+                statuses.update(
+                    self._client.batch_statuses(pending, self._wait))
+                pending = [
+                    batch_id for batch_id in pending
+                    if statuses.get(batch_id) == PENDING]
+
+            controller.on_completed(ticket, len(group))
+            for batch in group:
+                on_status(
+                    batch.header_signature,
+                    statuses.get(batch.header_signature, UNKNOWN))
+        except Exception as err:  # pylint: disable=broad-except
+            with self._condition:
+                self._error = err
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _post(self, group):
+        '''
+        post a group until it is accepted, without waiting for commits;
+        return the controller's ticket and the statuses at posting
+        '''
+        controller = self._controller
+        batch_list = BatchList(batches=group)
+        while True:
+            ticket = controller.sent()
+            try:
+                return ticket, self._client.submit(batch_list)
+            except (urllib.error.URLError, socket.timeout) as err:
+                if getattr(err, 'code', None) not in BACK_PRESSURE and \
+                        not _is_timeout(err):
+                    raise
+                LOGGER.debug('Pushed back: %s', err)
+                controller.on_rejected(ticket)
+                time.sleep(self._poll_interval)
+
+
+def _is_timeout(err):
+    if isinstance(err, socket.timeout):
+        return True
+    return isinstance(getattr(err, 'reason', None), socket.timeout)
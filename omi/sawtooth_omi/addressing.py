@@ -0,0 +1,75 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+The addresses an OMI transaction has to declare, exactly as apply reads
+and writes them.
+
+The validator schedules transactions whose declared addresses don't
+overlap in parallel, so every address declared but never touched is a
+false conflict. A transaction that sets an object:
+
+- reads the object's address, each object it references once and, for
+  version 1.1, its owner's index shard
+- writes the object's address and, for version 1.1, the index shard
+
+When an object changes owner, a version 1.1 transaction also reads and
+writes the previous owner's shard, to take the object out of it. Only
+the caller knows the object's current state, so it passes the previous
+owner in.
+
+A recording's label_name isn't checked by apply, so it isn't declared.
+'''
+
+from sawtooth_omi.handler import INDEXED_VERSION
+from sawtooth_omi.handler import get_owner
+from sawtooth_omi.handler import get_references
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import make_owner_index_address
+
+
+def plan_addresses(obj, tag, signer='', version=INDEXED_VERSION,
+                   previous_owner=''):
+    '''
+    return (inputs, outputs) for a transaction of a family version
+    setting obj, each without repeats and in the order apply first
+    touches them; signer stands in for the owner of an object that
+    names none, and previous_owner is the owner of the object in state,
+    if any
+    '''
+    address = make_omi_address(get_unique_key(obj, tag), tag)
+
+    inputs = [address]
+    seen = {address}
+    for name, reference_tag in get_references(obj, tag):
+        reference = make_omi_address(name, reference_tag)
+        if reference not in seen:
+            seen.add(reference)
+            inputs.append(reference)
+
+    outputs = [address]
+    if version == INDEXED_VERSION:
+        owner = get_owner(obj, tag) or signer
+        owners = [owner]
+        if previous_owner and previous_owner != owner:
+            owners.insert(0, previous_owner)
+
+        for index_owner in owners:
+            index_address = make_owner_index_address(index_owner, address)
+            inputs.append(index_address)
+            outputs.append(index_address)
+
+    return inputs, outputs
@@ -0,0 +1,261 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Catalog-wide audit of the OMI invariants in an export.
+
+Every object is checked against the rules omi-tp applies to a single
+transaction in _check_split_sums and _check_references, to catch state
+written before a rule existed or changed. Derived recording splits are
+checked too, when nonempty, although omi-tp has never enforced them.
+
+Objects are read once into flat arrays: split values with the index of
+the object that owns them, and references as 64-bit keys taken from
+their addresses (the type infix and the first 56 bits of the name
+hash), with the index of the object that refers to them. Split sums
+are then segmented reductions over the owner indexes, and references
+are resolved with one membership test against the sorted keys of every
+object in the export.
+
+The audit requires numpy, which omi-tp itself doesn't.
+'''
+
+import argparse
+import array
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sawtooth_omi.export import decode_entries
+from sawtooth_omi.export import read_export
+from sawtooth_omi.handler import get_references
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+
+
+TAGS = (INDIVIDUAL, ORGANIZATION, WORK, RECORDING)
+
+TYPE_NAMES = {
+    INDIVIDUAL: 'individual',
+    ORGANIZATION: 'organization',
+    WORK: 'work',
+    RECORDING: 'recording',
+}
+
+# (description, owning tag, repeated field, whether an empty list passes)
+SPLITS = (
+    ('Songwriter-publisher split', WORK, 'songwriter_publisher_splits',
+     False),
+    ('Contributor split', RECORDING, 'contributor_splits', False),
+    ('Derived work split', RECORDING, 'derived_work_splits', False),
+    ('Derived recording split', RECORDING, 'derived_recording_splits',
+     True),
+)
+
+# tag -> (index into SPLITS, repeated field) for the splits it owns
+_SPLIT_FIELDS = {
+    tag: [(kind, split[2]) for kind, split in enumerate(SPLITS)
+          if split[1] == tag]
+    for tag in (WORK, RECORDING)
+}
+
+
+def _address_key(address):
+    # the two infix characters and the next fourteen of the name hash
+    return int(address[6:22], 16)
+
+
+class Violation:
+    __slots__ = ('tag', 'name', 'message')
+
+    def __init__(self, tag, name, message):
+        self.tag = tag
+        self.name = name
+        self.message = message
+
+    def __str__(self):
+        return '{} "{}": {}'.format(
+            TYPE_NAMES[self.tag], self.name, self.message)
+
+    def __repr__(self):
+        return 'Violation({!r}, {!r}, {!r})'.format(
+            self.tag, self.name, self.message)
+
+
+class CatalogArrays:
+    '''
+    The objects of an export, flattened for auditing. Objects are
+    numbered in the order they're added.
+    '''
+
+    def __init__(self):
+        self.names = []
+        self.tags = array.array('b')
+        self.keys = array.array('Q')
+
+        # per split kind: values, and the owning object of each
+        self.split_values = [array.array('q') for _ in SPLITS]
+        self.split_owners = [array.array('q') for _ in SPLITS]
+
+        # per recording: its index and overall portions
+        self.overall_owners = array.array('q')
+        self.overall_sums = array.array('q')
+
+        # per reference: the referring object, the referenced key, and
+        # the (name, tag) it came from, for the report
+        self.reference_owners = array.array('q')
+        self.reference_keys = array.array('Q')
+        self.references = []
+        # (name, tag) -> key, as most objects are referenced many times
+        self._reference_keys = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def load(self, entries):
+        '''
+        add every OMI object among (address, data) entries
+        '''
+        for address, tag, obj in decode_entries(entries):
+            self.add(address, tag, obj)
+
+    def add(self, address, tag, obj):
+        index = len(self.names)
+        self.names.append(get_unique_key(obj, tag))
+        self.tags.append(TAGS.index(tag))
+        self.keys.append(_address_key(address))
+
+        for kind, field in _SPLIT_FIELDS.get(tag, ()):
+            splits = getattr(obj, field)
+            if splits:
+                self.split_values[kind].extend(
+                    [split.split for split in splits])
+                self.split_owners[kind].extend([index] * len(splits))
+
+        if tag == RECORDING:
+            overall = obj.overall_split
+            self.overall_owners.append(index)
+            self.overall_sums.append(
+                overall.derived_work_portion
+                + overall.derived_recording_portion
+                + overall.contributor_portion)
+
+        known_keys = self._reference_keys
+        for reference in get_references(obj, tag):
+            key = known_keys.get(reference)
+            if key is None:
+                key = known_keys[reference] = _address_key(
+                    make_omi_address(*reference))
+            self.reference_owners.append(index)
+            self.reference_keys.append(key)
+            self.references.append(reference)
+
+
+def _array(values, dtype):
+    # frombuffer shares the array.array's memory rather than copying it
+    if not values:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.frombuffer(values, dtype=dtype)
+
+
+def audit(catalog):
+    '''
+    return a list of Violations for a CatalogArrays, grouped by object
+    in the order they were added
+    '''
+    if numpy is None:
+        raise RuntimeError('the audit requires numpy')
+
+    count = len(catalog)
+    tags = _array(catalog.tags, numpy.int8)
+    # (object index, rule order, Violation)
+    found = []
+
+    for kind, (description, tag, _, empty_passes) in enumerate(SPLITS):
+        owners = _array(catalog.split_owners[kind], numpy.int64)
+        values = _array(catalog.split_values[kind], numpy.int64)
+
+        sums = numpy.bincount(owners, weights=values, minlength=count)
+        failing = (tags == TAGS.index(tag)) & (sums != 100)
+        if empty_passes:
+            failing &= numpy.bincount(owners, minlength=count) > 0
+
+        for index in numpy.flatnonzero(failing):
+            found.append((index, kind + 1, Violation(
+                tag, catalog.names[index], '{} adds up to {}'.format(
+                    description, int(sums[index])))))
+
+    overall_owners = _array(catalog.overall_owners, numpy.int64)
+    overall_sums = _array(catalog.overall_sums, numpy.int64)
+    for position in numpy.flatnonzero(overall_sums != 100):
+        index = overall_owners[position]
+        found.append((index, 0, Violation(
+            RECORDING, catalog.names[index],
+            'Overall split adds up to {}'.format(
+                int(overall_sums[position])))))
+
+    known = numpy.unique(_array(catalog.keys, numpy.uint64))
+    reference_keys = _array(catalog.reference_keys, numpy.uint64)
+    reference_owners = _array(catalog.reference_owners, numpy.int64)
+    resolved = numpy.isin(reference_keys, known)
+    for position in numpy.flatnonzero(~resolved):
+        index = reference_owners[position]
+        name, ref_tag = catalog.references[position]
+        found.append((index, len(SPLITS) + 1, Violation(
+            TAGS[tags[index]], catalog.names[index],
+            'references unknown {} "{}"'.format(TYPE_NAMES[ref_tag], name))))
+
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [violation for _, _, violation in found]
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Check every object in an OMI export against the '
+                    'split and reference rules.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'export',
+        help='an export file, as written by omi-export')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    if numpy is None:
+        parser.error('numpy is required to audit an export')
+
+    catalog = CatalogArrays()
+    catalog.load(read_export(args.export))
+    violations = audit(catalog)
+
+    for violation in violations:
+        print(violation)
+
+    print('{} objects, {} violations'.format(len(catalog), len(violations)),
+          file=sys.stderr)
+
+    if violations:
+        sys.exit(1)
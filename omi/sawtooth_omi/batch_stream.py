@@ -0,0 +1,115 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+A batch stream is a file of serialized BatchList messages, each prefixed
+with its length as a 4-byte big-endian integer. It is the on-disk format
+used by the OMI tooling for captured ingest and exported history.
+'''
+
+import struct
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+
+_LENGTH = struct.Struct('>I')
+
+
+class StreamTransaction:
+    '''
+    A transaction from a batch stream, with its header decoded and its
+    position in the stream recorded
+    '''
+
+    __slots__ = (
+        'index', 'batch_id', 'txn_id', 'inputs', 'outputs', 'transaction')
+
+    def __init__(self, index, batch_id, transaction):
+        header = TransactionHeader()
+        header.ParseFromString(transaction.header)
+
+        self.index = index
+        self.batch_id = batch_id
+        self.txn_id = transaction.header_signature
+        self.inputs = frozenset(header.inputs)
+        self.outputs = frozenset(header.outputs)
+        self.transaction = transaction
+
+
+def write_batch_list(fd, batch_list_bytes):
+    fd.write(_LENGTH.pack(len(batch_list_bytes)))
+    fd.write(batch_list_bytes)
+
+
+def read_batch_lists(fd):
+    '''
+    yield the serialized BatchLists in a stream
+    '''
+    while True:
+        prefix = fd.read(_LENGTH.size)
+        if not prefix:
+            return
+
+        if len(prefix) < _LENGTH.size:
+            raise ValueError('Truncated batch stream')
+
+        length, = _LENGTH.unpack(prefix)
+        data = fd.read(length)
+        if len(data) < length:
+            raise ValueError('Truncated batch stream')
+
+        yield data
+
+
+def read_batches(paths):
+    '''
+    yield every Batch in the given stream files, in order
+    '''
+    for path in paths:
+        with open(path, 'rb') as fd:
+            for data in read_batch_lists(fd):
+                batch_list = BatchList()
+                batch_list.ParseFromString(data)
+                yield from batch_list.batches
+
+
+def read_transactions(batches):
+    '''
+    yield a StreamTransaction for every transaction in the batches
+    '''
+    index = 0
+    for batch in batches:
+        for transaction in batch.transactions:
+            yield StreamTransaction(index, batch.header_signature, transaction)
+            index += 1
+
+
+def group_by_batch(transactions):
+    '''
+    yield (batch ID, [StreamTransaction]) for each run of transactions
+    from the same batch
+    '''
+    batch_id = None
+    group = []
+    for txn in transactions:
+        if txn.batch_id != batch_id and group:
+            yield batch_id, group
+            group = []
+        batch_id = txn.batch_id
+        group.append(txn)
+
+    if group:
+        yield batch_id, group
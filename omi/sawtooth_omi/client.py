@@ -0,0 +1,366 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+A minimal client for submitting OMI batches to a Sawtooth REST API.
+
+With a tracer, every submitted transaction gets a root "submit" span,
+tagged with its batch ID, whose children time the POST and the wait for
+batch status. The processor's apply spans join the same traces (see
+sawtooth_omi.tracing).
+'''
+
+import argparse
+import base64
+import json
+import math
+import os
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from sawtooth_omi.adaptive import AdaptiveSubmitter
+from sawtooth_omi.adaptive import AimdController
+from sawtooth_omi.batch_stream import read_batch_lists
+from sawtooth_omi import codec
+from sawtooth_omi.export import decode_entry
+from sawtooth_omi.export import fetch_state
+from sawtooth_omi.handler import OMI_ADDRESS_PREFIX
+from sawtooth_omi.handler import make_owner_index_prefix
+from sawtooth_omi.protobuf.ownership_pb2 import OwnerIndexShard
+from sawtooth_omi.tracing import CLIENT
+from sawtooth_omi.tracing import NOOP_SPAN
+from sawtooth_omi.tracing import SpanGroup
+from sawtooth_omi.tracing import create_tracer
+from sawtooth_omi.tracing import transaction_trace_ids
+
+
+# Batch IDs per /batch_status request; each is 128 hex characters, so
+# this keeps the request line well under the usual 8 KiB server limit
+STATUS_QUERY_SIZE = 50
+
+
+class OMIRestClient:
+    def __init__(self, url, tracer=None, timeout=300):
+        self._url = url.rstrip('/')
+        self._tracer = tracer
+        self._timeout = timeout
+
+    def submit(self, batch_list, wait=None):
+        '''
+        post a BatchList and return {batch ID: status}; with wait, wait
+        up to that many seconds for the batches to commit
+        '''
+        batch_ids = [batch.header_signature for batch in batch_list.batches]
+
+        with self._spans(batch_list) as span:
+            with span.phase('post_batches'):
+                self.post_batches(batch_list.SerializeToString())
+
+            with span.phase('batch_status'):
+                statuses = self.batch_statuses(batch_ids, wait)
+
+            if self._tracer is not None:
+                for batch_span in span.spans:
+                    batch_span.tag(
+                        'omi.batch_status', statuses.get(batch_span.batch_id))
+
+        return statuses
+
+    def post_batches(self, batch_list_bytes):
+        '''
+        post a serialized BatchList without waiting for it
+        '''
+        return self._request(
+            '/batches',
+            data=batch_list_bytes,
+            headers={'Content-Type': 'application/octet-stream'})
+
+    def batch_statuses(self, batch_ids, wait=None):
+        '''
+        return {batch ID: status}, querying STATUS_QUERY_SIZE IDs at a
+        time; with wait, all of the queries together wait up to that
+        many seconds
+        '''
+        batch_ids = list(batch_ids)
+        deadline = None if wait is None else time.monotonic() + wait
+
+        statuses = {}
+        for start in range(0, len(batch_ids), STATUS_QUERY_SIZE):
+            query = {'id': ','.join(
+                batch_ids[start:start + STATUS_QUERY_SIZE])}
+            if wait is not None:
+                query['wait'] = wait if not start else max(
+                    0, math.ceil(deadline - time.monotonic()))
+
+            body = self._request(
+                '/batch_status?{}'.format(urllib.parse.urlencode(query)))
+            data = body.get('data', {})
+
+            # Older REST APIs return a mapping, newer ones a list
+            if isinstance(data, dict):
+                statuses.update(data)
+            else:
+                statuses.update(
+                    (status['id'], status['status']) for status in data)
+
+        return statuses
+
+    def head_block(self):
+        '''
+        return the chain head block, as the REST API lists it
+        '''
+        return self._request('/blocks?limit=1')['data'][0]
+
+    def block(self, block_id):
+        return self._request(
+            '/blocks/{}'.format(urllib.parse.quote(block_id)))['data']
+
+    def state(self, prefix=OMI_ADDRESS_PREFIX, head=None):
+        '''
+        yield (address, data) for every entry under a prefix
+        '''
+        return fetch_state(self._url, prefix, head=head)
+
+    def state_entry(self, address, head=None):
+        '''
+        return the data at an address, or None if it's empty
+        '''
+        path = '/state/{}'.format(address)
+        if head is not None:
+            path += '?' + urllib.parse.urlencode({'head': head})
+
+        try:
+            body = self._request(path)
+        except urllib.error.HTTPError as err:
+            if err.code == 404:
+                return None
+            raise
+
+        return base64.b64decode(body['data'])
+
+    def owned_addresses(self, pubkey, head=None):
+        '''
+        return the sorted addresses of the objects registered under a
+        public key, from its owner index
+        '''
+        addresses = []
+        for _, data in self.state(make_owner_index_prefix(pubkey), head):
+            addresses.extend(codec.parse(OwnerIndexShard, data).addresses)
+        return sorted(addresses)
+
+    def signer_catalog(self, pubkey, head=None, workers=8):
+        '''
+        return [(address, tag, obj)] for the objects registered under a
+        public key
+
+        The REST API reads one address per request, so after listing
+        the index the objects are fetched on several connections at
+        once. Pass the head block ID to read both as of the same block.
+        '''
+        addresses = self.owned_addresses(pubkey, head)
+        with ThreadPoolExecutor(workers) as executor:
+            found = executor.map(
+                lambda address: self.state_entry(address, head), addresses)
+
+            catalog = []
+            for address, data in zip(addresses, found):
+                if data is None:
+                    continue
+                decoded = decode_entry(address, data)
+                if decoded is not None:
+                    catalog.append((address,) + decoded)
+
+        return catalog
+
+    def _spans(self, batch_list):
+        if self._tracer is None:
+            return NOOP_SPAN
+
+        spans = []
+        for batch in batch_list.batches:
+            for transaction in batch.transactions:
+                trace_id, span_id = transaction_trace_ids(
+                    transaction.header_signature)
+                spans.append(_BatchSpan(
+                    batch.header_signature,
+                    self._tracer.span(
+                        'submit', trace_id, span_id=span_id, kind=CLIENT,
+                        tags={
+                            'omi.batch_id': batch.header_signature,
+                            'omi.transaction_id':
+                                transaction.header_signature,
+                        })))
+        return SpanGroup(spans)
+
+    def _request(self, path, data=None, headers=None):
+        request = urllib.request.Request(
+            self._url + path, data=data, headers=headers or {})
+        with urllib.request.urlopen(request, timeout=self._timeout) as resp:
+            return json.loads(resp.read().decode())
+
+
+class _BatchSpan:
+    '''
+    A span that remembers the batch it belongs to, so per-batch results
+    can be tagged after a group phase
+    '''
+
+    __slots__ = ('batch_id', 'span')
+
+    def __init__(self, batch_id, span):
+        self.batch_id = batch_id
+        self.span = span
+
+    def __enter__(self):
+        self.span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self.span.__exit__(exc_type, exc, tb)
+
+    def phase(self, name):
+        return self.span.phase(name)
+
+    def tag(self, key, value):
+        self.span.tag(key, value)
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Submit OMI batch streams to a Sawtooth REST API.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'url',
+        help='the URL of the REST API, e.g. http://localhost:8080')
+
+    parser.add_argument(
+        'batch_streams',
+        nargs='+',
+        help='files of length-prefixed BatchLists')
+
+    parser.add_argument(
+        '--wait',
+        type=int,
+        help='seconds to wait for each BatchList to commit')
+
+    parser.add_argument(
+        '--adaptive',
+        action='store_true',
+        help='regroup each stream\'s batches into BatchLists and post '
+             'several at once, sized to the commit latency and back-'
+             'pressure observed; batches may reach the validator out of '
+             'order within a stream, but streams are submitted in turn')
+
+    parser.add_argument(
+        '--target-latency',
+        type=float,
+        default=5.0,
+        help='with --adaptive, seconds a BatchList may take to commit '
+             'before the batch size is cut')
+
+    parser.add_argument(
+        '--max-batch',
+        type=int,
+        default=1000,
+        help='with --adaptive, the most batches per BatchList')
+
+    parser.add_argument(
+        '--max-in-flight',
+        type=int,
+        default=32,
+        help='with --adaptive, the most BatchLists in flight')
+
+    parser.add_argument(
+        '--metrics-file',
+        help='with --adaptive, write batch size and concurrency '
+             'decisions to this file as JSON lines')
+
+    parser.add_argument(
+        '--trace-file',
+        help='record spans to this file as Zipkin v2 JSON lines')
+
+    parser.add_argument(
+        '--trace-url',
+        help='post spans to this Zipkin-compatible collector')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    tracer = create_tracer('omi-client', args.trace_file, args.trace_url)
+    client = OMIRestClient(args.url, tracer)
+
+    if args.adaptive:
+        try:
+            _submit_adaptive(client, args)
+        finally:
+            if tracer is not None:
+                tracer.close()
+        return
+
+    try:
+        for path in args.batch_streams:
+            with open(path, 'rb') as fd:
+                for data in read_batch_lists(fd):
+                    batch_list = BatchList()
+                    batch_list.ParseFromString(data)
+                    statuses = client.submit(batch_list, args.wait)
+                    for batch_id, status in statuses.items():
+                        print('{}\t{}'.format(batch_id, status))
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+
+def _submit_adaptive(client, args):
+    metrics = None
+    if args.metrics_file is not None:
+        metrics = open(args.metrics_file, 'a')
+
+    try:
+        submitter = AdaptiveSubmitter(client, AimdController(
+            target_latency=args.target_latency,
+            max_batch=args.max_batch,
+            max_window=args.max_in_flight,
+            metrics=metrics), wait=args.wait or 30)
+
+        for path in args.batch_streams:
+            with open(path, 'rb') as fd:
+                submitter.submit(
+                    _batches(read_batch_lists(fd)),
+                    lambda batch_id, status: print(
+                        '{}\t{}'.format(batch_id, status), flush=True))
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+
+def _batches(batch_list_data):
+    for data in batch_list_data:
+        batch_list = BatchList()
+        batch_list.ParseFromString(data)
+        yield from batch_list.batches
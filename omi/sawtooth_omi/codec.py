@@ -0,0 +1,139 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Protobuf encoding and decoding for the transaction handler and the
+message factories.
+
+google.protobuf picks its implementation when it is first imported:
+a C++ extension ("cpp"), or in newer releases the upb extension
+("upb"), or pure Python ("python"), which parses and serializes OMI
+objects several times slower. PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION
+overrides the choice, and a requested extension that isn't installed
+may silently fall back to pure Python, so the backend is detected from
+the generated message classes rather than taken from the setting.
+
+All handler (de)serialization goes through the active Codec, so a
+different one can be installed with set_codec().
+'''
+
+import logging
+
+from sawtooth_omi.protobuf.work_pb2 import Work
+
+
+LOGGER = logging.getLogger(__name__)
+
+PYTHON = 'python'
+FAST_BACKENDS = ('cpp', 'upb')
+
+
+class SlowBackendError(Exception):
+    pass
+
+
+def detect_backend():
+    '''
+    return the protobuf implementation generated messages actually use:
+    'cpp', 'upb' or 'python'
+    '''
+    metaclass = type(Work)
+    if metaclass.__module__.startswith('google.protobuf.internal.'):
+        return PYTHON
+    if metaclass.__module__.startswith('google._upb'):
+        return 'upb'
+    return 'cpp'
+
+
+class Codec:
+    '''
+    Parses and serializes protobuf messages with the installed backend
+    '''
+
+    def __init__(self):
+        self.backend = detect_backend()
+
+    @property
+    def is_fast(self):
+        return self.backend in FAST_BACKENDS
+
+    def parse(self, message_type, data):
+        '''
+        return a new message_type parsed from data; raises DecodeError
+        '''
+        message = message_type()
+        message.ParseFromString(data)
+        return message
+
+    def parse_into(self, message, data):
+        '''
+        clear message and parse data into it, to reuse the message
+        '''
+        message.ParseFromString(data)
+        return message
+
+    def serialize(self, message):
+        return message.SerializeToString()
+
+
+_codec = Codec()
+
+
+def get_codec():
+    return _codec
+
+
+def set_codec(codec):
+    '''
+    install codec for all later (de)serialization, returning the
+    previous one
+    '''
+    global _codec  # pylint: disable=global-statement
+    previous, _codec = _codec, codec
+    return previous
+
+
+def parse(message_type, data):
+    return _codec.parse(message_type, data)
+
+
+def parse_into(message, data):
+    return _codec.parse_into(message, data)
+
+
+def serialize(message):
+    return _codec.serialize(message)
+
+
+def check_backend(require_fast=False):
+    '''
+    log the active backend, warning if it is pure Python; with
+    require_fast, raise SlowBackendError instead
+    '''
+    backend = _codec.backend
+    if _codec.is_fast:
+        LOGGER.info('Using the %s protobuf backend', backend)
+        return backend
+
+    if require_fast:
+        raise SlowBackendError(
+            'Only the pure-Python protobuf backend is available; install '
+            'a protobuf build with the {} extension'.format(
+                ' or '.join(FAST_BACKENDS)))
+
+    LOGGER.warning(
+        'Using the pure-Python protobuf backend; transactions will '
+        'parse and serialize several times slower')
+    return backend
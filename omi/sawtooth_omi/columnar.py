@@ -0,0 +1,540 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Columnar tables of the Works and Recordings in OMI state, for analytics
+that shouldn't decode every protobuf on every run.
+
+A store is a directory:
+
+    manifest.json     the head block, the partitions, and how many lines
+                      of names.txt and addresses.txt are committed
+    names.txt         the name dictionary, one JSON string per line
+    addresses.txt     the address of each object ID, one per line
+    digests.npy       a 64-bit hash of each object's data, 0 if removed
+    part-00000/<table>/<column>.npy
+
+Objects are numbered in the order they are first seen. Every string
+(titles, names, labels, ISWCs and ISRCs, public keys) is stored as its
+line number in the name dictionary; -1 is an empty string. Each run
+hashes the entries it is given and appends one partition holding only
+the objects whose data changed: their row in objects and all their
+split rows, or an objects row marked removed. Reading a table loads just
+the columns asked for, memory-mapped, from each partition and keeps the
+rows of each object's newest version.
+
+    objects                      object_id kind title code
+                                 registering_pubkey type label
+                                 derived_work_portion
+                                 derived_recording_portion
+                                 contributor_portion removed
+    songwriter_publisher_splits  object_id songwriter publisher split
+    contributor_splits           object_id contributor split
+    derived_work_splits          object_id work split
+    derived_recording_splits     object_id recording split
+
+kind is 0 for works and 1 for recordings; type is a Recording.Type, or
+-1 for works. A store is brought up to date from an export file or,
+with --url, by following the chain from its head block as omi-snapshot
+does. The store requires numpy, which omi-tp doesn't.
+'''
+
+import argparse
+import array
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.export import decode_entry
+from sawtooth_omi.export import read_export
+from sawtooth_omi.handler import get_address_tag
+from sawtooth_omi.handler import WORK, RECORDING
+from sawtooth_omi.main import setup_loggers
+from sawtooth_omi.read_service import StateFollower
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+KINDS = {WORK: 0, RECORDING: 1}
+
+# table -> ((column, numpy dtype), ...)
+TABLES = (
+    ('objects', (
+        ('object_id', 'i4'),
+        ('kind', 'i1'),
+        ('title', 'i4'),
+        ('code', 'i4'),
+        ('registering_pubkey', 'i4'),
+        ('type', 'i1'),
+        ('label', 'i4'),
+        ('derived_work_portion', 'i4'),
+        ('derived_recording_portion', 'i4'),
+        ('contributor_portion', 'i4'),
+        ('removed', '?'),
+    )),
+    ('songwriter_publisher_splits', (
+        ('object_id', 'i4'),
+        ('songwriter', 'i4'),
+        ('publisher', 'i4'),
+        ('split', 'i4'),
+    )),
+    ('contributor_splits', (
+        ('object_id', 'i4'),
+        ('contributor', 'i4'),
+        ('split', 'i4'),
+    )),
+    ('derived_work_splits', (
+        ('object_id', 'i4'),
+        ('work', 'i4'),
+        ('split', 'i4'),
+    )),
+    ('derived_recording_splits', (
+        ('object_id', 'i4'),
+        ('recording', 'i4'),
+        ('split', 'i4'),
+    )),
+)
+
+_COLUMNS = dict(TABLES)
+
+_MANIFEST = 'manifest.json'
+_NAMES = 'names.txt'
+_ADDRESSES = 'addresses.txt'
+_DIGESTS = 'digests.npy'
+
+
+def _digest(data):
+    return int.from_bytes(
+        hashlib.blake2b(data, digest_size=8).digest(), 'big') or 1
+
+
+def _read_lines(path, count):
+    '''
+    return the first count JSON lines of a file, cutting off any lines
+    a failed run appended after them
+    '''
+    if not os.path.exists(path):
+        open(path, 'w').close()
+        return []
+
+    with open(path, 'rb') as fd:
+        lines = fd.readlines()
+    if len(lines) > count:
+        with open(path, 'r+b') as fd:
+            fd.truncate(sum(len(line) for line in lines[:count]))
+
+    return [json.loads(line.decode()) for line in lines[:count]]
+
+
+def _write_atomic(path, write):
+    with open(path + '.tmp', 'wb') as fd:
+        write(fd)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _load(path):
+    # numpy can't map a file with no data after its header
+    array_ = numpy.load(path, mmap_mode='r')
+    if not array_.size:
+        return numpy.load(path)
+    return array_
+
+
+class ColumnarStore:
+    def __init__(self, path):
+        if numpy is None:
+            raise RuntimeError('the columnar store requires numpy')
+
+        self._path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        manifest = {
+            'head': None, 'partitions': [], 'next_partition': 0,
+            'names': 0, 'objects': 0,
+        }
+        manifest_path = os.path.join(path, _MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as fd:
+                manifest.update(json.load(fd))
+
+        self.head = manifest['head']
+        self._partitions = manifest['partitions']
+        self._next_partition = manifest['next_partition']
+
+        # a run that stopped before writing its manifest leaves partitions
+        # the manifest doesn't list, under names the next run will reuse
+        for entry in os.listdir(path):
+            if entry.startswith('part-') and entry not in self._partitions:
+                LOGGER.warning('Removing unlisted partition %s', entry)
+                shutil.rmtree(os.path.join(path, entry))
+
+        self._names = _read_lines(
+            os.path.join(path, _NAMES), manifest['names'])
+        self._codes = {name: code for code, name in enumerate(self._names)}
+        self._addresses = _read_lines(
+            os.path.join(path, _ADDRESSES), manifest['objects'])
+        self._ids = {
+            address: object_id
+            for object_id, address in enumerate(self._addresses)}
+
+        self._digests = array.array('Q', bytes(8 * len(self._addresses)))
+        digests_path = os.path.join(path, _DIGESTS)
+        if os.path.exists(digests_path):
+            # a run that stopped before saving its digests only leaves
+            # objects to append again
+            saved = numpy.load(digests_path)[:len(self._addresses)]
+            self._digests[:len(saved)] = array.array('Q', saved.tobytes())
+
+        self._latest = None
+
+    def __len__(self):
+        return sum(1 for digest in self._digests if digest)
+
+    def names(self):
+        '''
+        return the name dictionary as an array, to index with codes
+        '''
+        return numpy.array(self._names, dtype=object)
+
+    def code(self, name):
+        '''
+        return the code of a name, or -1 if it isn't in the dictionary
+        '''
+        return self._codes.get(name, -1)
+
+    def address(self, object_id):
+        return self._addresses[object_id]
+
+    def reset(self, entries, head=None):
+        '''
+        append the objects among entries that changed, and mark those
+        missing from entries removed; return the number appended
+        '''
+        seen = set()
+        changed = []
+        for address, data in entries:
+            if get_address_tag(address) in KINDS:
+                seen.add(address)
+                changed.extend(self._changed([(address, data)]))
+
+        changed.extend(self._changed(
+            (address, None) for address in self._ids
+            if address not in seen))
+
+        return self._append(changed, head)
+
+    def update(self, changes, head=None):
+        '''
+        append (address, data) changes, where data is None for an
+        address that has been emptied; return the number appended
+        '''
+        return self._append(list(self._changed(changes)), head)
+
+    def read(self, table, columns=None, removed=False):
+        '''
+        return {column: array} of the current rows of a table, loading
+        only the columns named; removed objects are left out unless
+        removed is True
+        '''
+        if columns is None:
+            columns = [column for column, _ in _COLUMNS[table]]
+
+        with self._lock:
+            partitions = list(self._partitions)
+            latest = self._latest_partitions()
+
+        found = {column: [] for column in columns}
+        for index, partition in enumerate(partitions):
+            directory = os.path.join(self._path, partition, table)
+            keep = latest[_load(os.path.join(directory, 'object_id.npy'))] \
+                == index
+            if table == 'objects' and not removed:
+                keep &= ~_load(os.path.join(directory, 'removed.npy'))
+
+            for column in columns:
+                found[column].append(
+                    _load(os.path.join(directory, column + '.npy'))[keep])
+
+        dtypes = dict(_COLUMNS[table])
+        return {
+            column: numpy.concatenate(parts) if parts
+            else numpy.zeros(0, dtypes[column])
+            for column, parts in found.items()}
+
+    def compact(self):
+        '''
+        rewrite the current rows of every table as one partition
+        '''
+        tables = {table: self.read(table) for table, _ in TABLES}
+
+        with self._lock:
+            old = list(self._partitions)
+            self._write_partition(tables)
+            self._partitions = self._partitions[-1:]
+            self._write_manifest()
+            self._latest = None
+
+        for partition in old:
+            shutil.rmtree(os.path.join(self._path, partition))
+
+    def _changed(self, changes):
+        '''
+        yield (address, tag, data, digest) for the changes that differ
+        from what the store holds
+        '''
+        for address, data in changes:
+            tag = get_address_tag(address)
+            if tag not in KINDS:
+                continue
+
+            digest = 0 if data is None else _digest(data)
+            object_id = self._ids.get(address)
+            held = 0 if object_id is None else self._digests[object_id]
+            if digest != held:
+                yield address, tag, data, digest
+
+    def _append(self, changed, head):
+        with self._lock:
+            if not changed:
+                if head != self.head:
+                    self.head = head
+                    self._write_manifest()
+                return 0
+
+            names = len(self._names)
+            addresses = len(self._addresses)
+            rows = {
+                table: {column: [] for column, _ in columns}
+                for table, columns in TABLES}
+            for address, tag, data, digest in changed:
+                object_id = self._ids.get(address)
+                if object_id is None:
+                    object_id = self._ids[address] = len(self._addresses)
+                    self._addresses.append(address)
+                    self._digests.append(0)
+                self._digests[object_id] = digest
+                self._add_rows(rows, object_id, tag, data)
+
+            self._write_partition(rows)
+            self._append_lines(_NAMES, self._names[names:])
+            self._append_lines(_ADDRESSES, self._addresses[addresses:])
+            self.head = head
+            self._write_manifest()
+            _write_atomic(
+                os.path.join(self._path, _DIGESTS),
+                lambda fd: numpy.save(
+                    fd, numpy.frombuffer(self._digests, numpy.uint64)))
+            self._latest = None
+
+        LOGGER.info('Appended %s changed objects', len(changed))
+        return len(changed)
+
+    def _add_rows(self, rows, object_id, tag, data):
+        row = {
+            'object_id': object_id,
+            'kind': KINDS[tag],
+            'title': -1,
+            'code': -1,
+            'registering_pubkey': -1,
+            'type': -1,
+            'label': -1,
+            'derived_work_portion': 0,
+            'derived_recording_portion': 0,
+            'contributor_portion': 0,
+            'removed': data is None,
+        }
+
+        if data is not None:
+            self._add_object(rows, row, object_id, tag, data)
+
+        objects = rows['objects']
+        for column, value in row.items():
+            objects[column].append(value)
+
+    def _add_object(self, rows, row, object_id, tag, data):
+        '''
+        fill in an object's row and add its split rows
+        '''
+        code = self._code
+        _, obj = decode_entry(self._addresses[object_id], data)
+        row['title'] = code(obj.title)
+        row['registering_pubkey'] = code(obj.registering_pubkey)
+
+        if tag == WORK:
+            row['code'] = code(obj.ISWC)
+
+            splits = rows['songwriter_publisher_splits']
+            for split in obj.songwriter_publisher_splits:
+                song_pub = split.songwriter_publisher
+                splits['object_id'].append(object_id)
+                splits['songwriter'].append(code(song_pub.songwriter_name))
+                splits['publisher'].append(code(song_pub.publisher_name))
+                splits['split'].append(split.split)
+
+        else:
+            overall = obj.overall_split
+            row.update(
+                code=code(obj.ISRC),
+                type=obj.type,
+                label=code(obj.label_name),
+                derived_work_portion=overall.derived_work_portion,
+                derived_recording_portion=overall.derived_recording_portion,
+                contributor_portion=overall.contributor_portion)
+
+            for table, name_field, column in (
+                    ('contributor_splits', 'contributor_name', 'contributor'),
+                    ('derived_work_splits', 'work_name', 'work'),
+                    ('derived_recording_splits', 'recording_name',
+                     'recording')):
+                splits = rows[table]
+                for split in getattr(obj, table):
+                    splits['object_id'].append(object_id)
+                    splits[column].append(code(getattr(split, name_field)))
+                    splits['split'].append(split.split)
+
+    def _code(self, name):
+        if not name:
+            return -1
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._names)
+            self._names.append(name)
+        return code
+
+    def _write_partition(self, tables):
+        partition = 'part-{:05d}'.format(self._next_partition)
+        self._next_partition += 1
+
+        temp = os.path.join(self._path, partition + '.tmp')
+        shutil.rmtree(temp, ignore_errors=True)
+        for table, columns in TABLES:
+            os.makedirs(os.path.join(temp, table))
+            for column, dtype in columns:
+                numpy.save(
+                    os.path.join(temp, table, column + '.npy'),
+                    numpy.asarray(tables[table][column], dtype=dtype))
+
+        os.replace(temp, os.path.join(self._path, partition))
+        self._partitions.append(partition)
+
+    def _append_lines(self, name, values):
+        with open(os.path.join(self._path, name), 'a') as fd:
+            for value in values:
+                fd.write(json.dumps(value) + '\n')
+            fd.flush()
+            os.fsync(fd.fileno())
+
+    def _write_manifest(self):
+        manifest = json.dumps({
+            'head': self.head,
+            'partitions': self._partitions,
+            'next_partition': self._next_partition,
+            'names': len(self._names),
+            'objects': len(self._addresses),
+        }, indent=2).encode()
+        _write_atomic(
+            os.path.join(self._path, _MANIFEST),
+            lambda fd: fd.write(manifest))
+
+    def _latest_partitions(self):
+        '''
+        return, per object ID, the index of the partition holding its
+        newest version
+        '''
+        if self._latest is None:
+            latest = numpy.full(len(self._addresses), -1, numpy.int32)
+            for index, partition in enumerate(self._partitions):
+                latest[_load(os.path.join(
+                    self._path, partition, 'objects', 'object_id.npy'))] = \
+                    index
+            self._latest = latest
+        return self._latest
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Append changed Works and Recordings to columnar '
+                    'split tables.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'store',
+        help='the directory of the columnar store')
+
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        '--export',
+        help='compare the store with an export file, appending what '
+             'changed')
+    source.add_argument(
+        '--url',
+        help='bring the store up to the chain head of a REST API, '
+             'reading only the blocks since its last run')
+
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help='rewrite the current rows as a single partition')
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='increase output sent to stderr')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    if numpy is None:
+        parser.error('numpy is required for the columnar store')
+
+    setup_loggers(args.verbose)
+
+    store = ColumnarStore(args.store)
+
+    if args.export is not None:
+        store.reset(read_export(args.export))
+
+    if args.url is not None:
+        follower = StateFollower(OMIRestClient(args.url), store)
+        if store.head is None:
+            follower.load()
+        else:
+            follower.resume()
+            follower.poll()
+
+    if args.compact:
+        store.compact()
+
+    LOGGER.info('%s objects at %s', len(store), store.head)
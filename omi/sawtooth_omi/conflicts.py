@@ -0,0 +1,257 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Address-conflict analysis for streams of OMI batches.
+
+The validator's parallel scheduler orders a transaction after every
+earlier transaction that writes one of its inputs, and after every
+earlier transaction that reads or writes one of its outputs. Reads of
+the same address never conflict. This module builds that dependency
+graph from the declared inputs and outputs, and reports how long its
+critical path is and how much parallelism it leaves.
+'''
+
+import argparse
+import collections
+import os
+import sys
+
+from sawtooth_omi.batch_stream import group_by_batch
+from sawtooth_omi.batch_stream import read_batches
+from sawtooth_omi.batch_stream import read_transactions
+from sawtooth_omi.handler import get_address_tag
+
+
+class BatchUnit:
+    '''
+    A batch scheduled as a single unit, declaring the union of its
+    transactions' inputs and outputs
+    '''
+
+    __slots__ = ('index', 'batch_id', 'inputs', 'outputs', 'transactions')
+
+    def __init__(self, index, batch_id, transactions):
+        self.index = index
+        self.batch_id = batch_id
+        self.transactions = transactions
+        self.inputs = frozenset().union(*(t.inputs for t in transactions))
+        self.outputs = frozenset().union(*(t.outputs for t in transactions))
+
+
+class ConflictReport:
+    def __init__(self, depths, edge_count, hot_addresses):
+        # depths[i] is the 1-based length of the longest dependency
+        # chain ending at unit i
+        self.depths = depths
+        self.edge_count = edge_count
+        self.hot_addresses = hot_addresses
+
+    @property
+    def unit_count(self):
+        return len(self.depths)
+
+    @property
+    def critical_path(self):
+        return max(self.depths, default=0)
+
+    @property
+    def parallelism(self):
+        if not self.depths:
+            return 0.0
+        return self.unit_count / self.critical_path
+
+    @property
+    def wave_widths(self):
+        '''
+        the number of units that could run at each step of an ideal
+        schedule, where step n holds every unit of depth n
+        '''
+        widths = [0] * self.critical_path
+        for depth in self.depths:
+            widths[depth - 1] += 1
+        return widths
+
+
+def analyze(units):
+    '''
+    Build the conflict graph of an ordered sequence of units, each with
+    `inputs` and `outputs` address sets, and return a ConflictReport.
+
+    Runs in time linear in the number of declared addresses; only the
+    edges that matter for ordering are counted, i.e. a unit depends on
+    the last writer of each address it touches and, for its outputs, on
+    the readers since that write.
+    '''
+    last_writer = {}
+    readers = collections.defaultdict(list)
+    hot_addresses = collections.Counter()
+    depths = []
+    edge_count = 0
+
+    for index, unit in enumerate(units):
+        predecessors = set()
+
+        for address in unit.inputs | unit.outputs:
+            writer = last_writer.get(address)
+            if writer is not None:
+                predecessors.add(writer)
+                hot_addresses[address] += 1
+
+        for address in unit.outputs:
+            address_readers = readers.get(address)
+            if address_readers:
+                predecessors.update(address_readers)
+                hot_addresses[address] += len(address_readers)
+
+        predecessors.discard(index)
+        edge_count += len(predecessors)
+        depths.append(1 + max(
+            (depths[p] for p in predecessors), default=0))
+
+        for address in unit.inputs - unit.outputs:
+            readers[address].append(index)
+
+        for address in unit.outputs:
+            last_writer[address] = index
+            readers.pop(address, None)
+
+    return ConflictReport(depths, edge_count, hot_addresses)
+
+
+def batch_units(transactions):
+    '''
+    group an ordered sequence of StreamTransactions into BatchUnits
+    '''
+    units = []
+    for batch_id, group in group_by_batch(transactions):
+        units.append(BatchUnit(len(units), batch_id, group))
+    return units
+
+
+def suggest_schedule(units, report, max_batch_size):
+    '''
+    Return a re-batching of the units as a list of waves. Each wave is
+    a list of batches (lists of units) that are independent of each
+    other, and every wave only depends on earlier waves, so submitting
+    the waves in order preserves the original outcome while giving the
+    scheduler the widest independent sets available.
+
+    Note that re-batching transactions changes which ones commit or
+    fail together; use batch units to keep the original batches whole.
+    '''
+    waves = [[] for _ in range(report.critical_path)]
+    for unit, depth in zip(units, report.depths):
+        waves[depth - 1].append(unit)
+
+    return [
+        [wave[i:i + max_batch_size]
+         for i in range(0, len(wave), max_batch_size)]
+        for wave in waves
+    ]
+
+
+def _describe_address(address):
+    tag = get_address_tag(address)
+    if tag is None:
+        return address
+    return '{} ({})'.format(address, tag.lstrip('_'))
+
+
+def _print_report(report, granularity, top, out):
+    print('{}s: {}'.format(granularity, report.unit_count), file=out)
+    print('dependency edges: {}'.format(report.edge_count), file=out)
+    print('critical path: {}'.format(report.critical_path), file=out)
+    print('achievable parallelism: {:.2f}'.format(report.parallelism),
+          file=out)
+
+    widths = report.wave_widths
+    if widths:
+        print('wave widths: min {} / max {} / mean {:.1f}'.format(
+            min(widths), max(widths), sum(widths) / len(widths)), file=out)
+
+    if report.hot_addresses and top > 0:
+        print('most conflicted addresses:', file=out)
+        for address, count in report.hot_addresses.most_common(top):
+            print('  {:6d}  {}'.format(count, _describe_address(address)),
+                  file=out)
+
+
+def _print_schedule(schedule, out):
+    for wave_number, wave in enumerate(schedule, start=1):
+        print('wave {}:'.format(wave_number), file=out)
+        for batch in wave:
+            print('  batch: {}'.format(', '.join(
+                getattr(unit, 'txn_id', None) or unit.batch_id
+                for unit in batch)), file=out)
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Report the address-conflict graph of OMI batch '
+                    'streams as seen by the parallel scheduler.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'batch_streams',
+        nargs='+',
+        help='files of length-prefixed BatchLists, in submission order')
+
+    parser.add_argument(
+        '--batches',
+        action='store_true',
+        help='analyze whole batches instead of single transactions')
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=10,
+        help='number of most conflicted addresses to show')
+
+    parser.add_argument(
+        '--suggest',
+        action='store_true',
+        help='print a re-batched schedule that maximizes independent sets')
+
+    parser.add_argument(
+        '--max-batch-size',
+        type=int,
+        default=100,
+        help='largest batch to suggest')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    transactions = list(read_transactions(read_batches(args.batch_streams)))
+
+    if args.batches:
+        units = batch_units(transactions)
+        granularity = 'batch'
+    else:
+        units = transactions
+        granularity = 'transaction'
+
+    report = analyze(units)
+    _print_report(report, granularity, args.top, sys.stdout)
+
+    if args.suggest:
+        _print_schedule(
+            suggest_schedule(units, report, args.max_batch_size),
+            sys.stdout)
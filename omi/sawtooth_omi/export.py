@@ -0,0 +1,141 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Exports of OMI state.
+
+An export is a file of JSON lines, one state entry per line, shaped like
+the entries of the REST API's /state listing:
+
+    {"address": "38aa50a0...", "data": "<base64 protobuf>"}
+
+Exports can be read back as raw entries or as decoded OMI objects, and
+written from a live validator with `omi-export`.
+'''
+
+import argparse
+import base64
+import json
+import os
+import sys
+import urllib.parse
+import urllib.request
+
+from sawtooth_omi.handler import OMI_ADDRESS_PREFIX
+from sawtooth_omi.handler import get_address_tag
+from sawtooth_omi.handler import get_object_type
+
+
+def read_export(path):
+    '''
+    yield (address, data) for every entry in an export file
+    '''
+    with open(path) as fd:
+        for line in fd:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            yield entry['address'], base64.b64decode(entry['data'])
+
+
+def write_export(fd, entries):
+    '''
+    write (address, data) pairs to an open text file
+    '''
+    for address, data in entries:
+        fd.write(json.dumps({
+            'address': address,
+            'data': base64.b64encode(data).decode(),
+        }))
+        fd.write('\n')
+
+
+def decode_entry(address, data):
+    '''
+    return (tag, obj) for a state entry, or None for addresses that
+    don't hold OMI objects
+    '''
+    tag = get_address_tag(address)
+    if tag is None:
+        return None
+
+    obj = get_object_type(tag)()
+    obj.ParseFromString(data)
+
+    return tag, obj
+
+
+def decode_entries(entries):
+    '''
+    yield (address, tag, obj) for every OMI object among the entries
+    '''
+    for address, data in entries:
+        decoded = decode_entry(address, data)
+        if decoded is not None:
+            yield (address,) + decoded
+
+
+def fetch_state(url, prefix=OMI_ADDRESS_PREFIX, limit=None, head=None):
+    '''
+    yield (address, data) for every entry under a prefix, paging through
+    the REST API's /state listing, optionally as of a given block
+    '''
+    query = {'address': prefix}
+    if limit is not None:
+        query['limit'] = limit
+    if head is not None:
+        query['head'] = head
+
+    next_url = '{}/state?{}'.format(
+        url.rstrip('/'), urllib.parse.urlencode(query))
+
+    while next_url:
+        with urllib.request.urlopen(next_url) as response:
+            body = json.loads(response.read().decode())
+
+        for entry in body.get('data', []):
+            yield entry['address'], base64.b64decode(entry['data'])
+
+        next_url = body.get('paging', {}).get('next')
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Export OMI state from a Sawtooth REST API.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'url',
+        help='the URL of the REST API, e.g. http://localhost:8080')
+
+    parser.add_argument(
+        'output',
+        help='the export file to write')
+
+    parser.add_argument(
+        '--prefix',
+        default=OMI_ADDRESS_PREFIX,
+        help='the address prefix to export')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    with open(args.output, 'w') as fd:
+        write_export(fd, fetch_state(args.url, args.prefix))
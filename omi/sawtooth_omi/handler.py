@@ -13,8 +13,10 @@
 # limitations under the License.
 # -----------------------------------------------------------------------------
 
+import bisect
 import hashlib
 import logging
+import threading
 
 from google.protobuf.message import DecodeError
 
@@ -23,11 +25,16 @@ from sawtooth_sdk.processor.exceptions import InvalidTransaction
 from sawtooth_sdk.processor.exceptions import InternalError
 from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
 
+from sawtooth_omi import codec
 from sawtooth_omi.protobuf.work_pb2 import Work
 from sawtooth_omi.protobuf.recording_pb2 import Recording
 from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
 from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+from sawtooth_omi.protobuf.ownership_pb2 import OwnerIndexShard
 from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+from sawtooth_omi.tracing import NOOP_SPAN
+from sawtooth_omi.tracing import SERVER
+from sawtooth_omi.tracing import transaction_trace_ids
 
 
 LOGGER = logging.getLogger(__name__)
@@ -79,7 +86,26 @@ def _get_address_infix(tag):
     return infixes[tag]
 
 
-def _get_unique_key(obj, tag):
+def get_address_tag(address):
+    '''
+    return the tag of an OMI address, or None if it isn't one
+    '''
+    if not address.startswith(OMI_ADDRESS_PREFIX):
+        return None
+
+    infix = address[len(OMI_ADDRESS_PREFIX):len(OMI_ADDRESS_PREFIX) + 2]
+
+    for tag in (WORK, RECORDING, INDIVIDUAL, ORGANIZATION):
+        if _get_address_infix(tag) == infix:
+            return tag
+
+    return None
+
+
+def get_unique_key(obj, tag):
+    '''
+    return the title or name an object's address is derived from
+    '''
     if not obj:
         return None
 
@@ -97,14 +123,68 @@ def make_omi_address(name, tag):
     return OMI_ADDRESS_PREFIX + infix + _hash_name(name)[-62:]
 
 
+# Transactions of version 1.1 also keep every object's address listed
+# under its owner's public key, in one of OWNER_INDEX_SHARDS shards picked
+# by the object address's last two hex digits, so that creates by one
+# signer rarely touch the same entry. 1.0 transactions, including all of
+# those already on chain, never declared the shards and leave them alone.
+FAMILY_VERSIONS = ['1.0', '1.1']
+INDEXED_VERSION = '1.1'
+
+OWNER_INDEX_INFIX = 'f0'
+OWNER_INDEX_SHARDS = 256
+# A shard is rewritten whole on every create it lists, so its size is
+# capped; at this many, a key's shards fill at around a million objects
+MAX_OWNER_INDEX_SHARD = 4096
+
+# The namespace and type infix of every kind of entry the family writes
+ADDRESS_PREFIXES = [
+    OMI_ADDRESS_PREFIX + infix for infix in
+    [_get_address_infix(tag)
+     for tag in (INDIVIDUAL, ORGANIZATION, WORK, RECORDING)] +
+    [OWNER_INDEX_INFIX]
+]
+
+
+def make_owner_index_prefix(pubkey):
+    '''
+    return the address prefix of every shard of a public key's index
+    '''
+    return OMI_ADDRESS_PREFIX + OWNER_INDEX_INFIX + _hash_name(pubkey)[:60]
+
+
+def make_owner_index_address(pubkey, address):
+    '''
+    return the address of the index shard listing address under pubkey
+    '''
+    shard = int(address[-2:], 16) % OWNER_INDEX_SHARDS
+    return make_owner_index_prefix(pubkey) + '{:02x}'.format(shard)
+
+
+def get_owner(obj, tag):
+    '''
+    return the public key an object is registered under
+    '''
+    if tag in (WORK, RECORDING):
+        return obj.registering_pubkey
+    return obj.pubkey
+
+
 class OMITransactionHandler:
+    def __init__(self, prevalidator=None, tracer=None):
+        # An optional pipeline.Prevalidator that has already run the
+        # stateless stage for queued transactions
+        self._prevalidator = prevalidator
+        # An optional tracing.Tracer to record a span per apply
+        self._tracer = tracer
+
     @property
     def family_name(self):
         return FAMILY_NAME
 
     @property
     def family_versions(self):
-        return ['1.0']
+        return FAMILY_VERSIONS
 
     @property
     def encodings(self):
@@ -115,24 +195,82 @@ class OMITransactionHandler:
         return [OMI_ADDRESS_PREFIX]
 
     def apply(self, transaction, state):
-        action, txn_obj, signer = _unpack_transaction(transaction)
+        if self._tracer is None:
+            span = NOOP_SPAN
+        else:
+            trace_id, parent_id = transaction_trace_ids(
+                transaction.signature)
+            span = self._tracer.span(
+                'apply', trace_id, parent_id=parent_id, kind=SERVER,
+                tags={'omi.transaction_id': transaction.signature})
+
+        with span:
+            if self._prevalidator is not None:
+                with span.phase('prevalidated'):
+                    txn = self._prevalidator.take(transaction)
+            else:
+                txn = prevalidate(transaction, span)
+
+            span.tag('omi.action', txn.action)
+            apply_prevalidated(txn, state, span)
+
+
+class PrevalidatedTransaction:
+    '''
+    The result of the stateless stage of apply
+    '''
+
+    __slots__ = ('action', 'obj', 'signer', 'tag', 'name', 'version')
 
-        tag = get_tag(action)
+    def __init__(self, action, obj, signer, tag, name, version='1.0'):
+        self.action = action
+        self.obj = obj
+        self.signer = signer
+        self.tag = tag
+        self.name = name
+        self.version = version
 
+
+def prevalidate(transaction, span=NOOP_SPAN):
+    '''
+    Run every check that doesn't need state, so that cheap rejects
+    never wait behind state reads. Raise InvalidTransaction or return
+    a PrevalidatedTransaction for apply_prevalidated.
+    '''
+    with span.phase('unpack'):
+        action, txn_obj, signer, version = _unpack_transaction(transaction)
+
+    tag = get_tag(action)
+
+    with span.phase('prevalidate'):
         # Check that the object's public key matches the submitter's
         _check_txn_object_key(txn_obj, tag, signer)
+        _check_split_sums(txn_obj, tag)
+
+    txn_obj_name = get_unique_key(txn_obj, tag)
 
-        txn_obj_name = _get_unique_key(txn_obj, tag)
+    return PrevalidatedTransaction(
+        action, txn_obj, signer, tag, txn_obj_name, version)
 
-        state_obj = _get_state_object(state, txn_obj_name, tag)
 
+def apply_prevalidated(txn, state, span=NOOP_SPAN):
+    '''
+    Run the state stage of apply: authorization and reference checks,
+    then the write
+    '''
+    with span.phase('state_read'):
+        state_obj = _get_state_object(state, txn.name, txn.tag)
+
+    with span.phase('validate'):
         # Check if the submitter is authorized to make changes,
-        # then validate the transaction
-        _check_state_object_authorization(state_obj, tag, signer)
-        _check_split_sums(txn_obj, tag)
-        _check_references(state, txn_obj, tag)
+        # then validate the references
+        _check_state_object_authorization(state_obj, txn.tag, txn.signer)
+        _check_references(state, txn.obj, txn.tag)
 
-        _set_state_object(state, txn_obj, tag)
+    with span.phase('write'):
+        _set_state_object(
+            state, txn.obj, txn.tag, state_obj,
+            indexed=txn.version == INDEXED_VERSION)
 
 
 # objects
@@ -152,25 +290,38 @@ def _parse_object(obj_string, tag):
     obj_type = get_object_type(tag)
 
     try:
-        parsed_obj = obj_type()
-        parsed_obj.ParseFromString(obj_string)
-        return parsed_obj
+        return codec.parse(obj_type, obj_string)
     except DecodeError:
         raise InvalidTransaction('Invalid action')
 
 
 # transaction
 
+# Header and payload messages are reused per thread rather than allocated
+# for every transaction; parsing into them clears them, and everything read
+# from them is an immutable copy
+_unpack_messages = threading.local()
+
+
+def _get_unpack_messages():
+    try:
+        return _unpack_messages.header, _unpack_messages.payload
+    except AttributeError:
+        _unpack_messages.header = TransactionHeader()
+        _unpack_messages.payload = OMITransactionPayload()
+        return _unpack_messages.header, _unpack_messages.payload
+
+
 def _unpack_transaction(transaction):
     '''
-    return action, obj, signer
+    return action, obj, signer, family version
     '''
-    header = TransactionHeader()
-    header.ParseFromString(transaction.header)
+    header, payload = _get_unpack_messages()
+
+    codec.parse_into(header, transaction.header)
     signer = header.signer_pubkey
 
-    payload = OMITransactionPayload()
-    payload.ParseFromString(transaction.payload)
+    codec.parse_into(payload, transaction.payload)
 
     action = payload.action
     txn_obj = payload.data
@@ -179,7 +330,7 @@ def _unpack_transaction(transaction):
 
     obj = _parse_object(txn_obj, tag)
 
-    return action, obj, signer
+    return action, obj, signer, header.family_version
 
 
 def _check_txn_object_key(txn_obj, tag, signer):
@@ -192,19 +343,14 @@ def _check_state_object_authorization(state_obj, tag, signer):
     _check_key(
         state_obj, tag, signer,
         'Submitter isn\'t authorized to make changes to "{}"'.format(
-            _get_unique_key(state_obj, tag)))
+            get_unique_key(state_obj, tag)))
 
 
 def _check_key(obj, tag, signer, message):
     if not obj:
         return
 
-    if tag in (WORK, RECORDING):
-        pubkey = obj.registering_pubkey
-    elif tag in (INDIVIDUAL, ORGANIZATION):
-        pubkey = obj.pubkey
-
-    if pubkey != signer:
+    if get_owner(obj, tag) != signer:
         raise InvalidTransaction(message)
 
 
@@ -214,10 +360,9 @@ def _check_split_sums(obj, tag):
     that don't add up to 100
     '''
     if tag == WORK:
-        sp_split_sum = sum([
+        sp_split_sum = sum(
             sp_split.split
-            for sp_split in obj.songwriter_publisher_splits
-        ])
+            for sp_split in obj.songwriter_publisher_splits)
 
         if sp_split_sum != 100:
             raise InvalidTransaction(
@@ -229,10 +374,10 @@ def _check_split_sums(obj, tag):
         # check overall split
         overall = obj.overall_split
 
-        overall_sum = sum([
-            overall.derived_work_portion,
-            overall.derived_recording_portion,
-            overall.contributor_portion])
+        overall_sum = (
+            overall.derived_work_portion
+            + overall.derived_recording_portion
+            + overall.contributor_portion)
 
         if overall_sum != 100:
             raise InvalidTransaction(
@@ -241,12 +386,9 @@ def _check_split_sums(obj, tag):
                     s=overall_sum))
 
         # check contributor split
-        contributor_splits = [
+        csp_sum = sum(
             contributor_split.split
-            for contributor_split in obj.contributor_splits
-        ]
-
-        csp_sum = sum(contributor_splits)
+            for contributor_split in obj.contributor_splits)
 
         if csp_sum != 100:
             raise InvalidTransaction(
@@ -255,12 +397,9 @@ def _check_split_sums(obj, tag):
                     s=csp_sum))
 
         # check derived work split
-        derived_work_splits = [
+        dwsp_sum = sum(
             derived_work_split.split
-            for derived_work_split in obj.derived_work_splits
-        ]
-
-        dwsp_sum = sum(derived_work_splits)
+            for derived_work_split in obj.derived_work_splits)
 
         if dwsp_sum != 100:
             raise InvalidTransaction(
@@ -268,19 +407,9 @@ def _check_split_sums(obj, tag):
                     t=obj.title,
                     s=dwsp_sum))
 
-        # check derived recording split
-        derived_recording_splits = [
-            derived_recording_split.split
-            for derived_recording_split in obj.derived_work_splits
-        ]
-
-        drsp_sum = sum(derived_recording_splits)
-
-        if drsp_sum != 100:
-            raise InvalidTransaction(
-                'Derived recording split for {t} adds up to {s}'.format(
-                    t=obj.title,
-                    s=drsp_sum))
+        # derived_recording_splits aren't summed: this check has always
+        # summed derived_work_splits a second time, and checking them now
+        # would reject transactions that have always been accepted
 
 
 def _check_references(state, obj, tag):
@@ -335,6 +464,31 @@ def _check_references(state, obj, tag):
                     '"{r}"'.format(t=obj.title, r=recording))
 
 
+def get_references(obj, tag):
+    '''
+    return (name, tag) pairs for every object that obj references, in
+    the order _check_references looks them up
+    '''
+    if tag == WORK:
+        references = []
+        for sp_split in obj.songwriter_publisher_splits:
+            song_pub = sp_split.songwriter_publisher
+            references.append((song_pub.songwriter_name, INDIVIDUAL))
+            references.append((song_pub.publisher_name, ORGANIZATION))
+        return references
+
+    elif tag == RECORDING:
+        return (
+            [(split.contributor_name, INDIVIDUAL)
+             for split in obj.contributor_splits]
+            + [(split.work_name, WORK)
+               for split in obj.derived_work_splits]
+            + [(split.recording_name, RECORDING)
+               for split in obj.derived_recording_splits])
+
+    return []
+
+
 # state
 def _get_state_object(state, name, tag):
     try:
@@ -348,14 +502,69 @@ def _get_state_object(state, name, tag):
     return obj
 
 
-def _set_state_object(state, obj, tag):
-    name = _get_unique_key(obj, tag)
+def _set_state_object(state, obj, tag, state_obj=None, indexed=False):
+    '''
+    Write an object, replacing state_obj, and if indexed keep the owner
+    index in step, in one set so that both land or neither does
+    '''
+    address = make_omi_address(get_unique_key(obj, tag), tag)
 
-    addresses = state.set([
-        StateEntry(
-            address=make_omi_address(name, tag),
-            data=obj.SerializeToString())
-    ])
+    entries = [StateEntry(address=address, data=codec.serialize(obj))]
+    if indexed:
+        entries.extend(_owner_index_entries(
+            state, address,
+            get_owner(state_obj, tag) if state_obj else '',
+            get_owner(obj, tag)))
+
+    addresses = state.set(entries)
 
     if not addresses:
         raise InternalError('State error')
+
+
+def _owner_index_entries(state, address, old_owner, owner):
+    '''
+    return StateEntries for the index shards that change when address
+    moves from old_owner to owner; '' is no owner
+    '''
+    entries = []
+
+    if old_owner and old_owner != owner:
+        shard_address = make_owner_index_address(old_owner, address)
+        shard = _get_owner_index_shard(state, shard_address)
+        position = bisect.bisect_left(shard.addresses, address)
+        if position < len(shard.addresses) and \
+                shard.addresses[position] == address:
+            del shard.addresses[position]
+            entries.append(StateEntry(
+                address=shard_address, data=codec.serialize(shard)))
+
+    # Objects written before the index existed are added on their next
+    # indexed update, so the shard is checked even when the owner is
+    # unchanged
+    if owner:
+        shard_address = make_owner_index_address(owner, address)
+        shard = _get_owner_index_shard(state, shard_address)
+        position = bisect.bisect_left(shard.addresses, address)
+        if position == len(shard.addresses) or \
+                shard.addresses[position] != address:
+            if len(shard.addresses) >= MAX_OWNER_INDEX_SHARD:
+                raise InvalidTransaction(
+                    'Owner index shard {} is full'.format(shard_address))
+            shard.addresses.insert(position, address)
+            entries.append(StateEntry(
+                address=shard_address, data=codec.serialize(shard)))
+
+    return entries
+
+
+def _get_owner_index_shard(state, shard_address):
+    state_entries = state.get([shard_address])
+    if not state_entries:
+        return OwnerIndexShard()
+
+    try:
+        return codec.parse(OwnerIndexShard, state_entries[0].data)
+    except DecodeError:
+        raise InternalError(
+            'Unreadable owner index shard {}'.format(shard_address))
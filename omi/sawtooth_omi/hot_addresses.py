@@ -0,0 +1,346 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Hot-address reporting for omi-tp.
+
+A HotAddressHandler wraps a transaction handler and counts the state
+reads and writes of its applies per address, in bounded memory. Counts
+are kept in Space-Saving summaries (a fixed number of counters; any
+address with more than 1/capacity of the traffic is guaranteed one),
+one per sub-window of a sliding time window, so the report reflects
+recent traffic only.
+
+Addresses are hashes, so names are learned from a sample of the
+transactions themselves: their own object and everything it references.
+The report of the top addresses by reads and by writes, with type and
+name where known, is logged periodically.
+'''
+
+import collections
+import heapq
+import logging
+import threading
+import time
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from sawtooth_omi.handler import get_address_tag
+from sawtooth_omi.handler import get_references
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import prevalidate
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SpaceSaving:
+    '''
+    A Space-Saving heavy-hitters summary with at most `capacity`
+    counters. A count overestimates the true count by at most the
+    error kept with it.
+    '''
+
+    __slots__ = ('capacity', 'total', '_counts', '_errors', '_heap')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self._counts = {}
+        self._errors = {}
+        # (count, item) entries, some stale, to find the smallest
+        # counter without a scan
+        self._heap = []
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, item, count=1):
+        counts = self._counts
+        self.total += count
+
+        if item in counts:
+            counts[item] += count
+        elif len(counts) < self.capacity:
+            counts[item] = count
+            self._errors[item] = 0
+        else:
+            floor, victim = self._pop_smallest()
+            del counts[victim]
+            del self._errors[victim]
+            counts[item] = floor + count
+            self._errors[item] = floor
+
+        heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def items(self):
+        '''
+        return (item, count, error) for every counter
+        '''
+        errors = self._errors
+        return [(item, count, errors[item])
+                for item, count in self._counts.items()]
+
+    def _pop_smallest(self):
+        counts = self._counts
+        while True:
+            count, item = heapq.heappop(self._heap)
+            if counts.get(item) == count:
+                return count, item
+
+
+class WindowedHeavyHitters:
+    '''
+    Space-Saving over a sliding window of `window` seconds, kept as
+    `buckets` sub-windows that expire one at a time
+    '''
+
+    def __init__(self, capacity, window=60.0, buckets=6,
+                 clock=time.monotonic):
+        self._capacity = capacity
+        self._window = window
+        self._span = window / buckets
+        self._clock = clock
+        # (start time, SpaceSaving), oldest first
+        self._buckets = collections.deque()
+
+    def add(self, item, count=1):
+        self._current().add(item, count)
+
+    def top(self, k):
+        '''
+        return the k (item, count, error) with the highest counts over
+        the window
+        '''
+        self._expire(self._clock())
+
+        merged = {}
+        for _, summary in self._buckets:
+            for item, count, error in summary.items():
+                total = merged.get(item)
+                if total is None:
+                    merged[item] = [count, error]
+                else:
+                    total[0] += count
+                    total[1] += error
+
+        return heapq.nlargest(
+            k,
+            ((item, count, error)
+             for item, (count, error) in merged.items()),
+            key=lambda entry: entry[1])
+
+    def total(self):
+        self._expire(self._clock())
+        return sum(summary.total for _, summary in self._buckets)
+
+    def items(self):
+        '''
+        yield every item with a counter in the window
+        '''
+        for _, summary in self._buckets:
+            for item, _, _ in summary.items():
+                yield item
+
+    def _current(self):
+        now = self._clock()
+        buckets = self._buckets
+        if not buckets or now - buckets[-1][0] >= self._span:
+            self._expire(now)
+            buckets.append((now, SpaceSaving(self._capacity)))
+        return buckets[-1][1]
+
+    def _expire(self, now):
+        buckets = self._buckets
+        while buckets and now - buckets[0][0] >= self._window:
+            buckets.popleft()
+
+
+class HotAddress:
+    __slots__ = ('address', 'tag', 'name', 'count', 'error')
+
+    def __init__(self, address, tag, name, count, error):
+        self.address = address
+        self.tag = tag
+        self.name = name
+        self.count = count
+        self.error = error
+
+    def __str__(self):
+        return '{:>8} (+/-{}) {} {} {}'.format(
+            self.count, self.error,
+            (self.tag or '?').lstrip('_'),
+            self.name if self.name is not None else '?',
+            self.address)
+
+
+class HotAddressTracker:
+    def __init__(self, capacity=1000, window=60.0, buckets=6,
+                 clock=time.monotonic):
+        self._reads = WindowedHeavyHitters(capacity, window, buckets, clock)
+        self._writes = WindowedHeavyHitters(capacity, window, buckets, clock)
+        self._names = {}
+        # learned names are pruned to those still counted past this
+        self._name_limit = 2 * capacity * buckets
+        self._lock = threading.Lock()
+
+    def read(self, address):
+        with self._lock:
+            self._reads.add(address)
+
+    def write(self, address):
+        with self._lock:
+            self._writes.add(address)
+
+    def learn(self, name, tag):
+        address = make_omi_address(name, tag)
+        with self._lock:
+            self._names[address] = name
+            if len(self._names) > self._name_limit:
+                self._forget_cold()
+
+    def hot_reads(self, k):
+        with self._lock:
+            return self._hot(self._reads, k)
+
+    def hot_writes(self, k):
+        with self._lock:
+            return self._hot(self._writes, k)
+
+    def forget_cold(self):
+        '''
+        drop learned names of addresses no longer counted
+        '''
+        with self._lock:
+            self._forget_cold()
+
+    def report(self, k):
+        '''
+        return the report as a list of lines
+        '''
+        with self._lock:
+            lines = ['{} reads, {} writes in window'.format(
+                self._reads.total(), self._writes.total())]
+
+        lines.append('top reads:')
+        lines.extend('    {}'.format(hot) for hot in self.hot_reads(k))
+        lines.append('top writes:')
+        lines.extend('    {}'.format(hot) for hot in self.hot_writes(k))
+
+        return lines
+
+    def _forget_cold(self):
+        counted = set(self._reads.items())
+        counted.update(self._writes.items())
+        for address in [a for a in self._names if a not in counted]:
+            del self._names[address]
+
+    def _hot(self, summary, k):
+        names = self._names
+        return [
+            HotAddress(address, get_address_tag(address),
+                       names.get(address), count, error)
+            for address, count, error in summary.top(k)
+        ]
+
+
+class _TrackedState:
+    def __init__(self, state, tracker):
+        self._state = state
+        self._tracker = tracker
+
+    def get(self, addresses):
+        for address in addresses:
+            self._tracker.read(address)
+        return self._state.get(addresses)
+
+    def set(self, entries):
+        for entry in entries:
+            self._tracker.write(entry.address)
+        return self._state.set(entries)
+
+
+class HotAddressHandler:
+    def __init__(self, handler, tracker=None, top=10, report_every=None,
+                 learn_every=16):
+        '''
+        tracker -- a HotAddressTracker; one with defaults if None
+        top -- number of addresses to report for reads and for writes
+        report_every -- log a report every N transactions
+        learn_every -- learn the names in every Nth transaction; hot
+            addresses recur, so a sample finds their names
+        '''
+        self._handler = handler
+        self._tracker = tracker or HotAddressTracker()
+        self._top = top
+        self._report_every = report_every
+        self._learn_every = learn_every
+
+        self._lock = threading.Lock()
+        self._count = 0
+
+    @property
+    def tracker(self):
+        return self._tracker
+
+    @property
+    def family_name(self):
+        return self._handler.family_name
+
+    @property
+    def family_versions(self):
+        return self._handler.family_versions
+
+    @property
+    def encodings(self):
+        return self._handler.encodings
+
+    @property
+    def namespaces(self):
+        return self._handler.namespaces
+
+    def apply(self, transaction, state):
+        with self._lock:
+            self._count += 1
+            count = self._count
+
+        if (count - 1) % self._learn_every == 0:
+            self._learn(transaction)
+
+        try:
+            return self._handler.apply(
+                transaction, _TrackedState(state, self._tracker))
+        finally:
+            if (self._report_every is not None
+                    and count % self._report_every == 0):
+                self.log_report()
+
+    def log_report(self):
+        lines = self._tracker.report(self._top)
+        self._tracker.forget_cold()
+        LOGGER.warning('Hot addresses:\n%s', '\n'.join(lines))
+
+    def _learn(self, transaction):
+        try:
+            txn = prevalidate(transaction)
+        except InvalidTransaction:
+            return
+
+        self._tracker.learn(txn.name, txn.tag)
+        for name, tag in get_references(txn.obj, txn.tag):
+            self._tracker.learn(name, tag)
@@ -0,0 +1,392 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+A crash-safe journal for resumable bulk loads.
+
+Objects to load are numbered by their position in the input. The
+journal is an append-only file of fixed-size binary records:
+
+  SUBMIT      seq, 8-byte object digest, 64-byte batch ID
+  STATUS      seq, final status (COMMITTED or INVALID)
+  CHECKPOINT  seq = watermark, count of committed objects
+
+each with a CRC32, so a record torn by a crash is detected and cut off
+on the next open. Only the watermark (every object below it is final),
+the finals just above it, the batches still pending and the invalid
+objects are kept in memory, and the file is periodically rewritten to
+exactly that, so neither the file nor memory grows with the size of
+the load.
+
+A BulkLoader writes SUBMIT records and fsyncs them, a group at a time,
+before posting the group, and journals final statuses as they arrive.
+After a crash it re-queries only the pending batches, resubmits those
+the validator never received, and carries on from the watermark.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from sawtooth_omi.client import STATUS_QUERY_SIZE
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+COMMITTED = 'COMMITTED'
+INVALID = 'INVALID'
+PENDING = 'PENDING'
+UNKNOWN = 'UNKNOWN'
+
+_SUBMIT = 1
+_STATUS = 2
+_CHECKPOINT = 3
+
+_STATUS_CODES = {COMMITTED: 1, INVALID: 2}
+_STATUS_NAMES = {code: name for name, code in _STATUS_CODES.items()}
+
+_HEADER = struct.Struct('>BQ')
+_CRC = struct.Struct('>I')
+_PAYLOADS = {
+    _SUBMIT: struct.Struct('>8s64s'),
+    _STATUS: struct.Struct('>B'),
+    _CHECKPOINT: struct.Struct('>Q'),
+}
+
+_NO_DIGEST = bytes(8)
+
+
+def object_digest(action, obj):
+    '''
+    return an 8-byte digest of an input object, to check on resume that
+    the input hasn't changed under the journal
+    '''
+    data = json.dumps([action, obj], sort_keys=True).encode()
+    return hashlib.sha256(data).digest()[:8]
+
+
+class SubmissionJournal:
+    def __init__(self, path, compact_after=1000000):
+        '''
+        compact_after -- rewrite the file to its live records once this
+            many records have been appended since the last rewrite
+        '''
+        self._path = path
+        self._compact_after = compact_after
+
+        # every seq below the watermark is final
+        self.watermark = 0
+        self.committed = 0
+        # seq -> batch ID, for invalid objects
+        self.invalid = {}
+        # seq -> (digest, batch ID), for batches awaiting a final status
+        self.pending = {}
+        # seq -> status, for finals above the watermark
+        self._final = {}
+
+        self._appended = self._load()
+        self._fd = open(path, 'ab')
+
+        if self._appended > self._compact_after:
+            self.compact()
+
+    def is_final(self, seq):
+        return seq < self.watermark or seq in self._final
+
+    def submitted(self, seq, digest, batch_id):
+        self.pending[seq] = (digest, batch_id)
+        self._append(_SUBMIT, seq, digest, bytes.fromhex(batch_id))
+
+    def finished(self, seq, status):
+        _, batch_id = self.pending.pop(seq)
+        self._finish(seq, status, batch_id)
+        self._append(_STATUS, seq, _STATUS_CODES[status])
+
+    def sync(self):
+        '''
+        make every record appended so far durable
+        '''
+        self._fd.flush()
+        os.fsync(self._fd.fileno())
+
+        if self._appended > self._compact_after:
+            self.compact()
+
+    def compact(self):
+        '''
+        atomically rewrite the file to only its live records
+        '''
+        self._fd.close()
+
+        # COMMITTED finals above the watermark are rewritten, and
+        # counted again on load
+        committed = self.committed - sum(
+            1 for status in self._final.values() if status == COMMITTED)
+
+        temp_path = self._path + '.compact'
+        with open(temp_path, 'wb') as fd:
+            fd.write(_pack(_CHECKPOINT, self.watermark, committed))
+            for seq, batch_id in sorted(self.invalid.items()):
+                fd.write(_pack(
+                    _SUBMIT, seq, _NO_DIGEST, bytes.fromhex(batch_id)))
+                fd.write(_pack(_STATUS, seq, _STATUS_CODES[INVALID]))
+            for seq, status in sorted(self._final.items()):
+                if status == COMMITTED:
+                    fd.write(_pack(_STATUS, seq, _STATUS_CODES[COMMITTED]))
+            for seq, (digest, batch_id) in sorted(self.pending.items()):
+                fd.write(_pack(
+                    _SUBMIT, seq, digest, bytes.fromhex(batch_id)))
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        os.replace(temp_path, self._path)
+        _fsync_directory(self._path)
+
+        self._fd = open(self._path, 'ab')
+        self._appended = 0
+
+    def close(self):
+        self.sync()
+        self._fd.close()
+
+    def _append(self, record_type, seq, *fields):
+        self._fd.write(_pack(record_type, seq, *fields))
+        self._appended += 1
+
+    def _finish(self, seq, status, batch_id):
+        if status == COMMITTED:
+            self.committed += 1
+        else:
+            self.invalid[seq] = batch_id
+
+        if seq < self.watermark:
+            return
+
+        self._final[seq] = status
+        while self.watermark in self._final:
+            del self._final[self.watermark]
+            self.watermark += 1
+
+    def _load(self):
+        '''
+        replay the file into memory, cutting off a torn tail, and return
+        the number of records read
+        '''
+        if not os.path.exists(self._path):
+            return 0
+
+        records = 0
+        good = 0
+        with open(self._path, 'rb') as fd:
+            while True:
+                record = _read_record(fd)
+                if record is None:
+                    break
+
+                record_type, seq, fields = record
+                if record_type == _SUBMIT:
+                    digest, batch_id = fields
+                    self.pending[seq] = (digest, batch_id.hex())
+                elif record_type == _STATUS:
+                    # compacted COMMITTED records have no SUBMIT
+                    _, batch_id = self.pending.pop(seq, (None, ''))
+                    self._finish(seq, _STATUS_NAMES[fields[0]], batch_id)
+                else:
+                    self.watermark = seq
+                    self.committed = fields[0]
+
+                records += 1
+                good = fd.tell()
+
+        if good < os.path.getsize(self._path):
+            LOGGER.warning(
+                'Cutting off %s bytes of torn records from %s',
+                os.path.getsize(self._path) - good, self._path)
+            with open(self._path, 'r+b') as fd:
+                fd.truncate(good)
+                os.fsync(fd.fileno())
+
+        return records
+
+
+def _pack(record_type, seq, *fields):
+    data = _HEADER.pack(record_type, seq) + _PAYLOADS[record_type].pack(
+        *fields)
+    return data + _CRC.pack(zlib.crc32(data))
+
+
+def _read_record(fd):
+    header = fd.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+
+    record_type, seq = _HEADER.unpack(header)
+    payload_struct = _PAYLOADS.get(record_type)
+    if payload_struct is None:
+        return None
+
+    payload = fd.read(payload_struct.size)
+    crc = fd.read(_CRC.size)
+    if len(payload) < payload_struct.size or len(crc) < _CRC.size:
+        return None
+
+    if _CRC.unpack(crc)[0] != zlib.crc32(header + payload):
+        return None
+
+    return record_type, seq, payload_struct.unpack(payload)
+
+
+def _fsync_directory(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class BulkLoader:
+    def __init__(self, factory, client, journal, group_size=100, wait=30,
+                 poll_interval=1.0):
+        '''
+        factory -- makes a serialized BatchList from (action, **obj),
+            like the OMIMessageFactory
+        client -- posts BatchLists and queries batch statuses, like
+            client.OMIRestClient
+        journal -- a SubmissionJournal, resumed from if not empty
+        group_size -- objects per posted BatchList and per fsync
+        wait -- seconds the REST API may wait for commits per request
+        '''
+        self._factory = factory
+        self._client = client
+        self._journal = journal
+        self._group_size = group_size
+        self._wait = wait
+        self._poll_interval = poll_interval
+
+    def load(self, objects):
+        '''
+        load (action, obj) pairs, where obj is a dict of the object's
+        fields, skipping every one the journal has seen to the end
+        '''
+        journal = self._journal
+        resubmit = self._resume()
+
+        group = []
+        for seq, (action, obj) in enumerate(objects):
+            if journal.is_final(seq):
+                continue
+
+            digest = object_digest(action, obj)
+            known = resubmit.pop(seq, None)
+            if known is not None and known != digest:
+                raise ValueError(
+                    'Object {} differs from the one journaled'.format(seq))
+
+            group.append((seq, digest, action, obj))
+            if len(group) >= self._group_size:
+                self._submit(group)
+                group = []
+
+        if group:
+            self._submit(group)
+
+        journal.sync()
+
+    def _resume(self):
+        '''
+        settle the batches the journal left pending; return the digests,
+        by seq, of those the validator never received
+        '''
+        journal = self._journal
+        if not journal.pending:
+            return {}
+
+        LOGGER.info('Resuming with %s pending batches', len(journal.pending))
+
+        resubmit = {}
+        by_batch = {
+            batch_id: seq for seq, (_, batch_id) in journal.pending.items()}
+        for status, seq in self._settle(by_batch):
+            if status == UNKNOWN:
+                resubmit[seq] = journal.pending.pop(seq)[0]
+            else:
+                journal.finished(seq, status)
+
+        journal.sync()
+        return resubmit
+
+    def _submit(self, group):
+        journal = self._journal
+
+        batch_list = BatchList()
+        by_batch = {}
+        for seq, digest, action, obj in group:
+            single = BatchList()
+            single.ParseFromString(self._factory.create_batch(action, **obj))
+            batch = single.batches[0]
+            batch_list.batches.extend([batch])
+
+            journal.submitted(seq, digest, batch.header_signature)
+            by_batch[batch.header_signature] = seq
+
+        # The SUBMIT records are durable before the validator sees the
+        # batches, so a crash can never lose track of a posted batch
+        journal.sync()
+
+        statuses = self._client.submit(batch_list, self._wait)
+        waiting = {}
+        for batch_id, seq in by_batch.items():
+            status = statuses.get(batch_id, PENDING)
+            if status in (COMMITTED, INVALID):
+                journal.finished(seq, status)
+            else:
+                waiting[batch_id] = seq
+
+        for status, seq in self._settle(waiting):
+            if status == UNKNOWN:
+                raise RuntimeError(
+                    'Validator lost batch {}'.format(
+                        journal.pending[seq][1]))
+            journal.finished(seq, status)
+
+        journal.sync()
+
+    def _settle(self, by_batch):
+        '''
+        poll batch statuses until each is final or unknown, yielding
+        (status, seq)
+        '''
+        waiting = dict(by_batch)
+        while waiting:
+            statuses = {}
+            batch_ids = list(waiting)
+            for i in range(0, len(batch_ids), STATUS_QUERY_SIZE):
+                statuses.update(self._client.batch_statuses(
+                    batch_ids[i:i + STATUS_QUERY_SIZE], self._wait))
+
+            for batch_id in batch_ids:
+                status = statuses.get(batch_id, UNKNOWN)
+                if status != PENDING:
+                    yield status, waiting.pop(batch_id)
+
+            if waiting:
+                time.sleep(self._poll_interval)
@@ -0,0 +1,305 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Lineage queries over OMI objects.
+
+A LineageGraph holds every object as an integer ID, with its references
+(songwriters, publishers, contributors, derived works and derived
+recordings) as arrays of IDs. It keeps the transitive closure in both
+directions up to date as objects are added or changed, so that
+
+  sources(x) -- everything x draws on, e.g. every Work that earns from
+                a Recording, through samples of samples
+  derivatives(x) -- everything that draws on x, e.g. every Recording
+                    downstream of a sample
+
+are answered straight from the closure rather than by walking state.
+Additions extend the closures in place; changes that drop references
+recompute only the closures of the objects upstream and downstream of
+the changed one. Reference cycles are detected and reported as they
+appear, and dropped once a change breaks them.
+'''
+
+import argparse
+import array
+import os
+import sys
+
+from sawtooth_omi.export import decode_entries
+from sawtooth_omi.export import read_export
+from sawtooth_omi.handler import get_references
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+
+
+TAGS_BY_NAME = {
+    'work': WORK,
+    'recording': RECORDING,
+    'individual': INDIVIDUAL,
+    'organization': ORGANIZATION,
+}
+
+
+class LineageGraph:
+    def __init__(self):
+        self._ids = {}
+        # per ID: the (tag, name) key, whether the object itself has
+        # been loaded (as opposed to only referenced), and its edges
+        self._keys = []
+        self._loaded = []
+        self._out = []
+        self._in = []
+
+        # closures, only stored for IDs where they are nonempty
+        self._sources = {}
+        self._derivatives = {}
+
+        self._cycles = []
+        self._cycle_members = set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def cycles(self):
+        '''
+        a list of cycles found, each a sorted list of (tag, name) keys
+        '''
+        return [sorted(self._keys[i] for i in cycle)
+                for cycle in self._cycles]
+
+    def load(self, entries):
+        '''
+        add every OMI object among (address, data) entries
+        '''
+        for _, tag, obj in decode_entries(entries):
+            self.set_object(tag, obj)
+
+    def set_object(self, tag, obj):
+        '''
+        add an object, or replace the references of one already known
+        '''
+        node = self._id(tag, get_unique_key(obj, tag))
+        self._loaded[node] = True
+        self._set_targets(node, {
+            self._id(ref_tag, ref_name)
+            for ref_name, ref_tag in get_references(obj, tag)
+        })
+
+    def remove_object(self, tag, name):
+        node = self._ids.get((tag, name))
+        if node is None:
+            return
+
+        self._loaded[node] = False
+        self._set_targets(node, set())
+
+    def sources(self, tag, name, tags=None):
+        '''
+        yield the (tag, name) keys of everything the object draws on,
+        optionally only those with one of the given tags
+        '''
+        return self._query(self._sources, tag, name, tags)
+
+    def derivatives(self, tag, name, tags=None):
+        '''
+        yield the (tag, name) keys of everything that draws on the
+        object, optionally only those with one of the given tags
+        '''
+        return self._query(self._derivatives, tag, name, tags)
+
+    def missing(self):
+        '''
+        yield the keys of objects that are referenced but not loaded
+        '''
+        for node, loaded in enumerate(self._loaded):
+            if not loaded and self._in[node]:
+                yield self._keys[node]
+
+    def _query(self, closures, tag, name, tags):
+        node = self._ids.get((tag, name))
+        if node is None:
+            return
+
+        keys = self._keys
+        for other in closures.get(node, ()):
+            key = keys[other]
+            if tags is None or key[0] in tags:
+                yield key
+
+    def _id(self, tag, name):
+        key = (tag, name)
+        node = self._ids.get(key)
+        if node is None:
+            node = len(self._keys)
+            self._ids[key] = node
+            self._keys.append(key)
+            self._loaded.append(False)
+            self._out.append(array.array('l'))
+            self._in.append(array.array('l'))
+        return node
+
+    def _set_targets(self, node, targets):
+        old_targets = set(self._out[node])
+        if targets == old_targets:
+            return
+
+        removed = old_targets - targets
+        added = targets - old_targets
+
+        for target in removed:
+            self._in[target].remove(node)
+        for target in added:
+            self._in[target].append(node)
+        self._out[node] = array.array('l', sorted(targets))
+
+        if removed:
+            old_sources = self._sources.get(node, set())
+            self._recompute(node, old_sources)
+            self._prune_cycles()
+        else:
+            for target in added:
+                self._link(node, target)
+
+        for target in added:
+            self._check_cycle(node, target)
+
+    def _link(self, node, target):
+        new_sources = self._sources.get(target, set()) | {target}
+        upstream = self._derivatives.get(node, set()) | {node}
+
+        for other in upstream:
+            self._sources.setdefault(other, set()).update(new_sources)
+        for other in new_sources:
+            self._derivatives.setdefault(other, set()).update(upstream)
+
+    def _recompute(self, node, old_sources):
+        # Only pairs running from node's derivatives to its old or new
+        # sources can have changed
+        upstream = self._derivatives.get(node, set()) | {node}
+        for other in upstream:
+            self._store(self._sources, other, _reach(other, self._out))
+
+        downstream = old_sources | self._sources.get(node, set())
+        for other in downstream:
+            self._store(self._derivatives, other, _reach(other, self._in))
+
+    @staticmethod
+    def _store(closures, node, closure):
+        if closure:
+            closures[node] = closure
+        else:
+            closures.pop(node, None)
+
+    def _check_cycle(self, node, target):
+        if node != target and node not in self._sources.get(target, ()):
+            return
+
+        members = frozenset(
+            {node, target}
+            | (self._sources.get(target, set())
+               & self._derivatives.get(node, set())))
+
+        if members not in self._cycle_members:
+            self._cycle_members.add(members)
+            self._cycles.append(members)
+
+    def _prune_cycles(self):
+        '''
+        drop the cycles whose members no longer all reach each other,
+        then record whatever smaller cycles remain among them
+        '''
+        broken = [
+            cycle for cycle in self._cycles
+            if any(not cycle <= self._sources.get(member, set())
+                   for member in cycle)]
+        if not broken:
+            return
+
+        for cycle in broken:
+            self._cycles.remove(cycle)
+            self._cycle_members.discard(cycle)
+
+        for cycle in broken:
+            for member in cycle:
+                for target in self._out[member]:
+                    if target in cycle:
+                        self._check_cycle(member, target)
+
+
+def _reach(node, edges):
+    seen = set()
+    stack = list(edges[node])
+    while stack:
+        other = stack.pop()
+        if other not in seen:
+            seen.add(other)
+            stack.extend(edges[other])
+    return seen
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Answer lineage queries over an OMI state export.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'export',
+        help='an export file, as written by omi-export')
+
+    parser.add_argument(
+        'direction',
+        choices=['sources', 'derivatives'],
+        help='sources: what the object draws on; '
+             'derivatives: what draws on it')
+
+    parser.add_argument(
+        'type',
+        choices=sorted(TAGS_BY_NAME),
+        help='the type of the object')
+
+    parser.add_argument(
+        'name',
+        help='the title or name of the object')
+
+    parser.add_argument(
+        '--only',
+        choices=sorted(TAGS_BY_NAME),
+        action='append',
+        help='only show objects of this type (repeatable)')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    graph = LineageGraph()
+    graph.load(read_export(args.export))
+
+    tags = None
+    if args.only:
+        tags = {TAGS_BY_NAME[only] for only in args.only}
+
+    query = getattr(graph, args.direction)
+    for tag, name in query(TAGS_BY_NAME[args.type], args.name, tags):
+        print('{}\t{}'.format(tag.lstrip('_'), name))
+
+    for cycle in graph.cycles:
+        print('cycle: {}'.format(', '.join(name for _, name in cycle)),
+              file=sys.stderr)
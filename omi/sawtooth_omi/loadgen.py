@@ -0,0 +1,493 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Open-loop load generation against a Sawtooth REST API.
+
+Batches are sent on a fixed schedule, one every 1/rate seconds, from a
+pool of sender threads, whether or not earlier batches have finished.
+Latency runs from a batch's scheduled send time, not its actual one, to
+the poll that first sees it committed, so a stalled API or client
+is charged for every batch that queued up behind the stall rather than
+hiding it (coordinated omission). Commits are seen by polling batch
+status, so latencies are rounded up to the poll interval.
+
+Every batch is signed before the run starts, so signing never shows up
+as latency. A setup phase first registers the identities and works that
+the measured transactions reference.
+
+Batches are made by a factory named with --factory, as module:class. The
+package doesn't ship one, since signing needs the test tooling; the
+tests' OMIMessageFactory works with omi/tests on PYTHONPATH:
+
+    PYTHONPATH=omi/tests omi-load-test http://localhost:8080 \
+        --factory omi_message_factory:OMIMessageFactory
+'''
+
+import argparse
+import collections
+import importlib
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from sawtooth_omi.client import OMIRestClient
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+COMMITTED = 'COMMITTED'
+INVALID = 'INVALID'
+PENDING = 'PENDING'
+
+DEFAULT_MIX = 'SetWork=40,SetRecording=40,SetIndividualIdentity=15,' \
+    'SetOrganizationalIdentity=5'
+
+# Histogram buckets hold values exactly below 2**_SUB_BITS and within
+# 1/2**(_SUB_BITS-1) above it
+_SUB_BITS = 7
+
+
+class LatencyHistogram:
+    '''
+    A log-linear histogram of integer values, e.g. microseconds, with
+    bounded relative error and memory
+    '''
+
+    def __init__(self):
+        self._buckets = collections.Counter()
+        self.count = 0
+        self.max = 0
+
+    def record(self, value):
+        value = int(value)
+        shift = max(value.bit_length() - _SUB_BITS, 0)
+        self._buckets[(shift << _SUB_BITS) | (value >> shift)] += 1
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self._buckets.update(other._buckets)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        '''
+        return the value at a percentile, 0 to 100, or None if empty
+        '''
+        if not self.count:
+            return None
+
+        rank = max(1, -(-self.count * percent // 100))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                shift = index >> _SUB_BITS
+                low = (index & ((1 << _SUB_BITS) - 1)) << shift
+                return min(low + ((1 << shift) >> 1), self.max)
+
+        return self.max
+
+
+def parse_mix(mix):
+    '''
+    parse "SetWork=40,SetRecording=60" into {action: weight}
+    '''
+    weights = {}
+    for part in mix.split(','):
+        action, _, weight = part.partition('=')
+        weights[action.strip()] = float(weight or 1)
+    return weights
+
+
+class Workload:
+    '''
+    Generates OMI objects, as factory keyword arguments, for an action
+    mix. References point at the objects registered by setup().
+    '''
+
+    def __init__(self, public_key, mix, seed=0, individuals=100,
+                 organizations=10, works=100, run_id=None):
+        self._public_key = public_key
+        self._actions = list(mix)
+        self._weights = [mix[action] for action in self._actions]
+        self._random = random.Random(seed)
+        self._run_id = run_id or '{:x}'.format(int(time.time()))
+        self._count = 0
+
+        self._individuals = [
+            self._name('Individual') for _ in range(individuals)]
+        self._organizations = [
+            self._name('Organization') for _ in range(organizations)]
+        self._works = [self._name('Work') for _ in range(works)]
+
+    def setup(self):
+        '''
+        return phases of (action, kwargs) to commit, in order, before
+        the measured transactions
+        '''
+        return [
+            [self._individual(name) for name in self._individuals]
+            + [self._organization(name) for name in self._organizations],
+            [self._work(title) for title in self._works],
+        ]
+
+    def next(self):
+        action = self._random.choices(self._actions, self._weights)[0]
+        if action == 'SetIndividualIdentity':
+            return self._individual(self._name('Individual'))
+        if action == 'SetOrganizationalIdentity':
+            return self._organization(self._name('Organization'))
+        if action == 'SetWork':
+            return self._work(self._name('Work'))
+        if action == 'SetRecording':
+            return self._recording(self._name('Recording'))
+        raise ValueError('Unknown action {}'.format(action))
+
+    def _name(self, kind):
+        self._count += 1
+        return '{} {} {}'.format(kind, self._run_id, self._count)
+
+    def _individual(self, name):
+        return 'SetIndividualIdentity', {
+            'name': name,
+            'pubkey': self._public_key,
+        }
+
+    def _organization(self, name):
+        return 'SetOrganizationalIdentity', {
+            'name': name,
+            'type': 'PUBLISHER',
+            'pubkey': self._public_key,
+        }
+
+    def _work(self, title):
+        choice = self._random.choice
+        return 'SetWork', {
+            'title': title,
+            'songwriter_publisher_splits': [{
+                'split': 100,
+                'songwriter_publisher': {
+                    'songwriter_name': choice(self._individuals),
+                    'publisher_name': choice(self._organizations),
+                },
+            }],
+            'registering_pubkey': self._public_key,
+        }
+
+    def _recording(self, title):
+        choice = self._random.choice
+        return 'SetRecording', {
+            'title': title,
+            'type': 'SONG',
+            'contributor_splits': [{
+                'split': 100,
+                'contributor_name': choice(self._individuals),
+            }],
+            'derived_work_splits': [{
+                'split': 100,
+                'work_name': choice(self._works),
+            }],
+            'derived_recording_splits': [],
+            'overall_split': {
+                'derived_work_portion': 50,
+                'derived_recording_portion': 0,
+                'contributor_portion': 50,
+            },
+            'registering_pubkey': self._public_key,
+        }
+
+
+class LoadReport:
+    def __init__(self, interval):
+        self.interval = interval
+        self.latencies = LatencyHistogram()
+        self.scheduled = 0
+        self.committed = 0
+        self.invalid = 0
+        self.failed = 0
+        self.unfinished = 0
+        self.elapsed = 0.0
+        # interval number -> [sent, committed]
+        self.timeline = collections.defaultdict(lambda: [0, 0])
+
+    def lines(self):
+        lines = []
+        for number in sorted(self.timeline):
+            sent, committed = self.timeline[number]
+            lines.append(
+                '{:8.1f}s  {:6.1f} sent/s  {:6.1f} committed/s'.format(
+                    number * self.interval,
+                    sent / self.interval, committed / self.interval))
+
+        lines.append(
+            '{} scheduled, {} committed, {} invalid, {} failed to send, '
+            '{} unfinished in {:.1f}s'.format(
+                self.scheduled, self.committed, self.invalid, self.failed,
+                self.unfinished, self.elapsed))
+
+        if self.latencies.count:
+            lines.append(
+                'submit-to-commit latency (ms): ' + ', '.join(
+                    '{} {:.1f}'.format(
+                        label, self.latencies.percentile(percent) / 1000)
+                    for label, percent in (
+                        ('p50', 50), ('p95', 95), ('p99', 99),
+                        ('p999', 99.9)))
+                + ', max {:.1f}'.format(self.latencies.max / 1000))
+
+        return lines
+
+
+class OpenLoopRun:
+    def __init__(self, client, factory, workload, rate, duration,
+                 workers=16, poll_interval=0.05, interval=1.0, drain=60.0,
+                 clock=time.monotonic):
+        '''
+        client -- posts batches and queries statuses, like OMIRestClient
+        factory -- makes serialized BatchLists, like OMIMessageFactory
+        rate -- batches per second
+        duration -- seconds of scheduled sends
+        workers -- sender threads; sends beyond this many in flight
+            queue up, still charged from their scheduled time
+        drain -- seconds to wait for commits after the last send
+        '''
+        self._client = client
+        self._factory = factory
+        self._workload = workload
+        self._rate = rate
+        self._duration = duration
+        self._workers = workers
+        self._poll_interval = poll_interval
+        self._drain = drain
+        self._clock = clock
+
+        self._report = LoadReport(interval)
+        self._lock = threading.Lock()
+        # batch ID -> scheduled time, oldest first
+        self._outstanding = collections.OrderedDict()
+        self._start = None
+
+    def setup(self):
+        '''
+        commit the workload's setup objects, phase by phase
+        '''
+        for phase in self._workload.setup():
+            batch_ids = []
+            for i in range(0, len(phase), 100):
+                batch_list = BatchList()
+                for action, kwargs in phase[i:i + 100]:
+                    batch_list.batches.extend(
+                        _parse(self._factory.create_batch(action, **kwargs))
+                        .batches)
+                batch_ids.extend(
+                    batch.header_signature for batch in batch_list.batches)
+                self._client.post_batches(batch_list.SerializeToString())
+
+            self._wait_for(batch_ids)
+
+    def run(self):
+        '''
+        run the schedule and return a LoadReport
+        '''
+        report = self._report
+        count = int(self._rate * self._duration)
+
+        LOGGER.info('Signing %s batches', count)
+        batches = []
+        for _ in range(count):
+            action, kwargs = self._workload.next()
+            data = self._factory.create_batch(action, **kwargs)
+            batches.append((_parse(data).batches[0].header_signature, data))
+
+        report.scheduled = count
+        done = threading.Event()
+        poller = threading.Thread(target=self._poll, args=(done,))
+
+        self._start = self._clock()
+        poller.start()
+        try:
+            with ThreadPoolExecutor(self._workers) as executor:
+                for number, (batch_id, data) in enumerate(batches):
+                    scheduled = self._start + number / self._rate
+                    delay = scheduled - self._clock()
+                    if delay > 0:
+                        time.sleep(delay)
+                    executor.submit(self._send, batch_id, data, scheduled)
+
+            deadline = self._clock() + self._drain
+            while self._outstanding and self._clock() < deadline:
+                time.sleep(self._poll_interval)
+        finally:
+            done.set()
+            poller.join()
+
+        report.unfinished = len(self._outstanding)
+        report.elapsed = self._clock() - self._start
+        return report
+
+    def _send(self, batch_id, data, scheduled):
+        with self._lock:
+            self._outstanding[batch_id] = scheduled
+            self._report.timeline[self._interval(self._clock())][0] += 1
+
+        try:
+            self._client.post_batches(data)
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.debug('Failed to send %s: %s', batch_id, err)
+            with self._lock:
+                del self._outstanding[batch_id]
+                self._report.failed += 1
+
+    def _poll(self, done):
+        while not done.is_set():
+            with self._lock:
+                batch_ids = list(self._outstanding)[:1000]
+
+            statuses = {}
+            if batch_ids:
+                try:
+                    statuses = self._client.batch_statuses(batch_ids)
+                except Exception as err:  # pylint: disable=broad-except
+                    LOGGER.warning('Failed to poll statuses: %s', err)
+
+            now = self._clock()
+            with self._lock:
+                report = self._report
+                for batch_id, status in statuses.items():
+                    if status not in (COMMITTED, INVALID):
+                        continue
+                    scheduled = self._outstanding.pop(batch_id, None)
+                    if scheduled is None:
+                        continue
+
+                    if status == COMMITTED:
+                        report.committed += 1
+                        report.latencies.record((now - scheduled) * 1000000)
+                        report.timeline[self._interval(now)][1] += 1
+                    else:
+                        report.invalid += 1
+
+            done.wait(self._poll_interval)
+
+    def _interval(self, now):
+        return int((now - self._start) // self._report.interval)
+
+    def _wait_for(self, batch_ids):
+        waiting = set(batch_ids)
+        while waiting:
+            chunk = list(waiting)[:1000]
+            for batch_id, status in self._client.batch_statuses(
+                    chunk, wait=10).items():
+                if status != PENDING:
+                    waiting.discard(batch_id)
+                    if status != COMMITTED:
+                        LOGGER.warning(
+                            'Setup batch %s is %s', batch_id, status)
+
+
+def _parse(data):
+    batch_list = BatchList()
+    batch_list.ParseFromString(data)
+    return batch_list
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Drive an open-loop OMI load against a REST API.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'url',
+        help='the URL of the REST API, e.g. http://localhost:8080')
+
+    parser.add_argument(
+        '--rate',
+        type=float,
+        default=10.0,
+        help='batches per second')
+
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=60.0,
+        help='seconds of sends')
+
+    parser.add_argument(
+        '--mix',
+        default=DEFAULT_MIX,
+        help='action weights, e.g. SetWork=3,SetRecording=1')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=16,
+        help='sender threads')
+
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=1.0,
+        help='seconds per line of the throughput timeline')
+
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='seed for the generated objects')
+
+    parser.add_argument(
+        '--factory',
+        required=True,
+        help='module:class of the batch factory, which must be '
+             'importable, e.g. omi_message_factory:OMIMessageFactory '
+             'with omi/tests on PYTHONPATH')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+
+    module_name, _, class_name = args.factory.partition(':')
+    factory = getattr(importlib.import_module(module_name), class_name)()
+
+    run = OpenLoopRun(
+        OMIRestClient(args.url),
+        factory,
+        Workload(factory.public_key, parse_mix(args.mix), seed=args.seed),
+        rate=args.rate,
+        duration=args.duration,
+        workers=args.workers,
+        interval=args.interval)
+
+    LOGGER.info('Committing setup objects')
+    run.setup()
+
+    for line in run.run().lines():
+        print(line)
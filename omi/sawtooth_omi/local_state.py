@@ -0,0 +1,49 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+from sawtooth_sdk.processor.state import StateEntry
+
+
+class LocalState:
+    '''
+    An in-memory stand-in for the validator's state, with the same get
+    and set interface that the SDK passes to a handler's apply
+    '''
+
+    def __init__(self, entries=None):
+        self._entries = dict(entries or {})
+
+    def get(self, addresses):
+        entries = self._entries
+        return [
+            StateEntry(address=address, data=entries[address])
+            for address in addresses
+            if address in entries
+        ]
+
+    def set(self, entries):
+        for entry in entries:
+            self._entries[entry.address] = entry.data
+
+        return [entry.address for entry in entries]
+
+    def items(self):
+        return self._entries.items()
+
+    def __contains__(self, address):
+        return address in self._entries
+
+    def __len__(self):
+        return len(self._entries)
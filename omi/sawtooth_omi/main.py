@@ -18,26 +18,35 @@ import logging
 import os
 import sys
 
-from colorlog import ColoredFormatter
+from sawtooth_omi.startup import process_uptime
 
-from sawtooth_sdk.processor.core import TransactionProcessor
-from sawtooth_omi.handler import OMITransactionHandler
+
+LOGGER = logging.getLogger(__name__)
 
 
 def create_console_handler(verbose_level):
     clog = logging.StreamHandler()
-    formatter = ColoredFormatter(
-        "%(log_color)s[%(asctime)s %(levelname)-8s%(module)s]%(reset)s "
-        "%(white)s%(message)s",
-        datefmt="%H:%M:%S",
-        reset=True,
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'red',
-        })
+
+    # colorlog is optional, and only loaded when logging is set up
+    try:
+        from colorlog import ColoredFormatter
+    except ImportError:
+        formatter = logging.Formatter(
+            "[%(asctime)s %(levelname)-8s%(module)s] %(message)s",
+            datefmt="%H:%M:%S")
+    else:
+        formatter = ColoredFormatter(
+            "%(log_color)s[%(asctime)s %(levelname)-8s%(module)s]%(reset)s "
+            "%(white)s%(message)s",
+            datefmt="%H:%M:%S",
+            reset=True,
+            log_colors={
+                'DEBUG': 'cyan',
+                'INFO': 'green',
+                'WARNING': 'yellow',
+                'ERROR': 'red',
+                'CRITICAL': 'red',
+            })
 
     clog.setFormatter(formatter)
 
@@ -71,6 +80,92 @@ def create_parser(prog_name):
         'validator_url',
         help='a host and port of the validator')
 
+    parser.add_argument(
+        '--startup-budget',
+        type=float,
+        help='warn if connecting to the validator starts more than this '
+             'many seconds after process start')
+
+    parser.add_argument(
+        '--require-fast-protobuf',
+        action='store_true',
+        help='exit at startup if protobuf has no C++ or upb extension, '
+             'rather than running on its much slower pure-Python backend')
+
+    parser.add_argument(
+        '--profile-dir',
+        help='profile transaction processing, writing profiles to this '
+             'directory; SIGUSR1 toggles profiling on and off')
+
+    parser.add_argument(
+        '--profile-every',
+        type=int,
+        default=1000,
+        help='number of transactions per profile window')
+
+    parser.add_argument(
+        '--profile-mode',
+        choices=['cprofile', 'sample'],
+        default='cprofile',
+        help='cprofile writes .pstats files; sample writes collapsed '
+             'stacks for flamegraphs at a much lower overhead')
+
+    parser.add_argument(
+        '--profile-keep',
+        type=int,
+        default=10,
+        help='number of profile files to keep')
+
+    parser.add_argument(
+        '--profile-paused',
+        action='store_true',
+        help='wait for SIGUSR1 before profiling')
+
+    parser.add_argument(
+        '--memory-tracking',
+        action='store_true',
+        help='track memory allocations with tracemalloc; SIGUSR2 logs a '
+             'report of the top allocators per action type')
+
+    parser.add_argument(
+        '--memory-report-every',
+        type=int,
+        help='also log the memory report every N transactions')
+
+    parser.add_argument(
+        '--memory-sample-every',
+        type=int,
+        default=100,
+        help='attribute allocations to source lines for every Nth '
+             'transaction of each action type')
+
+    parser.add_argument(
+        '--hot-addresses-every',
+        type=int,
+        help='count state reads and writes per address, logging the '
+             'hottest addresses every N transactions')
+
+    parser.add_argument(
+        '--hot-addresses-top',
+        type=int,
+        default=10,
+        help='number of hot addresses to report for reads and writes')
+
+    parser.add_argument(
+        '--hot-addresses-window',
+        type=float,
+        default=60.0,
+        help='seconds of traffic the hot-address counts cover')
+
+    parser.add_argument(
+        '--trace-file',
+        help='record a span per transaction, with its phases, to this '
+             'file as Zipkin v2 JSON lines')
+
+    parser.add_argument(
+        '--trace-url',
+        help='post transaction spans to this Zipkin-compatible collector')
+
     return parser
 
 
@@ -86,9 +181,58 @@ def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:],
             verbose_level = args.verbose
         setup_loggers(verbose_level=verbose_level)
 
+    # The processor stack is imported here rather than at module level,
+    # so that argument errors and tooling that imports this module don't
+    # pay for it
+    from sawtooth_sdk.processor.core import TransactionProcessor
+    from sawtooth_omi.codec import check_backend
+    from sawtooth_omi.codec import SlowBackendError
+    from sawtooth_omi.handler import OMITransactionHandler
+    from sawtooth_omi.tracing import create_tracer
+
+    try:
+        check_backend(require_fast=args.require_fast_protobuf)
+    except SlowBackendError as err:
+        LOGGER.error('%s', err)
+        sys.exit(1)
+
     processor = TransactionProcessor(url=args.validator_url)
 
-    processor.add_handler(OMITransactionHandler())
+    tracer = create_tracer('omi-tp', args.trace_file, args.trace_url)
+
+    handler = OMITransactionHandler(tracer=tracer)
+
+    if args.hot_addresses_every is not None:
+        from sawtooth_omi.hot_addresses import HotAddressHandler
+        from sawtooth_omi.hot_addresses import HotAddressTracker
+        handler = HotAddressHandler(
+            handler,
+            tracker=HotAddressTracker(window=args.hot_addresses_window),
+            top=args.hot_addresses_top,
+            report_every=args.hot_addresses_every)
+
+    if args.memory_tracking or args.memory_report_every is not None:
+        from sawtooth_omi.memory import MemoryTrackingHandler
+        handler = MemoryTrackingHandler(
+            handler,
+            sample_every=args.memory_sample_every,
+            report_every=args.memory_report_every)
+        handler.install_signal()
+
+    if args.profile_dir is not None:
+        from sawtooth_omi.profiling import ProfilingHandler
+        handler = ProfilingHandler(
+            handler,
+            directory=args.profile_dir,
+            every=args.profile_every,
+            mode=args.profile_mode,
+            keep=args.profile_keep,
+            enabled=not args.profile_paused)
+        handler.install_signal()
+
+    processor.add_handler(handler)
+
+    _log_startup_time(args.startup_budget)
 
     try:
         processor.start()
@@ -96,3 +240,19 @@ def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:],
         pass
     finally:
         processor.stop()
+        if args.profile_dir is not None:
+            handler.close()
+        if tracer is not None:
+            tracer.close()
+
+
+def _log_startup_time(budget):
+    uptime = process_uptime()
+
+    if budget is not None and uptime > budget:
+        LOGGER.warning(
+            'Connecting to validator %.3fs after process start, over the '
+            '%.3fs startup budget', uptime, budget)
+    else:
+        LOGGER.info(
+            'Connecting to validator %.3fs after process start', uptime)
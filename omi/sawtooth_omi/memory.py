@@ -0,0 +1,212 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+tracemalloc-backed memory reporting for omi-tp.
+
+A MemoryTrackingHandler wraps a transaction handler. For every apply it
+records the traced memory left behind, per action type; for every Nth
+apply of each action it also diffs tracemalloc snapshots taken around
+the apply, attributing allocations to source lines. A report of the top
+allocators per action, with process RSS and GC counters, is logged
+periodically or on a signal. The signal handler only flags the request,
+which the next apply acts on, as the handler may interrupt the thread
+while it holds the lock.
+'''
+
+import collections
+import gc
+import logging
+import signal
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+class _ActionStats:
+    __slots__ = ('count', 'retained', 'samples', 'allocators')
+
+    def __init__(self):
+        self.count = 0
+        self.retained = 0
+        self.samples = 0
+        # source line -> [bytes, blocks] allocated during sampled applies
+        self.allocators = collections.defaultdict(lambda: [0, 0])
+
+
+class MemoryTrackingHandler:
+    def __init__(self, handler, sample_every=100, top=10, report_every=None,
+                 frames=1):
+        '''
+        sample_every -- diff snapshots around every Nth apply per action;
+            snapshots are expensive, so keep this well above 1 in
+            production
+        top -- number of allocators to report per action
+        report_every -- log a report every N transactions
+        frames -- traceback depth recorded by tracemalloc
+        '''
+        self._handler = handler
+        self._sample_every = sample_every
+        self._top = top
+        self._report_every = report_every
+        self._frames = frames
+
+        self._lock = threading.Lock()
+        self._stats = collections.defaultdict(_ActionStats)
+        self._count = 0
+        self._report_requested = threading.Event()
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    @property
+    def family_name(self):
+        return self._handler.family_name
+
+    @property
+    def family_versions(self):
+        return self._handler.family_versions
+
+    @property
+    def encodings(self):
+        return self._handler.encodings
+
+    @property
+    def namespaces(self):
+        return self._handler.namespaces
+
+    def request_report(self):
+        '''
+        log a report after the next apply; safe to call from a signal
+        handler
+        '''
+        self._report_requested.set()
+
+    def install_signal(self, signum=signal.SIGUSR2):
+        signal.signal(signum, lambda *_: self.request_report())
+
+    def apply(self, transaction, state):
+        action = _get_action(transaction)
+
+        with self._lock:
+            stats = self._stats[action]
+            stats.count += 1
+            sample = stats.count % self._sample_every == 0
+
+        before = _take_snapshot() if sample else None
+        start_size, _ = tracemalloc.get_traced_memory()
+        try:
+            return self._handler.apply(transaction, state)
+        finally:
+            end_size, _ = tracemalloc.get_traced_memory()
+            after = _take_snapshot() if sample else None
+
+            with self._lock:
+                stats.retained += end_size - start_size
+                if sample:
+                    stats.samples += 1
+                    _accumulate(stats, after.compare_to(before, 'lineno'))
+
+                self._count += 1
+                report = (
+                    self._report_every is not None
+                    and self._count % self._report_every == 0)
+
+            if self._report_requested.is_set():
+                self._report_requested.clear()
+                report = True
+
+            if report:
+                self.log_report()
+
+    def report(self):
+        '''
+        return the report as a list of lines
+        '''
+        lines = []
+
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append('traced memory: {:.1f} KiB current, {:.1f} KiB peak'
+                     .format(current / 1024, peak / 1024))
+
+        if resource is not None:
+            # ru_maxrss is in KiB on Linux
+            lines.append('max RSS: {:.1f} MiB'.format(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+        lines.append('gc collections per generation: {}'.format(
+            [generation['collections'] for generation in gc.get_stats()]))
+
+        with self._lock:
+            for action, stats in sorted(self._stats.items()):
+                lines.append(
+                    '{}: {} txns, {:.0f} B retained per txn, {} sampled'
+                    .format(action, stats.count,
+                            stats.retained / stats.count, stats.samples))
+
+                top = sorted(
+                    stats.allocators.items(),
+                    key=lambda item: -item[1][0])[:self._top]
+
+                for line, (size, blocks) in top:
+                    lines.append(
+                        '    {:8.0f} B {:6.1f} blocks per sampled txn  {}'
+                        .format(size / stats.samples,
+                                blocks / stats.samples, line))
+
+        return lines
+
+    def log_report(self):
+        LOGGER.warning('Memory report:\n%s', '\n'.join(self.report()))
+
+
+def _get_action(transaction):
+    payload = OMITransactionPayload()
+    try:
+        payload.ParseFromString(transaction.payload)
+    except Exception:  # pylint: disable=broad-except
+        return '<undecodable>'
+    return payload.action or '<none>'
+
+
+def _take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+
+def _accumulate(stats, differences):
+    for difference in differences:
+        if difference.size_diff <= 0:
+            continue
+
+        frame = difference.traceback[0]
+        allocator = stats.allocators[
+            '{}:{}'.format(frame.filename, frame.lineno)]
+        allocator[0] += difference.size_diff
+        allocator[1] += max(difference.count_diff, 0)
@@ -0,0 +1,355 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Commit notifications for many outstanding batches, without polling
+/batch_status for each one.
+
+A CommitNotifier follows one stream of committed block IDs. For each
+block it reads the block's batch IDs from the REST API, once, and
+resolves every watched batch among them together. Batches that no block
+has committed after a while are probably invalid or unknown; only those
+are looked up with /batch_status, many IDs to a request.
+
+The block IDs come from a validator's state delta subscription
+(StateDeltaEvents), which sends an event per block as it is committed,
+or from anything else that yields block IDs in commit order. When the
+stream ends, everything pending is checked by status, as any block
+committed meanwhile was missed.
+
+    omi-notify http://localhost:8080 tcp://localhost:4004 < batch_ids
+'''
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+from concurrent.futures import Future
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.client import STATUS_QUERY_SIZE
+from sawtooth_omi.handler import OMI_ADDRESS_PREFIX
+from sawtooth_omi.main import setup_loggers
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+COMMITTED = 'COMMITTED'
+PENDING = 'PENDING'
+UNKNOWN = 'UNKNOWN'
+
+
+class SubscriptionError(Exception):
+    pass
+
+
+class StateDeltaEvents:
+    '''
+    Yields the ID of each block the validator commits, from a state
+    delta subscription. A reconnect resumes after the last block seen.
+    '''
+
+    def __init__(self, validator_url):
+        self._url = validator_url
+        self._stream = None
+        self.last_block_id = None
+
+    def __iter__(self):
+        # The messaging stack is only needed here, so tooling that
+        # passes its own events doesn't import it
+        from sawtooth_sdk.messaging.stream import Stream
+        from sawtooth_sdk.protobuf.state_delta_pb2 import StateDeltaEvent
+        from sawtooth_sdk.protobuf.state_delta_pb2 import \
+            StateDeltaSubscribeRequest
+        from sawtooth_sdk.protobuf.state_delta_pb2 import \
+            StateDeltaSubscribeResponse
+        from sawtooth_sdk.protobuf.validator_pb2 import Message
+
+        self._stream = Stream(self._url)
+
+        request = StateDeltaSubscribeRequest(
+            # only the block IDs are wanted, so keep the changes sent
+            # along with them to this family's
+            address_prefixes=[OMI_ADDRESS_PREFIX])
+        if self.last_block_id is not None:
+            request.last_known_block_ids.append(self.last_block_id)
+
+        reply = self._stream.send(
+            Message.STATE_DELTA_SUBSCRIBE_REQUEST,
+            request.SerializeToString()).result()
+        response = StateDeltaSubscribeResponse()
+        response.ParseFromString(reply.content)
+        if response.status != StateDeltaSubscribeResponse.OK:
+            raise SubscriptionError(
+                'State delta subscription failed: {}'.format(
+                    StateDeltaSubscribeResponse.Status.Name(
+                        response.status)))
+
+        while True:
+            message = self._stream.receive().result()
+            if message.message_type != Message.STATE_DELTA_EVENT:
+                continue
+
+            event = StateDeltaEvent()
+            event.ParseFromString(message.content)
+            self.last_block_id = event.block_id
+            yield event.block_id
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+
+
+class _Watch:
+    __slots__ = ('future', 'since')
+
+    def __init__(self, future, since):
+        self.future = future
+        self.since = since
+
+
+class CommitNotifier:
+    def __init__(self, client, events, check_after=30.0, check_interval=5.0,
+                 retry_interval=1.0, clock=time.monotonic):
+        '''
+        client -- an OMIRestClient
+        events -- yields committed block IDs; closed on stop if it has
+            a close method
+        check_after -- seconds a batch may go uncommitted before its
+            status is looked up
+        check_interval -- seconds between status lookups
+        retry_interval -- seconds to wait before iterating events again
+            after it ends or fails
+        '''
+        self._client = client
+        self._events = events
+        self._check_after = check_after
+        self._check_interval = check_interval
+        self._retry_interval = retry_interval
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        # batch ID -> _Watch, for every batch not yet final
+        self._pending = {}
+
+        self._stop = threading.Event()
+        self._threads = []
+
+        self.blocks = 0
+        self.status_queries = 0
+
+    def watch(self, batch_ids, on_status=None):
+        '''
+        return {batch ID: Future of its final status}, calling
+        on_status(batch ID, status) as each is resolved
+        '''
+        since = self._clock()
+        futures = {}
+        with self._lock:
+            for batch_id in batch_ids:
+                watch = self._pending.get(batch_id)
+                if watch is None:
+                    watch = _Watch(Future(), since)
+                    self._pending[batch_id] = watch
+                futures[batch_id] = watch.future
+
+        if on_status is not None:
+            for batch_id, future in futures.items():
+                future.add_done_callback(
+                    lambda future, batch_id=batch_id:
+                    on_status(batch_id, future.result()))
+
+        return futures
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def on_block(self, block_id):
+        '''
+        resolve the watched batches a newly committed block holds
+        '''
+        self.blocks += 1
+        with self._lock:
+            if not self._pending:
+                return
+
+        block = self._client.block(block_id)
+        self._resolve(
+            (batch_id, COMMITTED)
+            for batch_id in block['header'].get('batch_ids', []))
+
+    def check(self, everything=False):
+        '''
+        look up the status of batches pending longer than check_after,
+        or of every pending batch; return how many were resolved
+
+        A batch is only taken to be UNKNOWN once it is older than
+        check_after, as one just submitted may not have reached the
+        validator yet.
+        '''
+        cutoff = self._clock() - self._check_after
+        with self._lock:
+            stale = {
+                batch_id: watch.since <= cutoff
+                for batch_id, watch in self._pending.items()
+                if everything or watch.since <= cutoff}
+        batch_ids = list(stale)
+
+        resolved = 0
+        for start in range(0, len(batch_ids), STATUS_QUERY_SIZE):
+            statuses = self._client.batch_statuses(
+                batch_ids[start:start + STATUS_QUERY_SIZE])
+            self.status_queries += 1
+            resolved += self._resolve(
+                (batch_id, status) for batch_id, status in statuses.items()
+                if status != PENDING and
+                (status != UNKNOWN or stale.get(batch_id)))
+
+        return resolved
+
+    def start(self):
+        for target in (self._follow, self._check_periodically):
+            thread = threading.Thread(target=target, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        '''
+        stop following events; an events iterator that stays blocked
+        after close is left to its daemon thread after timeout seconds
+        '''
+        self._stop.set()
+        close = getattr(self._events, 'close', None)
+        if close is not None:
+            close()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _resolve(self, statuses):
+        resolved = []
+        with self._lock:
+            for batch_id, status in statuses:
+                watch = self._pending.pop(batch_id, None)
+                if watch is not None:
+                    resolved.append((watch.future, status))
+
+        # Callbacks run outside the lock, so they may watch more batches
+        for future, status in resolved:
+            future.set_result(status)
+
+        return len(resolved)
+
+    def _follow(self):
+        while not self._stop.is_set():
+            # Batches may commit between watch() and the subscription
+            # taking effect, or while it was down
+            self._check_all()
+            try:
+                for block_id in self._events:
+                    self.on_block(block_id)
+                    if self._stop.is_set():
+                        return
+            except Exception:  # pylint: disable=broad-except
+                if self._stop.is_set():
+                    return
+                LOGGER.exception('Lost the block commit events')
+
+            self._stop.wait(self._retry_interval)
+
+    def _check_periodically(self):
+        while not self._stop.wait(self._check_interval):
+            try:
+                self.check()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to look up batch statuses')
+
+    def _check_all(self):
+        try:
+            self.check(everything=True)
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception('Failed to look up batch statuses')
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Wait for batches to commit, one per line of stdin or '
+                    'as arguments, printing each one\'s final status.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'url',
+        help='the URL of the REST API, e.g. http://localhost:8080')
+
+    parser.add_argument(
+        'validator_url',
+        help='the validator to subscribe to, e.g. tcp://localhost:4004')
+
+    parser.add_argument(
+        'batch_ids',
+        nargs='*',
+        help='batch IDs to wait for, rather than reading them from stdin')
+
+    parser.add_argument(
+        '--check-after',
+        type=float,
+        default=30.0,
+        help='seconds before an uncommitted batch\'s status is looked up')
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='enable more verbose output')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+    setup_loggers(args.verbose)
+
+    batch_ids = args.batch_ids or [
+        line.strip() for line in sys.stdin if line.strip()]
+
+    done = threading.Event()
+    remaining = [len(set(batch_ids))]
+    lock = threading.Lock()
+
+    def on_status(batch_id, status):
+        with lock:
+            print('{}\t{}'.format(batch_id, status), flush=True)
+            remaining[0] -= 1
+            if not remaining[0]:
+                done.set()
+
+    notifier = CommitNotifier(
+        OMIRestClient(args.url), StateDeltaEvents(args.validator_url),
+        check_after=args.check_after)
+    notifier.watch(batch_ids, on_status)
+    if not batch_ids:
+        done.set()
+
+    notifier.start()
+    try:
+        done.wait()
+    finally:
+        notifier.stop()
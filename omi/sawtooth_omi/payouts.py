@@ -0,0 +1,501 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Per-recording payout tables, kept up to date as OMI state changes.
+
+A recording's payout is its split tree flattened into exact fractions
+per payee:
+
+- the contributor portion, divided by the contributor splits
+- the derived work portion, divided by the derived work splits, each
+  work's share divided by its songwriter-publisher splits
+- the derived recording portion, divided by the derived recording
+  splits, each recording's share divided by that recording's own payout
+
+Payees are (kind, name, publisher) triples: ('contributor', name, ''),
+('songwriter', songwriter, publisher), or, for a reference to an object
+that isn't in state, ('work', title, '') or ('recording', title, ''),
+so that a payout always accounts for every split. Recordings that draw
+on a reference cycle have no payout, and are listed as undefined.
+
+PayoutViews takes (address, data) changes, the same reset/update
+interface as the read service's Catalog, so a StateFollower can drive
+it. For each change it recomputes only the changed recordings and
+everything downstream of a changed work or recording in a
+LineageGraph, reusing the stored payouts of everything else. Objects,
+payouts and the last head are kept in SQLite, so queries are reads and
+a restart resumes without a rebuild.
+'''
+
+import argparse
+import fractions
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.export import decode_entry
+from sawtooth_omi.export import read_export
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import WORK, RECORDING
+from sawtooth_omi.lineage import LineageGraph
+from sawtooth_omi.main import setup_loggers
+from sawtooth_omi.read_service import StateFollower
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+CONTRIBUTOR = 'contributor'
+SONGWRITER = 'songwriter'
+UNRESOLVED_WORK = 'work'
+UNRESOLVED_RECORDING = 'recording'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS objects (
+    address TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shares (
+    recording TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    payee TEXT NOT NULL,
+    publisher TEXT NOT NULL,
+    numerator TEXT NOT NULL,
+    denominator TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shares_recording ON shares (recording);
+CREATE INDEX IF NOT EXISTS shares_payee ON shares (payee);
+CREATE TABLE IF NOT EXISTS undefined (
+    recording TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+_HUNDRED = fractions.Fraction(100)
+
+
+class PayoutViews:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        # a follower's thread updates while queries read
+        self._lock = threading.RLock()
+
+        self._graph = LineageGraph()
+        # address -> (tag, name), and the objects by name
+        self._addresses = {}
+        self._works = {}
+        self._recordings = {}
+        # recording title -> {payee: Fraction}, or None if undefined
+        self._payouts = {}
+
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'head'").fetchone()
+        self.head = row[0] if row else None
+
+        self._restore()
+
+    def __len__(self):
+        return len(self._payouts)
+
+    def close(self):
+        self._db.close()
+
+    def reset(self, entries, head=None):
+        '''
+        replace every object with (address, data) entries, in one
+        transaction, so a failure leaves the old tables and head
+        '''
+        with self._lock:
+            self._clear()
+            try:
+                with self._db:
+                    for table in ('objects', 'shares', 'undefined', 'meta'):
+                        self._db.execute('DELETE FROM {}'.format(table))
+                    self._update(entries, head)
+            except Exception:
+                self._reload()
+                raise
+
+    def update(self, changes, head=None):
+        '''
+        apply (address, data) changes, where data is None for an address
+        that has been emptied; return the number of payouts recomputed
+        '''
+        with self._lock:
+            try:
+                with self._db:
+                    return self._update(changes, head)
+            except Exception:
+                self._reload()
+                raise
+
+    def _update(self, changes, head):
+        dirty = set()
+        for tag, name in self._apply(changes):
+            if tag == RECORDING:
+                dirty.add(name)
+            dirty.update(
+                derivative for _, derivative in
+                self._graph.derivatives(tag, name, {RECORDING}))
+
+        self._recompute(dirty)
+
+        self.head = head
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta VALUES ('head', ?)", (head,))
+
+        return len(dirty)
+
+    def payout(self, title):
+        '''
+        return [((kind, name, publisher), Fraction)] for a recording,
+        largest share first, or None if its payout is undefined
+        '''
+        with self._lock:
+            if self._db.execute(
+                    'SELECT 1 FROM undefined WHERE recording = ?',
+                    (title,)).fetchone():
+                return None
+
+            rows = self._db.execute(
+                'SELECT kind, payee, publisher, numerator, denominator '
+                'FROM shares WHERE recording = ?', (title,))
+            shares = [
+                ((kind, payee, publisher),
+                 fractions.Fraction(int(numerator), int(denominator)))
+                for kind, payee, publisher, numerator, denominator in rows
+            ]
+            shares.sort(key=lambda share: (-share[1], share[0]))
+            return shares
+
+    def earnings(self, name):
+        '''
+        return [(recording, (kind, name, publisher), Fraction)] for every
+        share paid to a payee of the given name
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT recording, kind, payee, publisher, numerator, '
+                'denominator FROM shares WHERE payee = ? '
+                'ORDER BY recording', (name,))
+            return [
+                (recording, (kind, payee, publisher),
+                 fractions.Fraction(int(numerator), int(denominator)))
+                for recording, kind, payee, publisher, numerator, denominator
+                in rows
+            ]
+
+    def _apply(self, changes):
+        '''
+        store changes, and return the (tag, name) of every work and
+        recording they added, changed or removed
+        '''
+        changed = set()
+        for address, data in changes:
+            old = self._remove(address)
+            if old is not None:
+                changed.add(old)
+
+            new = None
+            if data is not None:
+                new = self._put(address, data)
+
+            if new is None:
+                self._db.execute(
+                    'DELETE FROM objects WHERE address = ?', (address,))
+            else:
+                changed.add(new)
+                self._db.execute(
+                    'INSERT OR REPLACE INTO objects VALUES (?, ?)',
+                    (address, data))
+
+        return changed
+
+    def _clear(self):
+        self._graph = LineageGraph()
+        self._addresses = {}
+        self._works = {}
+        self._recordings = {}
+        self._payouts = {}
+
+    def _reload(self):
+        '''
+        rebuild the in-memory views from the tables, after a rolled
+        back change
+        '''
+        self._clear()
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE key = 'head'").fetchone()
+        self.head = row[0] if row else None
+        self._restore()
+
+    def _restore(self):
+        for address, data in self._db.execute(
+                'SELECT address, data FROM objects'):
+            self._put(address, data)
+
+        for title in self._recordings:
+            self._payouts[title] = {}
+        for title, kind, payee, publisher, numerator, denominator in \
+                self._db.execute('SELECT * FROM shares'):
+            self._payouts[title][(kind, payee, publisher)] = \
+                fractions.Fraction(int(numerator), int(denominator))
+        for title, in self._db.execute('SELECT recording FROM undefined'):
+            self._payouts[title] = None
+
+    def _put(self, address, data):
+        decoded = decode_entry(address, data)
+        if decoded is None:
+            return None
+
+        tag, obj = decoded
+        if tag not in (WORK, RECORDING):
+            return None
+
+        name = get_unique_key(obj, tag)
+        self._addresses[address] = (tag, name)
+        if tag == WORK:
+            self._works[name] = obj
+        else:
+            self._recordings[name] = obj
+        self._graph.set_object(tag, obj)
+
+        return tag, name
+
+    def _remove(self, address):
+        key = self._addresses.pop(address, None)
+        if key is None:
+            return None
+
+        tag, name = key
+        if tag == WORK:
+            del self._works[name]
+        else:
+            del self._recordings[name]
+        self._graph.remove_object(tag, name)
+
+        return key
+
+    def _recompute(self, dirty):
+        done = {}
+        # recordings waiting on the payouts of those they draw on; with
+        # an explicit stack, a deep derivation chain can't overflow
+        in_progress = set()
+
+        def lookup(title):
+            if title in done:
+                return done[title]
+            if title not in dirty:
+                return self._payouts.get(title, _UNRESOLVED)
+            # still in progress, so on a cycle; every recording on it
+            # is undefined
+            return None
+
+        for root in dirty:
+            stack = [root]
+            while stack:
+                title = stack.pop()
+                if title in done:
+                    continue
+
+                recording = self._recordings.get(title)
+                if recording is None:
+                    done[title] = _UNRESOLVED
+                    continue
+
+                if title not in in_progress:
+                    waiting = [
+                        split.recording_name
+                        for split in recording.derived_recording_splits
+                        if split.recording_name in dirty and
+                        split.recording_name not in done and
+                        split.recording_name not in in_progress]
+                    if waiting:
+                        in_progress.add(title)
+                        stack.append(title)
+                        stack.extend(waiting)
+                        continue
+
+                done[title] = self._flatten(recording, lookup)
+                in_progress.discard(title)
+
+        for title, shares in done.items():
+            self._db.execute(
+                'DELETE FROM shares WHERE recording = ?', (title,))
+            self._db.execute(
+                'DELETE FROM undefined WHERE recording = ?', (title,))
+
+            if shares is _UNRESOLVED:
+                self._payouts.pop(title, None)
+            elif shares is None:
+                self._payouts[title] = None
+                self._db.execute(
+                    'INSERT INTO undefined VALUES (?)', (title,))
+            else:
+                self._payouts[title] = shares
+                self._db.executemany(
+                    'INSERT INTO shares VALUES (?, ?, ?, ?, ?, ?)',
+                    [(title, kind, payee, publisher,
+                      str(share.numerator), str(share.denominator))
+                     for (kind, payee, publisher), share in shares.items()])
+
+    def _flatten(self, recording, lookup):
+        shares = {}
+
+        def add(payee, share):
+            shares[payee] = shares.get(payee, 0) + share
+
+        overall = recording.overall_split
+
+        portion = overall.contributor_portion / _HUNDRED
+        for split in recording.contributor_splits:
+            add((CONTRIBUTOR, split.contributor_name, ''),
+                portion * split.split / 100)
+
+        portion = overall.derived_work_portion / _HUNDRED
+        for split in recording.derived_work_splits:
+            share = portion * split.split / 100
+            work = self._works.get(split.work_name)
+            if work is None:
+                add((UNRESOLVED_WORK, split.work_name, ''), share)
+                continue
+            for sp_split in work.songwriter_publisher_splits:
+                song_pub = sp_split.songwriter_publisher
+                add((SONGWRITER, song_pub.songwriter_name,
+                     song_pub.publisher_name),
+                    share * sp_split.split / 100)
+
+        portion = overall.derived_recording_portion / _HUNDRED
+        for split in recording.derived_recording_splits:
+            share = portion * split.split / 100
+            derived = lookup(split.recording_name)
+            if derived is None:
+                return None
+            if derived is _UNRESOLVED:
+                add((UNRESOLVED_RECORDING, split.recording_name, ''), share)
+                continue
+            for payee, derived_share in derived.items():
+                add(payee, share * derived_share)
+
+        return {payee: share for payee, share in shares.items() if share}
+
+
+# The payout of a recording that isn't in state
+_UNRESOLVED = object()
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Maintain and query per-recording payout tables.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'database',
+        help='the SQLite file the tables are kept in')
+
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        '--export',
+        help='replace the tables with those of an export file')
+    source.add_argument(
+        '--url',
+        help='follow the chain head of a REST API, updating the tables')
+
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=1.0,
+        help='with --url, seconds between polls of the chain head')
+
+    parser.add_argument(
+        '--recording',
+        action='append',
+        default=[],
+        help='print the payout of a recording')
+
+    parser.add_argument(
+        '--payee',
+        action='append',
+        default=[],
+        help='print every share paid to a payee')
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='increase output sent to stderr')
+
+    return parser
+
+
+def _format(share):
+    return '{:10.6f}%  {}'.format(float(share) * 100, share)
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    setup_loggers(args.verbose)
+
+    views = PayoutViews(args.database)
+
+    if args.export is not None:
+        views.reset(read_export(args.export))
+
+    for title in args.recording:
+        shares = views.payout(title)
+        print(title)
+        if shares is None:
+            print('  undefined: draws on a reference cycle')
+            continue
+        for (kind, name, publisher), share in shares:
+            print('  {}  {} {}{}'.format(
+                _format(share), kind, name,
+                ' / {}'.format(publisher) if publisher else ''))
+
+    for name in args.payee:
+        print(name)
+        for title, (kind, _, publisher), share in views.earnings(name):
+            print('  {}  {} as {}{}'.format(
+                _format(share), title, kind,
+                ' / {}'.format(publisher) if publisher else ''))
+
+    if args.url is None:
+        views.close()
+        return
+
+    follower = StateFollower(
+        OMIRestClient(args.url), views, args.poll_interval)
+    follower.start()
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.stop()
+        views.close()
@@ -0,0 +1,97 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Pipelined processing for the OMI handler.
+
+A Prevalidator runs the stateless stage of apply (header and payload
+parsing, the signer check and the split sums) on a worker pool as soon as
+a transaction is queued, so that by the time the handler gets to it only
+state I/O and reference checks remain. Whatever drives the handler
+submits transactions as it queues them, then passes the Prevalidator to
+OMITransactionHandler.
+
+omi-replay does so with --prevalidate-workers. omi-tp doesn't: the
+validator hands it one transaction at a time, so there is no queue to
+get ahead of.
+'''
+
+import collections
+import concurrent.futures
+import logging
+import threading
+
+from sawtooth_omi.handler import prevalidate
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Prevalidator:
+    def __init__(self, workers=None, use_processes=False, max_pending=10000):
+        '''
+        workers -- the size of the pool, defaulting to the executor's
+        use_processes -- use a process pool rather than a thread pool,
+            which sidesteps the GIL for parse-heavy loads at the cost of
+            pickling each request
+        max_pending -- the number of results to keep for transactions
+            that haven't been applied yet; the oldest are dropped
+        '''
+        if use_processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+
+        self._max_pending = max_pending
+        self._pending = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, transaction):
+        '''
+        Start the stateless stage for a queued transaction. The returned
+        future fails with InvalidTransaction for cheap rejects, which the
+        caller can answer right away without entering the state stage.
+        '''
+        future = self._executor.submit(prevalidate, transaction)
+
+        with self._lock:
+            self._pending[transaction.signature] = future
+            while len(self._pending) > self._max_pending:
+                signature, _ = self._pending.popitem(last=False)
+                LOGGER.debug('Dropped prevalidation of %s', signature)
+
+        return future
+
+    def take(self, transaction):
+        '''
+        Return the PrevalidatedTransaction for a transaction, running the
+        stateless stage inline if it was never submitted. Raises whatever
+        the stateless stage raised.
+        '''
+        with self._lock:
+            future = self._pending.pop(transaction.signature, None)
+
+        if future is None:
+            return prevalidate(transaction)
+
+        return future.result()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            for future in self._pending.values():
+                future.cancel()
+            self._pending.clear()
+
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,267 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Live profiling for omi-tp.
+
+A ProfilingHandler wraps a transaction handler and profiles its applies
+in windows of N transactions, writing one file per window and keeping
+only the newest few. Two modes are supported:
+
+  cprofile -- deterministic cProfile of the applies, written as .pstats
+  sample -- a background thread samples the applying thread's stack
+            every few milliseconds; much cheaper, written as collapsed
+            stacks ("a;b;c count" lines) ready for flamegraph tools
+
+Profiling can be switched on and off at runtime with a signal. The
+signal handler only flags the request, which the next apply acts on, as
+the handler may interrupt the thread while it holds the lock.
+'''
+
+import collections
+import cProfile
+import glob
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+
+
+class ProfilingHandler:
+    def __init__(self, handler, directory, every, mode=CPROFILE, keep=10,
+                 enabled=True, sample_interval=0.005):
+        self._handler = handler
+        self._directory = directory
+        self._every = every
+        self._mode = mode
+        self._keep = keep
+        self._sample_interval = sample_interval
+
+        self._lock = threading.Lock()
+        self._enabled = enabled
+        self._window = None
+        self._window_count = 0
+        self._count = 0
+        self._toggle_requested = threading.Event()
+
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def family_name(self):
+        return self._handler.family_name
+
+    @property
+    def family_versions(self):
+        return self._handler.family_versions
+
+    @property
+    def encodings(self):
+        return self._handler.encodings
+
+    @property
+    def namespaces(self):
+        return self._handler.namespaces
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def toggle(self):
+        with self._lock:
+            self._enabled = not self._enabled
+            closed = None if self._enabled else self._take_window()
+
+        LOGGER.warning(
+            'Profiling %s', 'enabled' if self._enabled else 'disabled')
+        self._write(closed)
+
+    def request_toggle(self):
+        '''
+        toggle before the next apply; safe to call from a signal handler
+        '''
+        self._toggle_requested.set()
+
+    def install_signal(self, signum=signal.SIGUSR1):
+        signal.signal(signum, lambda *_: self.request_toggle())
+
+    def apply(self, transaction, state):
+        if self._toggle_requested.is_set():
+            self._toggle_requested.clear()
+            self.toggle()
+
+        if not self._enabled:
+            return self._handler.apply(transaction, state)
+
+        with self._lock:
+            if self._window is None:
+                self._window = self._open_window()
+            window = self._window
+
+        closed = None
+        window.start()
+        try:
+            return self._handler.apply(transaction, state)
+        finally:
+            window.stop()
+
+            with self._lock:
+                self._count += 1
+                if self._window is window:
+                    self._window_count += 1
+                    if self._window_count == self._every:
+                        closed = self._take_window()
+
+            self._write(closed)
+
+    def close(self):
+        with self._lock:
+            closed = self._take_window()
+        self._write(closed)
+
+    def _open_window(self):
+        if self._mode == SAMPLE:
+            return _SampleWindow(self._sample_interval)
+        return _CProfileWindow()
+
+    def _take_window(self):
+        '''
+        detach the open window, if any, with the lock held; return
+        (window, transactions in it, transactions so far) for _write
+        '''
+        if self._window is None:
+            return None
+
+        closed = (self._window, self._window_count, self._count)
+        self._window = None
+        self._window_count = 0
+        return closed
+
+    def _write(self, closed):
+        '''
+        write a window taken by _take_window, without the lock, as
+        writing a profile can be slow
+        '''
+        if closed is None:
+            return
+
+        window, window_count, count = closed
+        path = os.path.join(self._directory, 'omi-tp-{}-{}.{}'.format(
+            time.strftime('%Y%m%d-%H%M%S'), count, window.extension))
+
+        try:
+            window.dump(path)
+        except OSError as err:
+            LOGGER.warning('Unable to write profile %s: %s', path, err)
+            return
+
+        LOGGER.info('Wrote profile of %s transactions to %s',
+                    window_count, path)
+        self._rotate(window.extension)
+
+    def _rotate(self, extension):
+        paths = sorted(
+            glob.glob(os.path.join(
+                self._directory, 'omi-tp-*.' + extension)),
+            key=os.path.getmtime)
+
+        for path in paths[:-self._keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class _CProfileWindow:
+    extension = 'pstats'
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def dump(self, path):
+        self._profile.dump_stats(path)
+
+
+class _SampleWindow:
+    '''
+    Samples the stacks of threads that are inside apply. The sampler
+    thread only runs while a window is open.
+    '''
+
+    extension = 'collapsed'
+
+    def __init__(self, interval):
+        self._interval = interval
+        self._stacks = collections.Counter()
+        self._active = set()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._sampler = threading.Thread(
+            target=self._sample, name='omi-tp-sampler', daemon=True)
+        self._sampler.start()
+
+    def start(self):
+        with self._lock:
+            self._active.add(threading.get_ident())
+
+    def stop(self):
+        with self._lock:
+            self._active.discard(threading.get_ident())
+
+    def dump(self, path):
+        self._done.set()
+        self._sampler.join()
+
+        with open(path, 'w') as fd:
+            for stack, count in self._stacks.most_common():
+                fd.write('{} {}\n'.format(stack, count))
+
+    def _sample(self):
+        while not self._done.wait(self._interval):
+            with self._lock:
+                active = tuple(self._active)
+            if not active:
+                continue
+
+            frames = sys._current_frames()
+            for ident in active:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self._stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{}:{}'.format(
+            os.path.basename(code.co_filename), code.co_name))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
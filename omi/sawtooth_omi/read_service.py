@@ -0,0 +1,543 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+A read-only HTTP service for the four OMI collections.
+
+    GET /individuals?start=<name>&limit=<n>&fields=name,ISNI
+    GET /works/<title>
+
+Reads are served from a Catalog held in memory, sorted by natural key,
+so a page costs a bisect and a slice however large the catalog is.
+Objects are stored with their JSON already encoded, and pages are
+streamed with chunked encoding. Every response has an ETag made from the
+collection's generation, which changes whenever an object in it does,
+so clients can revalidate with If-None-Match.
+
+A StateFollower keeps the catalog current. It loads the OMI namespace
+once, then polls the chain head. For each new block it reads the
+outputs of the block's OMI transactions and fetches only those
+addresses. If the head moves to a different fork, or too far to walk
+back, it reloads everything. The validator sees one poll per interval,
+however many reads are served.
+'''
+
+import argparse
+import bisect
+import hashlib
+import http.server
+import json
+import logging
+import os
+import socketserver
+import sys
+import threading
+import urllib.parse
+
+from google.protobuf.json_format import MessageToDict
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.export import decode_entry
+from sawtooth_omi.handler import FAMILY_NAME
+from sawtooth_omi.handler import OMI_ADDRESS_PREFIX
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+from sawtooth_omi.main import setup_loggers
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+COLLECTIONS = {
+    'individuals': INDIVIDUAL,
+    'organizations': ORGANIZATION,
+    'works': WORK,
+    'recordings': RECORDING,
+}
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+_ADDRESS_LENGTH = 70
+# Bytes of JSON to gather before writing a chunk
+_CHUNK_SIZE = 64 * 1024
+
+
+class _Collection:
+    __slots__ = ('names', 'objects', 'addresses', 'generation')
+
+    def __init__(self):
+        # sorted natural keys
+        self.names = []
+        # name -> (dict, encoded JSON)
+        self.objects = {}
+        # address -> name
+        self.addresses = {}
+        self.generation = 0
+
+
+class Page:
+    __slots__ = ('head', 'generation', 'total', 'items', 'next_start')
+
+    def __init__(self, head, generation, total, items, next_start):
+        self.head = head
+        self.generation = generation
+        self.total = total
+        # (dict, encoded JSON) pairs
+        self.items = items
+        self.next_start = next_start
+
+
+class Catalog:
+    '''
+    The OMI objects in state, by collection, as of a block
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._collections = {
+            tag: _Collection() for tag in COLLECTIONS.values()}
+        self.head = None
+
+    def __len__(self):
+        with self._lock:
+            return sum(
+                len(collection.names)
+                for collection in self._collections.values())
+
+    def reset(self, entries, head):
+        '''
+        replace the whole catalog with (address, data) entries
+        '''
+        collections = {tag: _Collection() for tag in COLLECTIONS.values()}
+        for address, data in entries:
+            decoded = _decode(address, data)
+            if decoded is not None:
+                tag, name, item = decoded
+                collection = collections[tag]
+                collection.objects[name] = item
+                collection.addresses[address] = name
+
+        for collection in collections.values():
+            collection.names = sorted(collection.objects)
+
+        with self._lock:
+            for tag, collection in collections.items():
+                collection.generation = self._collections[tag].generation + 1
+            self._collections = collections
+            self.head = head
+
+    def update(self, changes, head):
+        '''
+        apply (address, data) changes, where data is None for an address
+        that has been emptied
+        '''
+        decoded = [
+            (address, _decode(address, data) if data is not None else None)
+            for address, data in changes
+        ]
+
+        with self._lock:
+            for address, change in decoded:
+                if change is None:
+                    self._remove(address)
+                else:
+                    self._put(address, *change)
+            self.head = head
+
+    def page(self, tag, start=None, limit=DEFAULT_LIMIT):
+        '''
+        return a Page of up to limit objects, from the first whose
+        natural key is at least start
+        '''
+        with self._lock:
+            collection = self._collections[tag]
+            names = collection.names
+            index = 0 if start is None else bisect.bisect_left(names, start)
+            page_names = names[index:index + limit]
+
+            end = index + len(page_names)
+            return Page(
+                self.head,
+                collection.generation,
+                len(names),
+                [collection.objects[name] for name in page_names],
+                names[end] if end < len(names) else None)
+
+    def get(self, tag, name):
+        '''
+        return (generation, (dict, encoded JSON)), with None for a
+        missing object
+        '''
+        with self._lock:
+            collection = self._collections[tag]
+            return collection.generation, collection.objects.get(name)
+
+    def _put(self, address, tag, name, item):
+        collection = self._collections[tag]
+        collection.generation += 1
+
+        old_name = collection.addresses.get(address)
+        if old_name is not None and old_name != name:
+            self._remove(address)
+
+        if name not in collection.objects:
+            bisect.insort(collection.names, name)
+        collection.objects[name] = item
+        collection.addresses[address] = name
+
+    def _remove(self, address):
+        for collection in self._collections.values():
+            name = collection.addresses.pop(address, None)
+            if name is not None:
+                collection.generation += 1
+                del collection.objects[name]
+                del collection.names[
+                    bisect.bisect_left(collection.names, name)]
+
+
+def _decode(address, data):
+    decoded = decode_entry(address, data)
+    if decoded is None:
+        return None
+
+    tag, obj = decoded
+    obj_dict = MessageToDict(obj, preserving_proto_field_name=True)
+    return (tag, get_unique_key(obj, tag),
+            (obj_dict, json.dumps(obj_dict, sort_keys=True).encode()))
+
+
+class StateFollower:
+    def __init__(self, client, catalog, interval=1.0, max_walk=100):
+        '''
+        client -- an OMIRestClient
+        interval -- seconds between polls of the chain head
+        max_walk -- the most new blocks to read before reloading all of
+            state instead
+        '''
+        self._client = client
+        self._catalog = catalog
+        self._interval = interval
+        self._max_walk = max_walk
+
+        self._head_num = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        head = self._client.head_block()
+        head_id = head['header_signature']
+        self._catalog.reset(self._client.state(head=head_id), head_id)
+        self._head_num = int(head['header']['block_num'])
+
+        LOGGER.info('Loaded %s objects at block %s',
+                    len(self._catalog), self._head_num)
+
+    def poll(self):
+        '''
+        bring the catalog up to the current head; return the number of
+        addresses fetched, or None after a full reload
+        '''
+        head = self._client.head_block()
+        head_id = head['header_signature']
+        if head_id == self._catalog.head:
+            return 0
+
+        addresses = self._changed_addresses(head)
+        if addresses is None:
+            self.load()
+            return None
+
+        self._catalog.update(
+            [(address, self._client.state_entry(address, head_id))
+             for address in sorted(addresses)],
+            head_id)
+        self._head_num = int(head['header']['block_num'])
+
+        return len(addresses)
+
+    def resume(self):
+        '''
+        continue from the catalog's head, for a catalog that keeps its
+        contents across restarts
+        '''
+        block = self._client.block(self._catalog.head)
+        self._head_num = int(block['header']['block_num'])
+
+    def start(self):
+        if self._catalog.head is None:
+            self.load()
+        else:
+            self.resume()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self.poll()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to follow the chain head')
+
+    def _changed_addresses(self, head):
+        '''
+        return the OMI addresses written by blocks since the catalog's
+        head, or None if they can't be found by walking back from head
+        '''
+        known = self._catalog.head
+        addresses = set()
+
+        block = head
+        walked = 0
+        while block['header_signature'] != known:
+            block_num = int(block['header']['block_num'])
+            if block_num <= self._head_num or walked == self._max_walk:
+                return None
+
+            for batch in block.get('batches', []):
+                for transaction in batch.get('transactions', []):
+                    header = transaction['header']
+                    if header.get('family_name') != FAMILY_NAME:
+                        continue
+                    for address in header.get('outputs', []):
+                        if not address.startswith(OMI_ADDRESS_PREFIX):
+                            continue
+                        # a prefix output could have written anything
+                        if len(address) != _ADDRESS_LENGTH:
+                            return None
+                        addresses.add(address)
+
+            walked += 1
+            block = self._client.block(block['header']['previous_block_id'])
+
+        return addresses
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        parts = [urllib.parse.unquote(part)
+                 for part in url.path.strip('/').split('/', 1)]
+
+        tag = COLLECTIONS.get(parts[0])
+        if tag is None:
+            self._error(404, 'Unknown collection')
+            return
+
+        query = urllib.parse.parse_qs(url.query)
+        fields = None
+        if 'fields' in query:
+            fields = [f for f in query['fields'][0].split(',') if f]
+
+        if len(parts) == 2:
+            self._object(tag, parts[1], fields)
+        else:
+            self._page(parts[0], tag, query, fields)
+
+    def _object(self, tag, name, fields):
+        generation, item = self.server.catalog.get(tag, name)
+        if item is None:
+            self._error(404, 'Not found')
+            return
+
+        etag = _etag(generation, tag, name, fields)
+        if self._not_modified(etag):
+            return
+
+        self._start(200, etag)
+        self._chunk(_encode(item, fields))
+        self._chunk(b'')
+
+    def _page(self, collection, tag, query, fields):
+        try:
+            limit = int(query.get('limit', [DEFAULT_LIMIT])[0])
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_LIMIT:
+            self._error(
+                400, 'limit must be between 1 and {}'.format(MAX_LIMIT))
+            return
+        start = query.get('start', [None])[0]
+
+        page = self.server.catalog.page(tag, start, limit)
+        etag = _etag(page.generation, tag, start, limit, fields)
+        if self._not_modified(etag):
+            return
+
+        paging = {'limit': limit, 'total_count': page.total}
+        if start is not None:
+            paging['start'] = start
+        if page.next_start is not None:
+            next_query = {'start': page.next_start, 'limit': limit}
+            if fields is not None:
+                next_query['fields'] = ','.join(fields)
+            paging['next'] = '/{}?{}'.format(
+                collection, urllib.parse.urlencode(next_query))
+
+        self._start(200, etag)
+
+        buffered = [b'{"data":[']
+        size = 0
+        for i, item in enumerate(page.items):
+            if i:
+                buffered.append(b',')
+            encoded = _encode(item, fields)
+            buffered.append(encoded)
+            size += len(encoded)
+            if size >= _CHUNK_SIZE:
+                self._chunk(b''.join(buffered))
+                buffered = []
+                size = 0
+
+        buffered.append('],"head":{},"paging":{}}}'.format(
+            json.dumps(page.head), json.dumps(paging)).encode())
+        self._chunk(b''.join(buffered))
+        self._chunk(b'')
+
+    def _not_modified(self, etag):
+        if etag not in self.headers.get('If-None-Match', ''):
+            return False
+
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+        return True
+
+    def _start(self, code, etag):
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _chunk(self, data):
+        self.wfile.write('{:x}\r\n'.format(len(data)).encode())
+        self.wfile.write(data)
+        self.wfile.write(b'\r\n')
+
+    def _error(self, code, message):
+        data = json.dumps({'error': message}).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, fmt, *args):
+        LOGGER.debug(fmt, *args)
+
+
+def _etag(generation, *request):
+    digest = hashlib.sha256(repr(request).encode()).hexdigest()[:16]
+    return '"{}-{}"'.format(generation, digest)
+
+
+def _encode(item, fields):
+    obj_dict, encoded = item
+    if fields is None:
+        return encoded
+    return json.dumps(
+        {field: obj_dict[field] for field in fields if field in obj_dict},
+        sort_keys=True).encode()
+
+
+class ReadService:
+    def __init__(self, catalog, host='127.0.0.1', port=8090):
+        self._server = _Server((host, port), _Handler)
+        self._server.catalog = catalog
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Serve paginated, cached reads of OMI state.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'url',
+        help='the URL of the REST API, e.g. http://localhost:8080')
+
+    parser.add_argument(
+        '--bind',
+        default='127.0.0.1:8090',
+        help='the host:port to serve on')
+
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=1.0,
+        help='seconds between polls of the chain head')
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='count',
+        default=0,
+        help='increase output sent to stderr')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    setup_loggers(args.verbose)
+
+    host, port = args.bind.rsplit(':', 1)
+
+    catalog = Catalog()
+    follower = StateFollower(
+        OMIRestClient(args.url), catalog, args.poll_interval)
+    follower.start()
+
+    service = ReadService(catalog, host, int(port))
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.stop()
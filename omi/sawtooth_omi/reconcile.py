@@ -0,0 +1,276 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Digest-based reconciliation of two copies of OMI state, e.g. an
+off-chain catalog and a replica of chain state.
+
+Each side keeps a DigestIndex: a count and a digest for every address
+bucket, where buckets are the family's type prefixes (namespace + type
+infix, for the four object types and the owner index) split by one more
+hex character per level. A bucket's digest is
+the sum, mod 2**256, of the SHA-256 of each of its entries, so it is
+updated in place as entries change and doesn't depend on their order.
+
+reconcile() compares the type buckets of both sides, descends only into
+buckets whose digests differ, and fetches entries only for differing
+buckets that are small enough. A handful of changes among millions of
+entries costs a few hundred reads instead of a full scan.
+
+A side is anything with the DigestIndex query methods, `digests` and
+`entries`, so a remote side only has to serve those two calls. No such
+service exists yet: omi-reconcile compares two local export files, and
+only saves reads when one side is remote.
+'''
+
+import argparse
+import hashlib
+import os
+import sys
+
+from sawtooth_omi.export import read_export
+from sawtooth_omi.handler import ADDRESS_PREFIXES
+
+
+_MODULUS = 2 ** 256
+_HEX = '0123456789abcdef'
+
+# The namespace and type infix
+TYPE_PREFIX_LENGTH = 8
+
+TYPE_PREFIXES = ADDRESS_PREFIXES
+
+
+class DigestIndex:
+    def __init__(self, entries=(), depth=4):
+        '''
+        entries -- initial (address, data) pairs
+        depth -- the number of hex characters after the type prefix that
+            buckets are split by
+        '''
+        self._depth = depth
+        self._leaf_length = TYPE_PREFIX_LENGTH + depth
+        # bucket prefix -> [count, digest]
+        self._buckets = {}
+        # leaf bucket prefix -> {address: data}
+        self._leaves = {}
+
+        for address, data in entries:
+            self.put(address, data)
+
+    @property
+    def depth(self):
+        return self._depth
+
+    def __len__(self):
+        return sum(len(leaf) for leaf in self._leaves.values())
+
+    def put(self, address, data):
+        leaf = self._leaves.setdefault(address[:self._leaf_length], {})
+        old = leaf.get(address)
+        if old == data:
+            return
+
+        if old is not None:
+            self._update(address, -1, -_entry_digest(address, old))
+        leaf[address] = data
+        self._update(address, 1, _entry_digest(address, data))
+
+    def delete(self, address):
+        leaf = self._leaves.get(address[:self._leaf_length])
+        if leaf is None or address not in leaf:
+            return
+
+        data = leaf.pop(address)
+        self._update(address, -1, -_entry_digest(address, data))
+
+    def digests(self, prefixes):
+        '''
+        return {prefix: (count, digest)} for bucket prefixes
+        '''
+        return {
+            prefix: tuple(self._buckets.get(prefix, (0, 0)))
+            for prefix in prefixes
+        }
+
+    def entries(self, prefix):
+        '''
+        return {address: data} for every entry under a bucket prefix
+        '''
+        if len(prefix) >= self._leaf_length:
+            leaf = self._leaves.get(prefix[:self._leaf_length], {})
+            return {a: d for a, d in leaf.items() if a.startswith(prefix)}
+
+        entries = {}
+        for leaf_prefix, leaf in self._leaves.items():
+            if leaf_prefix.startswith(prefix):
+                entries.update(leaf)
+        return entries
+
+    def _update(self, address, count, digest):
+        for length in range(TYPE_PREFIX_LENGTH, self._leaf_length + 1):
+            bucket = self._buckets.setdefault(address[:length], [0, 0])
+            bucket[0] += count
+            bucket[1] = (bucket[1] + digest) % _MODULUS
+
+
+class CountingSide:
+    '''
+    Wraps a side to count the calls made to it, each of which is a read
+    (a round trip, for a remote side)
+    '''
+
+    def __init__(self, side):
+        self._side = side
+        self.reads = 0
+
+    def digests(self, prefixes):
+        self.reads += 1
+        return self._side.digests(prefixes)
+
+    def entries(self, prefix):
+        self.reads += 1
+        return self._side.entries(prefix)
+
+
+class Reconciliation:
+    def __init__(self):
+        # addresses only the remote side has, with its data
+        self.missing_locally = {}
+        # addresses only the local side has, with its data
+        self.missing_remotely = {}
+        # addresses whose data differs, with (local, remote) data
+        self.different = {}
+        self.buckets_compared = 0
+        self.buckets_fetched = 0
+
+    def __bool__(self):
+        return bool(
+            self.missing_locally or self.missing_remotely or self.different)
+
+
+def reconcile(local, remote, depth, prefixes=None, leaf_size=64):
+    '''
+    Compare two sides bucket by bucket and return a Reconciliation.
+
+    depth -- the split depth both sides' indexes were built with
+    prefixes -- the buckets to start from; every type by default
+    leaf_size -- fetch the entries of a differing bucket rather than
+        descending into it once neither side holds more than this many
+    '''
+    result = Reconciliation()
+    leaf_length = TYPE_PREFIX_LENGTH + depth
+    level = list(prefixes or TYPE_PREFIXES)
+
+    while level:
+        local_digests = local.digests(level)
+        remote_digests = remote.digests(level)
+        result.buckets_compared += len(level)
+
+        next_level = []
+        for prefix in level:
+            local_count, local_digest = local_digests[prefix]
+            remote_count, remote_digest = remote_digests[prefix]
+
+            if local_count == remote_count and local_digest == remote_digest:
+                continue
+
+            if (len(prefix) >= leaf_length
+                    or max(local_count, remote_count) <= leaf_size):
+                _diff_bucket(local, remote, prefix, local_count,
+                             remote_count, result)
+            else:
+                next_level.extend(prefix + c for c in _HEX)
+
+        level = next_level
+
+    return result
+
+
+def _diff_bucket(local, remote, prefix, local_count, remote_count, result):
+    result.buckets_fetched += 1
+
+    local_entries = local.entries(prefix) if local_count else {}
+    remote_entries = remote.entries(prefix) if remote_count else {}
+
+    for address, data in remote_entries.items():
+        local_data = local_entries.get(address)
+        if local_data is None:
+            result.missing_locally[address] = data
+        elif local_data != data:
+            result.different[address] = (local_data, data)
+
+    for address, data in local_entries.items():
+        if address not in remote_entries:
+            result.missing_remotely[address] = data
+
+
+def _entry_digest(address, data):
+    return int.from_bytes(
+        hashlib.sha256(address.encode() + b'\0' + data).digest(), 'big')
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Reconcile two local OMI state exports by bucket '
+                    'digests.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'local',
+        help='the local export, e.g. from the catalog database')
+
+    parser.add_argument(
+        'remote',
+        help='the remote export, e.g. from chain state')
+
+    parser.add_argument(
+        '--depth',
+        type=int,
+        default=4,
+        help='hex characters after the type prefix to split buckets by')
+
+    parser.add_argument(
+        '--leaf-size',
+        type=int,
+        default=64,
+        help='fetch entries for differing buckets of at most this size')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    local = CountingSide(DigestIndex(read_export(args.local), args.depth))
+    remote = CountingSide(DigestIndex(read_export(args.remote), args.depth))
+
+    result = reconcile(local, remote, args.depth, leaf_size=args.leaf_size)
+
+    for address in sorted(result.missing_locally):
+        print('missing locally\t{}'.format(address))
+    for address in sorted(result.missing_remotely):
+        print('missing remotely\t{}'.format(address))
+    for address in sorted(result.different):
+        print('different\t{}'.format(address))
+
+    print('{} buckets compared, {} fetched, {} remote reads'.format(
+        result.buckets_compared, result.buckets_fetched, remote.reads),
+        file=sys.stderr)
+
+    if result:
+        sys.exit(1)
@@ -0,0 +1,366 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Parallel re-validation of exported OMI transaction history.
+
+The ordered batch stream is split into components: batches are joined
+whenever their declared input/output addresses overlap, transitively.
+Since the validator only lets a transaction touch the addresses it
+declares, and this replay enforces the same rule, batches in different
+components can't affect each other, so each component is replayed on a
+process pool against its own in-memory state, in its original order.
+Results are merged by stream position, so the verdicts are exactly those
+of a serial replay.
+
+A batch is COMMITTED if every transaction in it is valid, otherwise it
+is INVALID and none of its writes are kept, as on the validator.
+
+With --prevalidate-workers, each replay process also runs the stateless
+stage of apply on a pipeline.Prevalidator, a window of transactions
+ahead of the one being applied.
+'''
+
+import argparse
+import collections
+import concurrent.futures
+import functools
+import json
+import os
+import sys
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.processor.state import StateEntry
+
+from sawtooth_omi.batch_stream import group_by_batch
+from sawtooth_omi.batch_stream import read_batches
+from sawtooth_omi.batch_stream import read_transactions
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.pipeline import Prevalidator
+
+
+COMMITTED = 'COMMITTED'
+INVALID = 'INVALID'
+
+# The length of a full address; shorter declarations are prefixes
+ADDRESS_LENGTH = 70
+
+# Transactions prevalidated ahead of the one being applied
+PREVALIDATE_AHEAD = 1000
+
+
+# The fields of a TpProcessRequest that the handler uses
+ReplayRequest = collections.namedtuple(
+    'ReplayRequest', ['header', 'payload', 'signature'])
+
+
+class BatchVerdict:
+    __slots__ = ('index', 'batch_id', 'status', 'reason')
+
+    def __init__(self, index, batch_id, status, reason=None):
+        self.index = index
+        self.batch_id = batch_id
+        self.status = status
+        self.reason = reason
+
+
+class _ReplayBatch:
+    __slots__ = ('index', 'batch_id', 'requests', 'declared')
+
+    def __init__(self, index, batch_id, transactions):
+        self.index = index
+        self.batch_id = batch_id
+        self.requests = [
+            (ReplayRequest(
+                txn.transaction.header,
+                txn.transaction.payload,
+                txn.txn_id),
+             txn.inputs,
+             txn.outputs)
+            for txn in transactions
+        ]
+        self.declared = frozenset().union(
+            *(txn.inputs | txn.outputs for txn in transactions))
+
+
+class _AuthorizationError(Exception):
+    pass
+
+
+class _TransactionState:
+    '''
+    A view of a batch's pending writes over the component state that
+    only allows the addresses a transaction declared, like the
+    validator's context
+    '''
+
+    def __init__(self, base, pending, inputs, outputs):
+        self._base = base
+        self._pending = pending
+        self._inputs = inputs
+        self._outputs = outputs
+
+    def get(self, addresses):
+        entries = []
+        for address in addresses:
+            if not _declared(address, self._inputs):
+                raise _AuthorizationError(
+                    'Read of undeclared address {}'.format(address))
+
+            if address in self._pending:
+                entries.append(StateEntry(
+                    address=address, data=self._pending[address]))
+            else:
+                entries.extend(self._base.get([address]))
+        return entries
+
+    def set(self, entries):
+        for entry in entries:
+            if not _declared(entry.address, self._outputs):
+                raise _AuthorizationError(
+                    'Write of undeclared address {}'.format(entry.address))
+
+        for entry in entries:
+            self._pending[entry.address] = entry.data
+        return [entry.address for entry in entries]
+
+
+def _declared(address, declared):
+    if address in declared:
+        return True
+    return any(
+        address.startswith(prefix)
+        for prefix in declared
+        if len(prefix) < ADDRESS_LENGTH)
+
+
+def read_replay_batches(paths):
+    '''
+    return the batches of stream files as a list ready for replay
+    '''
+    return [
+        _ReplayBatch(index, batch_id, group)
+        for index, (batch_id, group) in enumerate(
+            group_by_batch(read_transactions(read_batches(paths))))
+    ]
+
+
+def partition(batches):
+    '''
+    return lists of batch indexes, each list a component of batches
+    with overlapping addresses, in stream order
+    '''
+    parent = list(range(len(batches)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i, j):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[max(i, j)] = min(i, j)
+
+    owner = {}
+    prefixes = []
+    for batch in batches:
+        for address in batch.declared:
+            if len(address) < ADDRESS_LENGTH:
+                prefixes.append((address, batch.index))
+            if address in owner:
+                union(owner[address], batch.index)
+            else:
+                owner[address] = batch.index
+
+    # A declared prefix overlaps every address beneath it
+    for prefix, index in prefixes:
+        for address, other in owner.items():
+            if address.startswith(prefix) or prefix.startswith(address):
+                union(index, other)
+
+    components = collections.OrderedDict()
+    for batch in batches:
+        components.setdefault(find(batch.index), []).append(batch.index)
+
+    return list(components.values())
+
+
+def replay_component(batches, prevalidate_workers=None):
+    '''
+    replay batches in order against fresh state and return verdicts;
+    with prevalidate_workers, run the stateless stage on that many
+    threads ahead of apply
+    '''
+    prevalidator = None
+    if prevalidate_workers:
+        prevalidator = Prevalidator(
+            prevalidate_workers, max_pending=2 * PREVALIDATE_AHEAD)
+
+    try:
+        return _replay_component(
+            batches, OMITransactionHandler(prevalidator=prevalidator),
+            prevalidator)
+    finally:
+        if prevalidator is not None:
+            prevalidator.shutdown()
+
+
+def _replay_component(batches, handler, prevalidator):
+    requests = [
+        request for batch in batches for request, _, _ in batch.requests]
+    submitted = 0
+    position = 0
+
+    state = LocalState()
+    verdicts = []
+
+    for batch in batches:
+        pending = {}
+        reason = None
+
+        for offset, (request, inputs, outputs) in enumerate(batch.requests):
+            if prevalidator is not None:
+                ahead = min(
+                    len(requests), position + offset + PREVALIDATE_AHEAD)
+                while submitted < ahead:
+                    prevalidator.submit(requests[submitted])
+                    submitted += 1
+
+            try:
+                handler.apply(
+                    request,
+                    _TransactionState(state, pending, inputs, outputs))
+            except (InvalidTransaction, _AuthorizationError) as err:
+                reason = '{}: {}'.format(request.signature[:16], err)
+                break
+
+        if reason is None:
+            state.set([
+                StateEntry(address=address, data=data)
+                for address, data in pending.items()
+            ])
+            verdicts.append(BatchVerdict(
+                batch.index, batch.batch_id, COMMITTED))
+        else:
+            verdicts.append(BatchVerdict(
+                batch.index, batch.batch_id, INVALID, reason))
+
+        position += len(batch.requests)
+
+    return verdicts
+
+
+def _replay_bin(components, prevalidate_workers=None):
+    verdicts = []
+    for component in components:
+        verdicts.extend(replay_component(component, prevalidate_workers))
+    return verdicts
+
+
+def replay(batches, workers=None, prevalidate_workers=None):
+    '''
+    Replay batches and return their BatchVerdicts in stream order. With
+    workers=0 the replay is serial, in this process.
+    '''
+    if workers == 0:
+        return replay_component(batches, prevalidate_workers)
+
+    workers = workers or os.cpu_count() or 1
+    components = partition(batches)
+
+    # Pack components into a few bins per worker, largest first, to
+    # balance the pool without a task per tiny component
+    bins = [[] for _ in range(min(len(components), workers * 4))]
+    sizes = [0] * len(bins)
+    for component in sorted(components, key=len, reverse=True):
+        smallest = sizes.index(min(sizes))
+        bins[smallest].append([batches[i] for i in component])
+        sizes[smallest] += len(component)
+
+    verdicts = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for result in executor.map(
+                functools.partial(
+                    _replay_bin, prevalidate_workers=prevalidate_workers),
+                bins):
+            verdicts.extend(result)
+
+    verdicts.sort(key=lambda verdict: verdict.index)
+    return verdicts
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Re-validate exported OMI transaction history.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'batch_streams',
+        nargs='+',
+        help='files of length-prefixed BatchLists, in chain order')
+
+    parser.add_argument(
+        '--expected',
+        help='a JSON file mapping batch IDs to their recorded status, '
+             'COMMITTED or INVALID')
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        help='size of the process pool; 0 replays serially')
+
+    parser.add_argument(
+        '--prevalidate-workers',
+        type=int,
+        help='threads per replay process that parse and check '
+             'transactions ahead of apply')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    verdicts = replay(
+        read_replay_batches(args.batch_streams), args.workers,
+        args.prevalidate_workers)
+
+    counts = collections.Counter(verdict.status for verdict in verdicts)
+    print('{} batches: {} committed, {} invalid'.format(
+        len(verdicts), counts[COMMITTED], counts[INVALID]))
+
+    if args.expected is None:
+        return
+
+    with open(args.expected) as fd:
+        expected = json.load(fd)
+
+    mismatches = 0
+    for verdict in verdicts:
+        recorded = expected.get(verdict.batch_id)
+        if recorded is not None and recorded != verdict.status:
+            mismatches += 1
+            print('{} recorded {} replayed {}{}'.format(
+                verdict.batch_id, recorded, verdict.status,
+                ' ({})'.format(verdict.reason) if verdict.reason else ''))
+
+    print('{} mismatches'.format(mismatches))
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,150 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Startup measurement for omi-tp: how old the process is, and what its
+imports cost as reported by `python -X importtime`.
+
+This module must stay cheap to import, since omi-tp uses it before the
+processor stack is loaded.
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+# Fallback reference point when the process start time is unavailable
+_IMPORTED_AT = time.time()
+
+
+class ImportTime:
+    __slots__ = ('module', 'self_us', 'cumulative_us', 'depth')
+
+    def __init__(self, module, self_us, cumulative_us, depth):
+        self.module = module
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.depth = depth
+
+
+def process_uptime():
+    '''
+    return the seconds since this process started, measured from the
+    kernel's process start time where available (Linux), otherwise from
+    the import of this module
+    '''
+    try:
+        with open('/proc/self/stat') as fd:
+            # the command name may contain spaces; fields resume after ')'
+            fields = fd.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as fd:
+            system_uptime = float(fd.read().split()[0])
+
+        # starttime is field 22, the 20th after the command name
+        start_ticks = int(fields[19])
+        ticks_per_second = os.sysconf('SC_CLK_TCK')
+
+        return system_uptime - start_ticks / ticks_per_second
+    except (OSError, ValueError, IndexError):
+        return time.time() - _IMPORTED_AT
+
+
+def parse_importtime(output):
+    '''
+    parse the stderr of `python -X importtime` into ImportTimes, in the
+    order the imports completed
+    '''
+    times = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # the header line
+            continue
+
+        name = fields[2].rstrip()
+        module = name.lstrip()
+        depth = (len(name) - len(module) - 1) // 2
+
+        times.append(ImportTime(module, self_us, cumulative_us, depth))
+
+    return times
+
+
+def measure_imports(module, python=sys.executable, env=None):
+    '''
+    import a module in a fresh interpreter and return its ImportTimes
+    '''
+    result = subprocess.run(
+        [python, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True)
+
+    if result.returncode != 0:
+        raise RuntimeError('Unable to import {}: {}'.format(
+            module, result.stderr.strip().splitlines()[-1:]))
+
+    return parse_importtime(result.stderr)
+
+
+def create_parser(prog_name):
+    parser = argparse.ArgumentParser(
+        prog=prog_name,
+        description='Report the import cost of omi-tp modules.',
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    parser.add_argument(
+        'modules',
+        nargs='*',
+        default=['sawtooth_omi.main', 'sawtooth_omi.handler',
+                 'sawtooth_sdk.processor.core'],
+        help='modules to import in a fresh interpreter')
+
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=15,
+        help='number of most expensive imports to show per module')
+
+    return parser
+
+
+def main(prog_name=os.path.basename(sys.argv[0]), args=sys.argv[1:]):
+    parser = create_parser(prog_name)
+    args = parser.parse_args(args)
+
+    for module in args.modules:
+        times = measure_imports(module)
+        total = sum(t.cumulative_us for t in times if t.depth == 0)
+
+        print('{}: {:.1f} ms, {} modules'.format(
+            module, total / 1000, len(times)))
+
+        for t in sorted(times, key=lambda t: -t.self_us)[:args.top]:
+            print('  {:9.1f} ms self {:9.1f} ms cumulative  {}'.format(
+                t.self_us / 1000, t.cumulative_us / 1000, t.module))
@@ -0,0 +1,284 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+Span tracing for the OMI client tooling and transaction processor.
+
+Spans are recorded in the Zipkin v2 JSON format and exported either to
+a file, one span per line, or to a collector's /api/v2/spans endpoint.
+
+The client and the processor never exchange trace context: the REST
+API doesn't pass it on. Instead both derive a transaction's trace ID and
+root span ID from its header signature, so the client's submit span and
+the processor's apply span land in the same trace, with the apply as a
+child of the submit. Client spans are also tagged with the batch ID.
+
+When tracing is disabled, NOOP_SPAN stands in for spans, so
+instrumented code only pays for entering a shared no-op context.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+CLIENT = 'CLIENT'
+SERVER = 'SERVER'
+
+
+def transaction_trace_ids(signature):
+    '''
+    return the (trace ID, root span ID) shared by every span of the
+    transaction with this header signature
+    '''
+    digest = hashlib.sha256(signature.encode()).hexdigest()
+    return digest[:32], digest[32:48]
+
+
+def _new_span_id():
+    return os.urandom(8).hex()
+
+
+def _now_us():
+    return int(time.time() * 1000000)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def phase(self, name):
+        return self
+
+    def tag(self, key, value):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ('_tracer', '_record', '_start', '_clock_start')
+
+    def __init__(self, tracer, name, trace_id, span_id=None, parent_id=None,
+                 kind=None, tags=None):
+        self._tracer = tracer
+        self._record = {
+            'traceId': trace_id,
+            'id': span_id or _new_span_id(),
+            'name': name,
+            'localEndpoint': {'serviceName': tracer.service_name},
+        }
+        if parent_id is not None:
+            self._record['parentId'] = parent_id
+        if kind is not None:
+            self._record['kind'] = kind
+        if tags:
+            self._record['tags'] = {k: str(v) for k, v in tags.items()}
+
+        self._start = None
+        self._clock_start = None
+
+    @property
+    def trace_id(self):
+        return self._record['traceId']
+
+    @property
+    def span_id(self):
+        return self._record['id']
+
+    def __enter__(self):
+        self._start = _now_us()
+        self._clock_start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.tag('error', exc if str(exc) else exc_type.__name__)
+
+        record = self._record
+        record['timestamp'] = self._start
+        record['duration'] = max(
+            int((time.perf_counter() - self._clock_start) * 1000000), 1)
+        self._tracer.export(record)
+        return False
+
+    def phase(self, name):
+        '''
+        return a child span, to be used as a context manager
+        '''
+        return Span(self._tracer, name, self.trace_id, parent_id=self.span_id)
+
+    def tag(self, key, value):
+        self._record.setdefault('tags', {})[key] = str(value)
+
+
+class SpanGroup:
+    '''
+    Spans for several traces that time the same work, e.g. the
+    transactions of one submitted batch
+    '''
+
+    __slots__ = ('spans',)
+
+    def __init__(self, spans):
+        self.spans = spans
+
+    def __enter__(self):
+        for span in self.spans:
+            span.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        for span in self.spans:
+            span.__exit__(exc_type, exc, tb)
+        return False
+
+    def phase(self, name):
+        return SpanGroup([span.phase(name) for span in self.spans])
+
+    def tag(self, key, value):
+        for span in self.spans:
+            span.tag(key, value)
+
+
+class Tracer:
+    '''
+    Records spans and hands them to an exporter in batches, on a
+    background thread so that exporting never blocks the traced code
+    '''
+
+    def __init__(self, exporter, service_name, flush_every=100):
+        self.service_name = service_name
+        self._exporter = exporter
+        self._flush_every = flush_every
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._export_loop, name='span-exporter', daemon=True)
+        self._thread.start()
+
+    def span(self, name, trace_id, span_id=None, parent_id=None, kind=None,
+             tags=None):
+        return Span(self, name, trace_id, span_id, parent_id, kind, tags)
+
+    def export(self, record):
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) < self._flush_every:
+                return
+            records, self._pending = self._pending, []
+        self._queue.put(records)
+
+    def flush(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+        if records:
+            self._queue.put(records)
+        self._queue.join()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._exporter.close()
+
+    def _export_loop(self):
+        while True:
+            records = self._queue.get()
+            try:
+                if records is None:
+                    return
+                self._exporter.export(records)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to export %s spans', len(records))
+            finally:
+                self._queue.task_done()
+
+
+class FileExporter:
+    '''
+    Appends spans to a file as JSON lines
+    '''
+
+    def __init__(self, path):
+        self._fd = open(path, 'a')
+
+    def export(self, records):
+        for record in records:
+            self._fd.write(json.dumps(record, sort_keys=True))
+            self._fd.write('\n')
+        self._fd.flush()
+
+    def close(self):
+        self._fd.close()
+
+
+class HttpExporter:
+    '''
+    Posts spans to a Zipkin-compatible collector
+    '''
+
+    def __init__(self, url, timeout=5):
+        self._url = url.rstrip('/') + '/api/v2/spans'
+        self._timeout = timeout
+
+    def export(self, records):
+        # urllib is only needed, and imported, when tracing to a collector
+        import urllib.request
+
+        request = urllib.request.Request(
+            self._url,
+            data=json.dumps(records).encode(),
+            headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self._timeout):
+            pass
+
+    def close(self):
+        pass
+
+
+def read_spans(path):
+    '''
+    return the spans in a file written by FileExporter
+    '''
+    with open(path) as fd:
+        return [json.loads(line) for line in fd if line.strip()]
+
+
+def create_tracer(service_name, trace_file=None, trace_url=None):
+    '''
+    return a Tracer exporting to a file or collector, or None if
+    neither is given
+    '''
+    if trace_file is not None:
+        return Tracer(FileExporter(trace_file), service_name)
+    if trace_url is not None:
+        return Tracer(HttpExporter(trace_url), service_name)
+    return None
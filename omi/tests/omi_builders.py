@@ -0,0 +1,76 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+OMI objects and transaction requests for tests that drive the handler
+without a validator.
+'''
+
+import collections
+
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from sawtooth_omi.protobuf.recording_pb2 import Recording
+from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+from sawtooth_omi.protobuf.work_pb2 import Work
+
+
+# The fields of a TpProcessRequest that the handler uses
+Request = collections.namedtuple('Request', ['header', 'payload', 'signature'])
+
+SIGNER = '02' + 'ab' * 32
+
+
+def make_request(signature, action, obj, signer=SIGNER, version='1.0'):
+    header = TransactionHeader(
+        signer_pubkey=signer, family_version=version).SerializeToString()
+    payload = OMITransactionPayload(
+        action=action, data=obj.SerializeToString()).SerializeToString()
+    return Request(header, payload, signature)
+
+
+def make_work(title, splits):
+    '''
+    splits -- (songwriter, publisher, split) triples
+    '''
+    return Work(title=title, songwriter_publisher_splits=[
+        Work.SongwriterPublisherSplit(
+            split=split,
+            songwriter_publisher=Work.SongwriterPublisher(
+                songwriter_name=songwriter, publisher_name=publisher))
+        for songwriter, publisher, split in splits])
+
+
+def make_recording(title, contributors, works, recordings=(),
+                   overall=(50, 0, 50)):
+    '''
+    contributors, works, recordings -- (name, split) pairs; overall --
+    the derived work, derived recording and contributor portions
+    '''
+    return Recording(
+        title=title,
+        overall_split=Recording.RecordingOverallSplit(
+            derived_work_portion=overall[0],
+            derived_recording_portion=overall[1],
+            contributor_portion=overall[2]),
+        contributor_splits=[
+            Recording.ContributorSplit(split=split, contributor_name=name)
+            for name, split in contributors],
+        derived_work_splits=[
+            Recording.DerivedWorkSplit(split=split, work_name=name)
+            for name, split in works],
+        derived_recording_splits=[
+            Recording.DerivedRecordingSplit(split=split, recording_name=name)
+            for name, split in recordings])
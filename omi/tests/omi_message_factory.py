@@ -15,11 +15,12 @@
 
 from sawtooth_processor_test.message_factory import MessageFactory
 
+from sawtooth_omi import codec
+from sawtooth_omi.addressing import plan_addresses
 from sawtooth_omi.handler import FAMILY_NAME
+from sawtooth_omi.handler import INDEXED_VERSION
 from sawtooth_omi.handler import OMI_ADDRESS_PREFIX
-from sawtooth_omi.handler import make_omi_address
 from sawtooth_omi.handler import get_tag, get_object_type
-from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
 
 from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
 
@@ -29,7 +30,7 @@ class OMIMessageFactory:
         self._factory = MessageFactory(
             encoding='application/protobuf',
             family_name=FAMILY_NAME,
-            family_version='1.0',
+            family_version=INDEXED_VERSION,
             namespace=OMI_ADDRESS_PREFIX,
             private=private,
             public=public)
@@ -47,61 +48,11 @@ class OMIMessageFactory:
 
         obj = obj_type(**kwargs)
 
-        payload = OMITransactionPayload(
+        payload = codec.serialize(OMITransactionPayload(
             action=action,
-            data=obj.SerializeToString()).SerializeToString()
+            data=codec.serialize(obj)))
 
-        if tag in (INDIVIDUAL, ORGANIZATION):
-            name = kwargs['name']
-        elif tag in (WORK, RECORDING):
-            name = kwargs['title']
-
-        obj_address = make_omi_address(name, tag)
-
-        if tag in (INDIVIDUAL, ORGANIZATION):
-            inputs = [obj_address]
-        elif tag in (WORK, RECORDING):
-            inputs = [obj_address] + _reference_addresses(tag, **kwargs)
+        inputs, outputs = plan_addresses(obj, tag, self.public_key)
 
         return self._factory.create_transaction(
-            payload, inputs, [obj_address], [])
-
-
-def _reference_addresses(tag, **kwargs):
-    if tag == WORK:
-        splits = kwargs['songwriter_publisher_splits']
-
-        songwriter_publishers = [
-            split['songwriter_publisher']
-            for split in splits
-        ]
-
-        songwriter_addresses = [
-            make_omi_address(song_pub['songwriter_name'], INDIVIDUAL)
-            for song_pub in songwriter_publishers
-        ]
-
-        publisher_addresses = [
-            make_omi_address(song_pub['publisher_name'], ORGANIZATION)
-            for song_pub in songwriter_publishers
-        ]
-
-        return songwriter_addresses + publisher_addresses
-
-    elif tag == RECORDING:
-        contributor_addresses = [
-            make_omi_address(split['contributor_name'], INDIVIDUAL)
-            for split in kwargs['contributor_splits']
-        ]
-
-        work_addresses = [
-            make_omi_address(split['work_name'], WORK)
-            for split in kwargs['derived_work_splits']
-        ]
-
-        recording_addresses = [
-            make_omi_address(split['recording_name'], RECORDING)
-            for split in kwargs['derived_recording_splits']
-        ]
-
-        return contributor_addresses + work_addresses + recording_addresses
+            payload, inputs, outputs, [])
@@ -0,0 +1,192 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# -----------------------------------------------------------------------------
+
+'''
+A stand-in for the Sawtooth REST API's /batches and /batch_status
+endpoints, for driving load without a validator.
+
+Posted batches commit at the first simulated block boundary that is at
+least `commit_delay` seconds after they arrive and, with a
+`block_capacity`, has room for them. With a `queue_limit`, a POST that
+would leave more than that many batches uncommitted is rejected with
+429, as a full validator queue is. A `stall` makes the next POST hang,
+to simulate a validator pause. `requires` maps a batch ID to one it
+depends on, as a work depends on its songwriters' identities; a batch
+posted before the one it requires is INVALID. Run it directly to serve
+on a port:
+
+    python rest_api_standin.py --port 8080 --block-interval 1
+'''
+
+import argparse
+import collections
+import heapq
+import http.server
+import json
+import math
+import socketserver
+import threading
+import time
+import urllib.parse
+
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+
+class RestApiStandin:
+    def __init__(self, port=0, block_interval=0.5, commit_delay=0.0,
+                 queue_limit=None, block_capacity=None, requires=None):
+        self.block_interval = block_interval
+        self.commit_delay = commit_delay
+        self.queue_limit = queue_limit
+        self.block_capacity = block_capacity
+        self.requires = requires or {}
+        self.stall = 0.0
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+        # batch ID -> commit time
+        self._commits = {}
+        self._invalid = set()
+        # commit times of the uncommitted batches, and batches per block
+        self._uncommitted = []
+        self._blocks = collections.Counter()
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_port)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def post(self, batch_list_bytes):
+        with self._lock:
+            stall, self.stall = self.stall, 0.0
+        time.sleep(stall)
+
+        batch_list = BatchList()
+        batch_list.ParseFromString(batch_list_bytes)
+
+        now = time.monotonic()
+        block = math.ceil((now + self.commit_delay) / self.block_interval)
+        with self._lock:
+            uncommitted = self._uncommitted
+            while uncommitted and uncommitted[0] <= now:
+                heapq.heappop(uncommitted)
+            if self.queue_limit is not None and \
+                    len(uncommitted) + len(batch_list.batches) \
+                    > self.queue_limit:
+                self.rejected += 1
+                return False
+
+            for batch in batch_list.batches:
+                required = self.requires.get(batch.header_signature)
+                if required is not None and required not in self._commits:
+                    self._invalid.add(batch.header_signature)
+                    continue
+                while self.block_capacity is not None and \
+                        self._blocks[block] >= self.block_capacity:
+                    block += 1
+                self._blocks[block] += 1
+                commit = block * self.block_interval
+                self._commits[batch.header_signature] = commit
+                heapq.heappush(uncommitted, commit)
+
+        return True
+
+    def statuses(self, batch_ids, wait=0):
+        deadline = time.monotonic() + wait
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                statuses = {}
+                for batch_id in batch_ids:
+                    commit = self._commits.get(batch_id)
+                    if batch_id in self._invalid:
+                        statuses[batch_id] = 'INVALID'
+                    elif commit is None:
+                        statuses[batch_id] = 'UNKNOWN'
+                    elif commit <= now:
+                        statuses[batch_id] = 'COMMITTED'
+                    else:
+                        statuses[batch_id] = 'PENDING'
+
+            if now >= deadline or 'PENDING' not in statuses.values():
+                return statuses
+            time.sleep(min(0.01, deadline - now))
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        if self.server.standin.post(data):
+            self._reply(202, {'link': '/batch_status'})
+        else:
+            self._reply(429, {'error': {
+                'code': 31, 'title': 'Unable to Accept Batches'}})
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        statuses = self.server.standin.statuses(
+            query['id'][0].split(','),
+            float(query.get('wait', ['0'])[0]))
+        self._reply(200, {'data': [
+            {'id': batch_id, 'status': status}
+            for batch_id, status in statuses.items()]})
+
+    def _reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--block-interval', type=float, default=1.0)
+    parser.add_argument('--commit-delay', type=float, default=0.0)
+    parser.add_argument('--queue-limit', type=int)
+    parser.add_argument('--block-capacity', type=int)
+    args = parser.parse_args()
+
+    standin = RestApiStandin(
+        args.port, args.block_interval, args.commit_delay,
+        args.queue_limit, args.block_capacity)
+    standin.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,150 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import io
+import json
+import unittest
+
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+
+from sawtooth_omi.adaptive import AdaptiveSubmitter
+from sawtooth_omi.adaptive import AimdController
+from sawtooth_omi.client import OMIRestClient
+
+from rest_api_standin import RestApiStandin
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestAimdController(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.metrics = io.StringIO()
+        self.controller = AimdController(
+            target_latency=1.0, max_batch=8, metrics=self.metrics,
+            clock=self.clock)
+
+    def _complete(self, latency):
+        ticket = self.controller.sent()
+        self.clock.now += latency
+        self.controller.on_completed(ticket, self.controller.batch_size)
+
+    def test_grows_a_step_per_window(self):
+        for _ in range(1 + 2 + 3):
+            self._complete(0.1)
+
+        self.assertEqual(
+            (self.controller.window, self.controller.batch_size), (4, 4))
+
+    def test_cuts_once_per_round(self):
+        for _ in range(10):
+            self._complete(0.1)
+        self.assertEqual(self.controller.window, 5)
+
+        # Everything in flight when the API pushed back counts once
+        tickets = [self.controller.sent() for _ in range(5)]
+        self.clock.now += 0.1
+        for ticket in tickets:
+            self.controller.on_rejected(ticket)
+        self.assertEqual(self.controller.window, 2)
+
+        self.clock.now += 0.1
+        self.controller.on_rejected(self.controller.sent())
+        self.assertEqual(self.controller.window, 1)
+
+        self._complete(2.0)
+        self.assertEqual(self.controller.batch_size, 2)
+
+        decisions = [
+            json.loads(line) for line in self.metrics.getvalue().splitlines()]
+        self.assertEqual(
+            [decision['reason'] for decision in decisions[-4:]],
+            ['rejected', 'rejected', 'accepted', 'slow'])
+        self.assertEqual(decisions[-1]['rejected'], 6)
+
+
+class TestAdaptiveSubmitter(unittest.TestCase):
+    def setUp(self):
+        self.standin = RestApiStandin(
+            block_interval=0.02, queue_limit=40, block_capacity=20)
+        self.standin.start()
+
+    def tearDown(self):
+        self.standin.stop()
+
+    def test_backs_off_a_full_queue(self):
+        metrics = io.StringIO()
+        controller = AimdController(
+            target_latency=0.5, max_window=8, metrics=metrics)
+        submitter = AdaptiveSubmitter(
+            OMIRestClient(self.standin.url), controller, wait=1,
+            poll_interval=0.01)
+
+        batches = [
+            Batch(header_signature='{:0128x}'.format(i)) for i in range(600)]
+        statuses = submitter.submit(batches)
+
+        self.assertEqual(len(statuses), 600)
+        self.assertEqual(set(statuses.values()), {'COMMITTED'})
+        self.assertGreater(self.standin.rejected, 0)
+        self.assertEqual(controller.rejected, self.standin.rejected)
+
+        decisions = [
+            json.loads(line) for line in metrics.getvalue().splitlines()]
+        self.assertGreater(max(d['window'] for d in decisions), 1)
+        self.assertGreater(max(d['batch_size'] for d in decisions), 1)
+
+    def test_keeps_dependent_batches_in_order(self):
+        self.standin.stop()
+        batch_ids = ['{:0128x}'.format(i) for i in range(300)]
+        # each batch depends on the one before it
+        self.standin = RestApiStandin(
+            block_interval=0.02, queue_limit=40, block_capacity=20,
+            requires=dict(zip(batch_ids[1:], batch_ids)))
+        self.standin.start()
+
+        controller = AimdController(target_latency=0.5, max_window=8)
+        submitter = AdaptiveSubmitter(
+            OMIRestClient(self.standin.url), controller, wait=1,
+            poll_interval=0.01)
+        statuses = submitter.submit(
+            Batch(header_signature=batch_id) for batch_id in batch_ids)
+
+        self.assertEqual(set(statuses.values()), {'COMMITTED'})
+        self.assertGreater(self.standin.rejected, 0)
+
+    def test_batch_lists_larger_than_a_status_query(self):
+        self.standin.stop()
+        # a 600-batch status query is past the stand-in's 414 limit
+        self.standin = RestApiStandin(block_interval=0.02)
+        self.standin.start()
+
+        controller = AimdController(
+            target_latency=0.5, min_batch=600, max_window=2)
+        submitter = AdaptiveSubmitter(
+            OMIRestClient(self.standin.url), controller, wait=1,
+            poll_interval=0.01)
+        statuses = submitter.submit(
+            Batch(header_signature='{:0128x}'.format(i))
+            for i in range(1300))
+
+        self.assertEqual(len(statuses), 1300)
+        self.assertEqual(set(statuses.values()), {'COMMITTED'})
@@ -0,0 +1,150 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from sawtooth_omi.addressing import plan_addresses
+from sawtooth_omi.handler import INDEXED_VERSION
+from sawtooth_omi.handler import INDIVIDUAL
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.handler import PrevalidatedTransaction
+from sawtooth_omi.handler import apply_prevalidated
+from sawtooth_omi.handler import get_tag
+from sawtooth_omi.handler import make_owner_index_address
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+
+from omi_builders import make_recording
+from omi_builders import make_request
+from omi_builders import make_work
+from omi_builders import SIGNER
+
+
+OTHER = '03' + 'cd' * 32
+
+
+class RecordingState(LocalState):
+    '''
+    Records the addresses the handler reads and writes, in order
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.reads = []
+        self.writes = []
+
+    def get(self, addresses):
+        self.reads.extend(addresses)
+        return super().get(addresses)
+
+    def set(self, entries):
+        self.writes.extend(entry.address for entry in entries)
+        return super().set(entries)
+
+
+def _first_seen(addresses):
+    return list(dict.fromkeys(addresses))
+
+
+def _registered(obj):
+    obj.registering_pubkey = SIGNER
+    return obj
+
+
+class TestPlanAddresses(unittest.TestCase):
+    def setUp(self):
+        self.state = RecordingState()
+        self.handler = OMITransactionHandler()
+
+    def _check(self, action, obj, version=INDEXED_VERSION, signer=SIGNER):
+        '''
+        apply obj and compare what the handler touched with the plan
+        '''
+        inputs, outputs = plan_addresses(
+            obj, get_tag(action), signer, version)
+        self.state.reads, self.state.writes = [], []
+
+        self.handler.apply(
+            make_request(
+                str(len(self.state)), action, obj, signer, version),
+            self.state)
+
+        self.assertEqual(_first_seen(self.state.reads), inputs)
+        self.assertEqual(len(inputs), len(set(inputs)))
+        self.assertLessEqual(set(self.state.writes), set(outputs))
+        return inputs, outputs
+
+    def test_plans_match_the_handler(self):
+        for name in ('Tina Turner', 'Terry Britten', 'Graham Lyle'):
+            self._check('SetIndividualIdentity', IndividualIdentity(
+                name=name, pubkey=SIGNER))
+        self._check('SetOrganizationalIdentity', OrganizationalIdentity(
+            name='Good Songs', pubkey=SIGNER))
+
+        # the same songwriter and publisher in several splits
+        inputs, outputs = self._check('SetWork', _registered(make_work(
+            'What\'s Love Got to Do with It', [
+                ('Terry Britten', 'Good Songs', 50),
+                ('Graham Lyle', 'Good Songs', 25),
+                ('Terry Britten', 'Good Songs', 25)])))
+        self.assertEqual(len(inputs), 5)
+        self.assertEqual(self.state.writes, outputs)
+
+        recording = _registered(make_recording(
+            'Private Dancer',
+            [('Tina Turner', 60), ('Terry Britten', 40)],
+            [('What\'s Love Got to Do with It', 100)]))
+        recording.label_name = 'Capitol'
+        self._check('SetRecording', recording)
+
+        # a recording derived from itself reads its own address once
+        remix = _registered(make_recording(
+            'Private Dancer', [('Tina Turner', 100)],
+            [('What\'s Love Got to Do with It', 100)],
+            [('Private Dancer', 100)], overall=(30, 30, 40)))
+        inputs, _ = self._check('SetRecording', remix)
+        self.assertEqual(len(inputs), 4)
+
+        # an update leaves the index shard as it was
+        self._check('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER, ISNI='0000'))
+        self.assertEqual(len(self.state.writes), 1)
+
+    def test_unindexed_version_plans_no_shard(self):
+        inputs, outputs = self._check(
+            'SetIndividualIdentity',
+            IndividualIdentity(name='Tina Turner', pubkey=SIGNER), '1.0')
+        self.assertEqual((len(inputs), outputs), (1, self.state.writes))
+
+    def test_transfer_plans_both_shards(self):
+        self._check('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=OTHER), signer=OTHER)
+        old_shard = self.state.writes[-1]
+
+        # prevalidate only accepts objects owned by their signer, so the
+        # state stage is driven directly with the new owner's object
+        obj = IndividualIdentity(name='Tina Turner', pubkey=SIGNER)
+        inputs, outputs = plan_addresses(
+            obj, INDIVIDUAL, previous_owner=OTHER)
+        self.state.reads, self.state.writes = [], []
+        apply_prevalidated(PrevalidatedTransaction(
+            'SetIndividualIdentity', obj, OTHER, INDIVIDUAL, obj.name,
+            INDEXED_VERSION), self.state)
+
+        new_shard = make_owner_index_address(SIGNER, outputs[0])
+        self.assertEqual(_first_seen(self.state.reads), inputs)
+        self.assertEqual(self.state.writes, outputs)
+        self.assertEqual(outputs[1:], [old_shard, new_shard])
@@ -0,0 +1,106 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import random
+import unittest
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from sawtooth_omi import audit
+from sawtooth_omi.audit import CatalogArrays
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import _check_references
+from sawtooth_omi.handler import _check_split_sums
+from sawtooth_omi.handler import get_unique_key
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+
+from omi_builders import make_recording
+from omi_builders import make_work
+
+
+def _catalog(objects):
+    catalog = CatalogArrays()
+    for tag, obj in objects:
+        catalog.add(
+            make_omi_address(get_unique_key(obj, tag), tag), tag, obj)
+    return catalog
+
+
+@unittest.skipIf(audit.numpy is None, 'numpy is not installed')
+class TestAudit(unittest.TestCase):
+    def test_violations_are_reported_per_object(self):
+        catalog = _catalog([
+            (INDIVIDUAL, IndividualIdentity(name='Tina Turner')),
+            (ORGANIZATION, OrganizationalIdentity(name='Capitol')),
+            (WORK, make_work('Proud Mary', [
+                ('Tina Turner', 'Capitol', 60),
+                ('Ike Turner', 'Capitol', 30)])),
+            (RECORDING, make_recording(
+                'Proud Mary',
+                [('Tina Turner', 100)],
+                [('Proud Mary', 100)],
+                [('Nutbush', 40)],
+                overall=(50, 10, 50))),
+        ])
+
+        self.assertEqual([str(v) for v in audit.audit(catalog)], [
+            'work "Proud Mary": Songwriter-publisher split adds up to 90',
+            'work "Proud Mary": references unknown individual "Ike Turner"',
+            'recording "Proud Mary": Overall split adds up to 110',
+            'recording "Proud Mary": Derived recording split adds up to 40',
+            'recording "Proud Mary": references unknown recording '
+            '"Nutbush"',
+        ])
+
+    def test_agrees_with_the_handler_checks(self):
+        rng = random.Random(5)
+        people = ['person {}'.format(i) for i in range(20)]
+        objects = [
+            (INDIVIDUAL, IndividualIdentity(name=name))
+            for name in people[:15]
+        ] + [(ORGANIZATION, OrganizationalIdentity(name='label'))]
+
+        for i in range(200):
+            objects.append((WORK, make_work('work {}'.format(i), [
+                (rng.choice(people), 'label', rng.choice((25, 50, 50)))
+                for _ in range(2)])))
+        for i in range(200):
+            objects.append((RECORDING, make_recording(
+                'recording {}'.format(i),
+                [(rng.choice(people), 100)],
+                [('work {}'.format(rng.randrange(250)),
+                  rng.choice((100, 100, 90)))],
+                overall=(50, 0, rng.choice((50, 50, 40))))))
+
+        state = LocalState({
+            make_omi_address(get_unique_key(obj, tag), tag):
+            obj.SerializeToString()
+            for tag, obj in objects
+        })
+        expected = set()
+        for tag, obj in objects:
+            try:
+                _check_split_sums(obj, tag)
+                _check_references(state, obj, tag)
+            except InvalidTransaction:
+                expected.add((tag, get_unique_key(obj, tag)))
+
+        violations = audit.audit(_catalog(objects))
+
+        self.assertTrue(expected)
+        self.assertEqual({(v.tag, v.name) for v in violations}, expected)
@@ -0,0 +1,80 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from sawtooth_omi import codec
+from sawtooth_omi.codec import Codec
+from sawtooth_omi.codec import SlowBackendError
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+
+from omi_builders import make_request
+from omi_builders import SIGNER
+
+
+class CountingCodec(Codec):
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+        self.calls = []
+
+    def parse(self, message_type, data):
+        self.calls.append(('parse', message_type.__name__))
+        return super().parse(message_type, data)
+
+    def parse_into(self, message, data):
+        self.calls.append(('parse_into', type(message).__name__))
+        return super().parse_into(message, data)
+
+    def serialize(self, message):
+        self.calls.append(('serialize', type(message).__name__))
+        return super().serialize(message)
+
+
+class TestCodec(unittest.TestCase):
+    def setUp(self):
+        self.codec = CountingCodec('python')
+        self.previous = codec.set_codec(self.codec)
+
+    def tearDown(self):
+        codec.set_codec(self.previous)
+
+    def test_handler_goes_through_the_installed_codec(self):
+        request = make_request(1, 'SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER))
+        OMITransactionHandler().apply(request, LocalState())
+
+        self.assertEqual(self.codec.calls, [
+            ('parse_into', 'TransactionHeader'),
+            ('parse_into', 'OMITransactionPayload'),
+            ('parse', 'IndividualIdentity'),
+            ('serialize', 'IndividualIdentity'),
+        ])
+
+    def test_slow_backend_can_be_refused(self):
+        with self.assertLogs('sawtooth_omi.codec', 'WARNING'):
+            self.assertEqual(codec.check_backend(), 'python')
+        with self.assertRaises(SlowBackendError):
+            codec.check_backend(require_fast=True)
+
+        self.codec.backend = 'upb'
+        self.assertEqual(codec.check_backend(require_fast=True), 'upb')
+
+    def test_detected_backend(self):
+        self.assertIn(codec.detect_backend(), ('python', 'cpp', 'upb'))
+        self.assertEqual(
+            codec.detect_backend() == 'python', not self.previous.is_fast)
@@ -0,0 +1,87 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import collections
+import unittest
+
+from sawtooth_omi.conflicts import analyze
+from sawtooth_omi.conflicts import batch_units
+from sawtooth_omi.conflicts import suggest_schedule
+
+
+Unit = collections.namedtuple(
+    'Unit', ['txn_id', 'batch_id', 'inputs', 'outputs'])
+
+
+def _unit(txn_id, inputs, outputs, batch_id=None):
+    return Unit(
+        txn_id, batch_id or txn_id, frozenset(inputs), frozenset(outputs))
+
+
+class TestConflicts(unittest.TestCase):
+    def test_shared_reads_do_not_conflict(self):
+        units = [
+            _unit('w1', ['w1', 'emi'], ['w1']),
+            _unit('w2', ['w2', 'emi'], ['w2']),
+            _unit('w3', ['w3', 'emi'], ['w3']),
+        ]
+
+        report = analyze(units)
+
+        self.assertEqual(report.critical_path, 1)
+        self.assertEqual(report.edge_count, 0)
+        self.assertEqual(report.parallelism, 3.0)
+
+    def test_write_orders_readers(self):
+        units = [
+            _unit('emi', ['emi'], ['emi']),
+            _unit('w1', ['w1', 'emi'], ['w1']),
+            _unit('w2', ['w2', 'emi'], ['w2']),
+            _unit('emi2', ['emi'], ['emi']),
+        ]
+
+        report = analyze(units)
+
+        self.assertEqual(report.depths, [1, 2, 2, 3])
+        self.assertEqual(report.edge_count, 5)
+        self.assertEqual(report.wave_widths, [1, 2, 1])
+        self.assertEqual(report.hot_addresses.most_common(1)[0][0], 'emi')
+
+    def test_schedule_preserves_dependencies(self):
+        units = [
+            _unit('a', ['a'], ['a']),
+            _unit('b', ['b', 'a'], ['b']),
+            _unit('c', ['c'], ['c']),
+            _unit('d', ['d'], ['d']),
+        ]
+
+        report = analyze(units)
+        schedule = suggest_schedule(units, report, max_batch_size=2)
+
+        self.assertEqual(
+            [[[u.txn_id for u in batch] for batch in wave]
+             for wave in schedule],
+            [[['a', 'c'], ['d']], [['b']]])
+
+    def test_batch_units_merge_addresses(self):
+        units = batch_units([
+            _unit('t1', ['x'], ['x'], batch_id='b1'),
+            _unit('t2', ['y'], ['y'], batch_id='b1'),
+            _unit('t3', ['y'], [], batch_id='b2'),
+        ])
+
+        self.assertEqual([u.batch_id for u in units], ['b1', 'b2'])
+        self.assertEqual(units[0].outputs, frozenset(['x', 'y']))
+        self.assertEqual(analyze(units).depths, [1, 2])
@@ -0,0 +1,98 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import ORGANIZATION
+from sawtooth_omi.hot_addresses import HotAddressHandler
+from sawtooth_omi.hot_addresses import HotAddressTracker
+from sawtooth_omi.hot_addresses import SpaceSaving
+from sawtooth_omi.hot_addresses import WindowedHeavyHitters
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+from sawtooth_omi.protobuf.work_pb2 import Work
+
+from omi_builders import make_request
+from omi_builders import SIGNER
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestHeavyHitters(unittest.TestCase):
+    def test_space_saving_keeps_heavy_hitters(self):
+        summary = SpaceSaving(10)
+        for i in range(1000):
+            summary.add('hot' if i % 3 == 0 else 'cold-{}'.format(i))
+
+        self.assertEqual(len(summary), 10)
+        counts = {item: (count, error)
+                  for item, count, error in summary.items()}
+        count, error = counts['hot']
+        self.assertTrue(count - error <= 334 <= count)
+
+    def test_window_expires_old_traffic(self):
+        clock = Clock()
+        hitters = WindowedHeavyHitters(10, window=60, buckets=6, clock=clock)
+
+        for _ in range(5):
+            hitters.add('old')
+        clock.now = 30
+        hitters.add('new')
+
+        self.assertEqual(hitters.top(1)[0][0], 'old')
+
+        clock.now = 65
+        self.assertEqual([item for item, _, _ in hitters.top(5)], ['new'])
+
+
+class TestHotAddressHandler(unittest.TestCase):
+    def test_report_names_hot_publisher(self):
+        handler = HotAddressHandler(
+            OMITransactionHandler(), HotAddressTracker(), learn_every=1)
+        state = LocalState()
+
+        handler.apply(make_request(
+            'i', 'SetIndividualIdentity',
+            IndividualIdentity(name='Tina Turner', pubkey=SIGNER)), state)
+        handler.apply(make_request(
+            'o', 'SetOrganizationalIdentity',
+            OrganizationalIdentity(name='Capitol', pubkey=SIGNER)), state)
+
+        for i in range(5):
+            handler.apply(make_request('w{}'.format(i), 'SetWork', Work(
+                title='Work {}'.format(i),
+                registering_pubkey=SIGNER,
+                songwriter_publisher_splits=[Work.SongwriterPublisherSplit(
+                    split=100,
+                    songwriter_publisher=Work.SongwriterPublisher(
+                        songwriter_name='Tina Turner',
+                        publisher_name='Capitol'))])), state)
+
+        hot = handler.tracker.hot_reads(2)
+        self.assertEqual(
+            [(h.tag, h.name, h.count) for h in hot],
+            [('__individual', 'Tina Turner', 6),
+             ('__organization', 'Capitol', 6)])
+        self.assertEqual(
+            hot[1].address, make_omi_address('Capitol', ORGANIZATION))
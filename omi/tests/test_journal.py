@@ -0,0 +1,183 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+
+from sawtooth_omi.journal import BulkLoader
+from sawtooth_omi.journal import SubmissionJournal
+from sawtooth_omi.journal import object_digest
+from sawtooth_omi.journal import COMMITTED, INVALID
+
+
+class Factory:
+    '''
+    Makes single-batch BatchLists with fresh batch IDs, like the
+    OMIMessageFactory
+    '''
+
+    def __init__(self):
+        self.count = 0
+
+    def create_batch(self, action, **kwargs):
+        self.count += 1
+        batch_id = hashlib.sha512(
+            '{}{}'.format(self.count, kwargs).encode()).hexdigest()
+        return BatchList(batches=[
+            Batch(header_signature=batch_id)]).SerializeToString()
+
+
+class Crash(Exception):
+    pass
+
+
+class Validator:
+    '''
+    Commits every batch it receives, unless told otherwise, and can
+    crash the client after a number of posts
+    '''
+
+    def __init__(self, crash_after=None):
+        self.statuses = {}
+        self.posted = 0
+        self.crash_after = crash_after
+
+    def submit(self, batch_list, wait=None):
+        for batch in batch_list.batches:
+            self.statuses.setdefault(batch.header_signature, COMMITTED)
+            self.posted += 1
+
+        if self.crash_after is not None and self.posted >= self.crash_after:
+            raise Crash()
+
+        return self.batch_statuses(
+            [batch.header_signature for batch in batch_list.batches])
+
+    def batch_statuses(self, batch_ids, wait=None):
+        return {
+            batch_id: self.statuses.get(batch_id, 'UNKNOWN')
+            for batch_id in batch_ids}
+
+
+class InvalidatingFactory(Factory):
+    '''
+    Tells the validator to reject batches of names starting with "bad"
+    '''
+
+    def __init__(self, validator):
+        super().__init__()
+        self.validator = validator
+
+    def create_batch(self, action, **kwargs):
+        data = super().create_batch(action, **kwargs)
+        if kwargs['name'].startswith('bad'):
+            batch_list = BatchList()
+            batch_list.ParseFromString(data)
+            self.validator.statuses[
+                batch_list.batches[0].header_signature] = INVALID
+        return data
+
+
+def _objects(count):
+    return [
+        ('SetIndividualIdentity',
+         {'name': 'bad {}'.format(i) if i % 7 == 0 else str(i)})
+        for i in range(count)
+    ]
+
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _load(self, validator, objects, **kwargs):
+        journal = SubmissionJournal(self.path, **kwargs)
+        loader = BulkLoader(
+            InvalidatingFactory(validator), validator, journal,
+            group_size=10, poll_interval=0)
+        try:
+            loader.load(objects)
+        finally:
+            journal.close()
+
+    def test_resume_after_crash_posts_each_object_once(self):
+        objects = _objects(95)
+        validator = Validator(crash_after=40)
+
+        with self.assertRaises(Crash):
+            self._load(validator, objects)
+
+        validator.crash_after = None
+        self._load(validator, objects)
+
+        self.assertEqual(validator.posted, 95)
+
+        journal = SubmissionJournal(self.path)
+        self.assertEqual(journal.watermark, 95)
+        self.assertEqual(journal.committed, 81)
+        self.assertEqual(sorted(journal.invalid), list(range(0, 95, 7)))
+        journal.close()
+
+    def test_unreceived_batches_are_resubmitted(self):
+        objects = _objects(30)
+        validator = Validator()
+
+        journal = SubmissionJournal(self.path)
+        journal.submitted(3, object_digest(*objects[3]), 'ab' * 64)
+        journal.close()
+
+        self._load(validator, objects)
+
+        self.assertEqual(validator.posted, 30)
+        journal = SubmissionJournal(self.path)
+        self.assertEqual(journal.watermark, 30)
+        self.assertEqual(journal.pending, {})
+        journal.close()
+
+    def test_torn_tail_is_cut_off(self):
+        self._load(Validator(), _objects(20))
+        size = os.path.getsize(self.path)
+
+        with open(self.path, 'ab') as fd:
+            fd.write(b'\x01\x00\x00')
+
+        journal = SubmissionJournal(self.path)
+        self.assertEqual(journal.watermark, 20)
+        journal.close()
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_compaction_keeps_state(self):
+        validator = Validator()
+        self._load(validator, _objects(200), compact_after=50)
+
+        journal = SubmissionJournal(self.path)
+        self.assertEqual(
+            (journal.watermark, journal.committed, len(journal.invalid)),
+            (200, 171, 29))
+        journal.close()
+
+        # a checkpoint plus a SUBMIT and STATUS per invalid object, and
+        # at most 50 records appended since
+        self.assertLess(os.path.getsize(self.path), 21 + 29 * 99 + 50 * 85)
@@ -0,0 +1,99 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import random
+import unittest
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.loadgen import LatencyHistogram
+from sawtooth_omi.loadgen import OpenLoopRun
+from sawtooth_omi.loadgen import Workload
+from sawtooth_omi.loadgen import parse_mix
+
+from rest_api_standin import RestApiStandin
+from test_journal import Factory
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_percentiles_within_bucket_error(self):
+        rng = random.Random(1)
+        values = sorted(rng.randint(1, 10 ** 7) for _ in range(10000))
+
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+
+        for percent in (50, 95, 99, 99.9):
+            exact = values[int(len(values) * percent / 100) - 1]
+            self.assertAlmostEqual(
+                histogram.percentile(percent) / exact, 1, delta=0.02)
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+
+class TestOpenLoopRun(unittest.TestCase):
+    def setUp(self):
+        self.standin = RestApiStandin(block_interval=0.05)
+        self.standin.start()
+
+        self.factory = Factory()
+        self.run = OpenLoopRun(
+            OMIRestClient(self.standin.url),
+            self.factory,
+            Workload('02' + 'ab' * 32, parse_mix('SetWork=1,SetRecording=1'),
+                     individuals=5, organizations=2, works=5),
+            rate=100, duration=1, workers=1, poll_interval=0.01,
+            interval=0.5)
+
+    def tearDown(self):
+        self.standin.stop()
+
+    def test_every_batch_commits(self):
+        self.run.setup()
+        report = self.run.run()
+
+        self.assertEqual(
+            (report.scheduled, report.committed, report.unfinished),
+            (100, 100, 0))
+        self.assertEqual(
+            sum(sent for sent, _ in report.timeline.values()), 100)
+        self.assertLess(report.latencies.percentile(50), 200000)
+
+    def test_stall_is_charged_to_queued_batches(self):
+        # With one sender, every batch scheduled during the stall waits
+        # behind it; their latency counts from the schedule
+        self.standin.stall = 0.5
+        report = self.run.run()
+
+        self.assertEqual(report.committed, 100)
+        self.assertGreater(report.latencies.percentile(75), 150000)
+
+    def test_many_outstanding_batches(self):
+        # More batches in flight than fit in one status query's URL
+        self.standin.stop()
+        self.standin = RestApiStandin(block_interval=0.05, commit_delay=1.5)
+        self.standin.start()
+
+        run = OpenLoopRun(
+            OMIRestClient(self.standin.url),
+            self.factory,
+            Workload('02' + 'ab' * 32, parse_mix('SetWork=1'),
+                     individuals=5, organizations=2, works=5),
+            rate=800, duration=1, workers=4, poll_interval=0.05)
+        with self.assertNoLogs('sawtooth_omi.loadgen', 'WARNING'):
+            report = run.run()
+
+        self.assertEqual(
+            (report.scheduled, report.committed, report.unfinished),
+            (800, 800, 0))
@@ -0,0 +1,89 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import collections
+import os
+import signal
+import unittest
+
+from sawtooth_omi.memory import MemoryTrackingHandler
+from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+
+
+Request = collections.namedtuple('Request', ['payload'])
+
+
+def _request(action):
+    return Request(OMITransactionPayload(action=action).SerializeToString())
+
+
+class RetainingHandler:
+    '''
+    Keeps a kilobyte per apply, so there is memory to attribute
+    '''
+
+    family_name = 'omi'
+
+    def __init__(self):
+        self.kept = []
+
+    def apply(self, transaction, state):
+        self.kept.append(bytearray(1024))
+
+
+class TestMemoryTrackingHandler(unittest.TestCase):
+    def setUp(self):
+        self.inner = RetainingHandler()
+
+    def _report(self, handler):
+        return '\n'.join(handler.report())
+
+    def test_reports_per_action(self):
+        handler = MemoryTrackingHandler(self.inner, sample_every=2)
+        for _ in range(4):
+            handler.apply(_request('SetWork'), None)
+        handler.apply(_request('SetRecording'), None)
+        handler.apply(Request(b'\xff'), None)
+
+        report = self._report(handler)
+        self.assertIn('SetWork: 4 txns', report)
+        self.assertIn('2 sampled', report)
+        self.assertIn('SetRecording: 1 txns', report)
+        self.assertIn('<undecodable>: 1 txns', report)
+        self.assertIn('test_memory.py', report)
+
+    def test_reports_every_n_transactions(self):
+        handler = MemoryTrackingHandler(
+            self.inner, sample_every=100, report_every=2)
+        with self.assertLogs('sawtooth_omi.memory') as logs:
+            for _ in range(4):
+                handler.apply(_request('SetWork'), None)
+        self.assertEqual(len(logs.output), 2)
+
+    def test_signal_reports_after_the_next_apply(self):
+        handler = MemoryTrackingHandler(self.inner, sample_every=100)
+        previous = signal.getsignal(signal.SIGUSR2)
+        handler.install_signal()
+        try:
+            # as if the signal arrived while apply held the lock
+            with handler._lock:  # pylint: disable=protected-access
+                os.kill(os.getpid(), signal.SIGUSR2)
+        finally:
+            signal.signal(signal.SIGUSR2, previous)
+
+        with self.assertLogs('sawtooth_omi.memory') as logs:
+            handler.apply(_request('SetWork'), None)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('SetWork: 1 txns', logs.output[0])
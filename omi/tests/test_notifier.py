@@ -0,0 +1,151 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import queue
+import threading
+import unittest
+
+from sawtooth_omi.notifier import CommitNotifier
+from sawtooth_omi.notifier import STATUS_QUERY_SIZE
+
+
+class LocalEvents:
+    '''
+    Stands in for a block commit subscription: yields the block IDs
+    passed to commit() until closed
+    '''
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            block_id = self._queue.get()
+            if block_id is None:
+                return
+            yield block_id
+
+    def commit(self, block_id):
+        self._queue.put(block_id)
+
+    def close(self):
+        self._queue.put(None)
+
+
+class Chain:
+    def __init__(self):
+        self.blocks = {}
+        self.statuses = {}
+        self.block_reads = 0
+        self.status_reads = 0
+
+    def commit(self, block_id, batch_ids):
+        self.blocks[block_id] = {'header': {'batch_ids': list(batch_ids)}}
+        self.statuses.update((batch_id, 'COMMITTED') for batch_id in batch_ids)
+
+    def block(self, block_id):
+        self.block_reads += 1
+        return self.blocks[block_id]
+
+    def batch_statuses(self, batch_ids, wait=None):
+        self.status_reads += 1
+        return {
+            batch_id: self.statuses.get(batch_id, 'UNKNOWN')
+            for batch_id in batch_ids
+        }
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _ids(prefix, count):
+    return ['{}-{}'.format(prefix, i) for i in range(count)]
+
+
+class TestCommitNotifier(unittest.TestCase):
+    def setUp(self):
+        self.chain = Chain()
+        self.events = LocalEvents()
+        self.clock = Clock()
+        self.notifier = CommitNotifier(
+            self.chain, self.events, check_after=10.0, clock=self.clock)
+
+    def test_resolves_a_block_at_a_time(self):
+        batch_ids = _ids('batch', 3000)
+        futures = self.notifier.watch(batch_ids)
+
+        for block in range(30):
+            block_id = 'block-{}'.format(block)
+            self.chain.commit(
+                block_id, batch_ids[block * 100:(block + 1) * 100])
+            self.notifier.on_block(block_id)
+
+        self.assertEqual(
+            {future.result(0) for future in futures.values()}, {'COMMITTED'})
+        self.assertEqual(self.chain.block_reads, 30)
+        self.assertEqual(self.chain.status_reads, 0)
+
+        # with nothing pending a block isn't even read
+        self.chain.commit('block-30', ['other'])
+        self.notifier.on_block('block-30')
+        self.assertEqual(self.chain.block_reads, 30)
+
+    def test_only_stragglers_are_looked_up(self):
+        statuses = {}
+        self.notifier.watch(_ids('lost', 120), statuses.__setitem__)
+        self.chain.statuses['lost-0'] = 'INVALID'
+
+        self.clock.now = 5.0
+        self.notifier.watch(['fresh'], statuses.__setitem__)
+        self.assertEqual(self.notifier.check(), 0)
+        self.assertEqual(self.chain.status_reads, 0)
+
+        self.clock.now = 10.0
+        self.assertEqual(self.notifier.check(), 120)
+        self.assertEqual(
+            self.chain.status_reads, -(-120 // STATUS_QUERY_SIZE))
+        self.assertEqual(statuses['lost-0'], 'INVALID')
+        self.assertEqual(statuses['lost-1'], 'UNKNOWN')
+        self.assertNotIn('fresh', statuses)
+        self.assertEqual(self.notifier.pending(), 1)
+
+    def test_follows_events(self):
+        # committed before the notifier was listening
+        self.chain.commit('block-0', ['early'])
+        done = threading.Event()
+        statuses = {}
+
+        def on_status(batch_id, status):
+            statuses[batch_id] = status
+            if len(statuses) == 3:
+                done.set()
+
+        self.notifier.watch(['early', 'a', 'b'], on_status)
+        self.notifier.start()
+        try:
+            self.chain.commit('block-1', ['a', 'b'])
+            self.events.commit('block-1')
+            self.assertTrue(done.wait(5))
+        finally:
+            self.notifier.stop()
+
+        self.assertEqual(
+            statuses, {'early': 'COMMITTED', 'a': 'COMMITTED',
+                       'b': 'COMMITTED'})
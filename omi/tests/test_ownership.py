@@ -0,0 +1,156 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from unittest import mock
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.processor.state import StateEntry
+
+from sawtooth_omi import handler
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.handler import INDEXED_VERSION
+from sawtooth_omi.handler import INDIVIDUAL
+from sawtooth_omi.handler import ORGANIZATION
+from sawtooth_omi.handler import WORK
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.handler import _owner_index_entries
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import make_owner_index_address
+from sawtooth_omi.handler import make_owner_index_prefix
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+from sawtooth_omi.protobuf.ownership_pb2 import OwnerIndexShard
+
+from omi_builders import make_request
+from omi_builders import SIGNER
+
+
+OTHER = '03' + 'cd' * 32
+
+
+class StateClient(OMIRestClient):
+    '''
+    Reads a LocalState in place of the REST API
+    '''
+
+    def __init__(self, state):
+        super().__init__('http://localhost:0')
+        self._state = state
+
+    def state(self, prefix='', head=None):
+        return sorted(
+            (address, data) for address, data in self._state.items()
+            if address.startswith(prefix))
+
+    def state_entry(self, address, head=None):
+        entries = self._state.get([address])
+        return entries[0].data if entries else None
+
+
+def _shard(state, address):
+    shard = OwnerIndexShard()
+    shard.ParseFromString(state.get([address])[0].data)
+    return list(shard.addresses)
+
+
+class TestOwnerIndex(unittest.TestCase):
+    def setUp(self):
+        self.state = LocalState()
+        self.handler = OMITransactionHandler()
+
+    def _apply(self, action, obj, signer=SIGNER, version=INDEXED_VERSION):
+        self.handler.apply(
+            make_request(str(len(self.state)), action, obj, signer, version),
+            self.state)
+
+    def test_version_1_0_leaves_the_index_alone(self):
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER), version='1.0')
+        self.assertEqual(len(self.state), 1)
+
+        # and the next indexed update adds it
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER, ISNI='0000'))
+        address = make_omi_address('Tina Turner', INDIVIDUAL)
+        self.assertEqual(
+            _shard(self.state, make_owner_index_address(SIGNER, address)),
+            [address])
+
+    def test_full_shard_is_refused(self):
+        address = make_omi_address('Tina Turner', INDIVIDUAL)
+        shard_address = make_owner_index_address(SIGNER, address)
+        self.state.set([StateEntry(
+            address=shard_address,
+            data=OwnerIndexShard(addresses=['a', 'b']).SerializeToString())])
+
+        with mock.patch.object(handler, 'MAX_OWNER_INDEX_SHARD', 2):
+            with self.assertRaises(InvalidTransaction):
+                self._apply('SetIndividualIdentity', IndividualIdentity(
+                    name='Tina Turner', pubkey=SIGNER))
+        self.assertNotIn(address, self.state)
+
+    def test_creates_and_updates_are_indexed_once(self):
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER))
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='Tina Turner', pubkey=SIGNER, ISNI='0000'))
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='David Bowie', pubkey=OTHER), OTHER)
+
+        address = make_omi_address('Tina Turner', INDIVIDUAL)
+        self.assertEqual(
+            _shard(self.state, make_owner_index_address(SIGNER, address)),
+            [address])
+        self.assertNotIn(
+            make_owner_index_address(OTHER, address), self.state)
+
+    def test_ownership_change_moves_shards(self):
+        address = make_omi_address('Cat People', WORK)
+        old = make_owner_index_address(OTHER, address)
+        new = make_owner_index_address(SIGNER, address)
+        self.state.set(_owner_index_entries(self.state, address, '', OTHER))
+
+        entries = _owner_index_entries(self.state, address, OTHER, SIGNER)
+        self.assertEqual([entry.address for entry in entries], [old, new])
+        self.state.set(entries)
+
+        self.assertEqual(_shard(self.state, old), [])
+        self.assertEqual(_shard(self.state, new), [address])
+
+    def test_signer_catalog(self):
+        names = ['Writer {}'.format(i) for i in range(40)]
+        for name in names:
+            self._apply('SetIndividualIdentity', IndividualIdentity(
+                name=name, pubkey=SIGNER))
+        self._apply('SetOrganizationalIdentity', OrganizationalIdentity(
+            name='Capitol', pubkey=SIGNER))
+        self._apply('SetIndividualIdentity', IndividualIdentity(
+            name='Not Mine', pubkey=OTHER), OTHER)
+
+        client = StateClient(self.state)
+        # 41 objects land in at most as many shards
+        self.assertLessEqual(
+            len(client.state(make_owner_index_prefix(SIGNER))), 41)
+
+        catalog = client.signer_catalog(SIGNER)
+        self.assertEqual(
+            sorted(obj.name for _, tag, obj in catalog if tag == INDIVIDUAL),
+            sorted(names))
+        self.assertEqual(
+            [obj.name for _, tag, obj in catalog if tag == ORGANIZATION],
+            ['Capitol'])
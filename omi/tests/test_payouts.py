@@ -0,0 +1,134 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import tempfile
+import unittest
+from fractions import Fraction
+
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import WORK, RECORDING
+from sawtooth_omi.payouts import PayoutViews
+
+from omi_builders import make_recording
+from omi_builders import make_work
+
+
+def _entry(tag, obj):
+    name = obj.title
+    return make_omi_address(name, tag), obj.SerializeToString()
+
+
+class TestPayoutViews(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'payouts.db')
+        self.views = PayoutViews(self.path)
+
+        self.views.reset([
+            _entry(WORK, make_work('Proud Mary', [
+                ('John Fogerty', 'Jondora', 100)])),
+            _entry(RECORDING, make_recording(
+                'Proud Mary', [('Tina Turner', 60), ('Ike Turner', 40)],
+                [('Proud Mary', 100)])),
+            _entry(RECORDING, make_recording(
+                'Proud Mary Remix', [('DJ', 100)], [],
+                [('Proud Mary', 100)], overall=(0, 50, 50))),
+        ], 'b0')
+
+    def tearDown(self):
+        self.views.close()
+        shutil.rmtree(self.directory)
+
+    def test_flattened_through_derived_recordings(self):
+        self.assertEqual(self.views.payout('Proud Mary Remix'), [
+            (('contributor', 'DJ', ''), Fraction(1, 2)),
+            (('songwriter', 'John Fogerty', 'Jondora'), Fraction(1, 4)),
+            (('contributor', 'Tina Turner', ''), Fraction(3, 20)),
+            (('contributor', 'Ike Turner', ''), Fraction(1, 10)),
+        ])
+
+    def test_work_change_recomputes_only_downstream(self):
+        recomputed = self.views.update([
+            _entry(WORK, make_work('Proud Mary', [
+                ('John Fogerty', 'Jondora', 50),
+                ('Tom Fogerty', 'Jondora', 50)])),
+            _entry(RECORDING, make_recording(
+                'Unrelated', [('Someone', 100)], [('Missing', 100)])),
+        ], 'b1')
+
+        self.assertEqual(recomputed, 3)
+        self.assertEqual(self.views.earnings('Tom Fogerty'), [
+            ('Proud Mary', ('songwriter', 'Tom Fogerty', 'Jondora'),
+             Fraction(1, 4)),
+            ('Proud Mary Remix', ('songwriter', 'Tom Fogerty', 'Jondora'),
+             Fraction(1, 8)),
+        ])
+        self.assertIn(
+            (('work', 'Missing', ''), Fraction(1, 2)),
+            self.views.payout('Unrelated'))
+
+    def test_cycles_are_undefined_and_restored(self):
+        self.views.update([_entry(RECORDING, make_recording(
+            'Proud Mary', [('Tina Turner', 100)], [('Proud Mary', 100)],
+            [('Proud Mary Remix', 100)], overall=(50, 25, 25)))], 'b1')
+
+        self.assertIsNone(self.views.payout('Proud Mary'))
+        self.assertIsNone(self.views.payout('Proud Mary Remix'))
+
+        self.views.close()
+        self.views = PayoutViews(self.path)
+        self.assertEqual(self.views.head, 'b1')
+
+        self.views.update([_entry(RECORDING, make_recording(
+            'Proud Mary', [('Tina Turner', 100)],
+            [('Proud Mary', 100)]))], 'b2')
+        self.assertEqual(
+            self.views.payout('Proud Mary Remix')[0],
+            (('contributor', 'DJ', ''), Fraction(1, 2)))
+        self.assertEqual(len(self.views.payout('Proud Mary')), 2)
+
+    def test_deep_derivation_chain(self):
+        depth = 3000
+        self.views.update([_entry(RECORDING, make_recording(
+            'Take 0', [('Tina Turner', 100)], [], overall=(0, 0, 100)))] + [
+                _entry(RECORDING, make_recording(
+                    'Take {}'.format(i), [], [],
+                    [('Take {}'.format(i - 1), 100)], overall=(0, 100, 0)))
+                for i in range(1, depth)], 'b1')
+
+        self.assertEqual(
+            self.views.payout('Take {}'.format(depth - 1)),
+            [(('contributor', 'Tina Turner', ''), Fraction(1))])
+
+    def test_failed_reset_keeps_the_old_tables(self):
+        payout = self.views.payout('Proud Mary Remix')
+
+        def entries():
+            yield _entry(RECORDING, make_recording(
+                'Partial', [('Someone', 100)], []))
+            raise IOError('export truncated')
+
+        with self.assertRaises(IOError):
+            self.views.reset(entries(), 'b1')
+
+        reopened = PayoutViews(self.path)
+        for views in (self.views, reopened):
+            self.assertEqual(views.head, 'b0')
+            self.assertEqual(views.payout('Proud Mary Remix'), payout)
+            self.assertEqual(views.payout('Partial'), [])
+            self.assertEqual(len(views), 2)
+        reopened.close()
@@ -0,0 +1,110 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import collections
+import unittest
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.handler import INDIVIDUAL
+from sawtooth_omi.handler import ORGANIZATION
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.pipeline import Prevalidator
+from sawtooth_omi.protobuf.work_pb2 import Work
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+
+from omi_builders import make_request
+from omi_builders import SIGNER
+
+
+class CountingState:
+    def __init__(self):
+        self.entries = {}
+        self.reads = 0
+
+    def get(self, addresses):
+        self.reads += 1
+        return [
+            collections.namedtuple('Entry', ['address', 'data'])(a, d)
+            for a, d in ((a, self.entries.get(a)) for a in addresses)
+            if d is not None
+        ]
+
+    def set(self, entries):
+        for entry in entries:
+            self.entries[entry.address] = entry.data
+        return [entry.address for entry in entries]
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.prevalidator = Prevalidator(workers=2)
+        self.handler = OMITransactionHandler(prevalidator=self.prevalidator)
+        self.state = CountingState()
+
+    def tearDown(self):
+        self.prevalidator.shutdown()
+
+    def test_prevalidated_apply_sets_state(self):
+        request = make_request(
+            'txn-1', 'SetIndividualIdentity',
+            IndividualIdentity(name='Tina Turner', pubkey=SIGNER))
+
+        self.prevalidator.submit(request)
+        self.handler.apply(request, self.state)
+
+        self.assertEqual(len(self.state.entries), 1)
+
+    def test_bad_split_rejected_without_state_reads(self):
+        request = make_request('txn-2', 'SetWork', Work(
+            title='Cat People',
+            songwriter_publisher_splits=[
+                Work.SongwriterPublisherSplit(split=90)],
+            registering_pubkey=SIGNER))
+
+        future = self.prevalidator.submit(request)
+        self.assertIsInstance(future.exception(), InvalidTransaction)
+
+        with self.assertRaises(InvalidTransaction):
+            self.handler.apply(request, self.state)
+        self.assertEqual(self.state.reads, 0)
+
+    def test_wrong_signer_rejected_inline(self):
+        request = make_request(
+            'txn-3', 'SetIndividualIdentity',
+            IndividualIdentity(name='David Bowie', pubkey='other'))
+
+        with self.assertRaises(InvalidTransaction):
+            self.handler.apply(request, self.state)
+        self.assertEqual(self.state.reads, 0)
+
+    def test_unreadable_reference_rejected(self):
+        self.state.entries[make_omi_address('David Bowie', INDIVIDUAL)] = \
+            b'\xff'
+        self.state.entries[make_omi_address('Bowie Music', ORGANIZATION)] = \
+            OrganizationalIdentity(name='Bowie Music').SerializeToString()
+        request = make_request('txn-4', 'SetWork', Work(
+            title='Cat People',
+            songwriter_publisher_splits=[Work.SongwriterPublisherSplit(
+                songwriter_publisher=Work.SongwriterPublisher(
+                    songwriter_name='David Bowie',
+                    publisher_name='Bowie Music'),
+                split=100)],
+            registering_pubkey=SIGNER))
+
+        with self.assertRaises(InvalidTransaction):
+            self.handler.apply(request, self.state)
@@ -0,0 +1,100 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import signal
+import tempfile
+import unittest
+
+from sawtooth_omi.profiling import ProfilingHandler
+from sawtooth_omi.profiling import SAMPLE
+
+
+class CountingHandler:
+    family_name = 'omi'
+
+    def __init__(self):
+        self.applied = 0
+
+    def apply(self, transaction, state):
+        self.applied += 1
+
+
+class TestProfilingHandler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.inner = CountingHandler()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _profiles(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_writes_a_profile_per_window(self):
+        handler = ProfilingHandler(self.inner, self.directory, every=2)
+        for _ in range(5):
+            handler.apply(None, None)
+        self.assertEqual(self.inner.applied, 5)
+        self.assertEqual(len(self._profiles()), 2)
+
+        # the partial window is written on close, with its own count
+        with self.assertLogs('sawtooth_omi.profiling', 'INFO') as logs:
+            handler.close()
+        self.assertEqual(len(self._profiles()), 3)
+        self.assertIn('profile of 1 transactions', logs.output[0])
+
+    def test_keeps_the_newest_profiles(self):
+        handler = ProfilingHandler(
+            self.inner, self.directory, every=1, mode=SAMPLE, keep=2,
+            sample_interval=0.001)
+        for _ in range(4):
+            handler.apply(None, None)
+        profiles = self._profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(profiles[0].endswith('-3.collapsed'))
+
+    def test_toggle_takes_effect_on_the_next_apply(self):
+        handler = ProfilingHandler(
+            self.inner, self.directory, every=10, enabled=False)
+        handler.apply(None, None)
+        self.assertEqual(self._profiles(), [])
+
+        handler.request_toggle()
+        self.assertFalse(handler.enabled)
+        handler.apply(None, None)
+        self.assertTrue(handler.enabled)
+
+        # turning it off writes the open window
+        handler.request_toggle()
+        handler.apply(None, None)
+        self.assertFalse(handler.enabled)
+        self.assertEqual(len(self._profiles()), 1)
+
+    def test_signal_does_not_take_the_lock(self):
+        handler = ProfilingHandler(
+            self.inner, self.directory, every=10, enabled=False)
+        previous = signal.getsignal(signal.SIGUSR1)
+        handler.install_signal()
+        try:
+            # as if the signal arrived while apply held the lock
+            with handler._lock:  # pylint: disable=protected-access
+                os.kill(os.getpid(), signal.SIGUSR1)
+        finally:
+            signal.signal(signal.SIGUSR1, previous)
+
+        handler.apply(None, None)
+        self.assertTrue(handler.enabled)
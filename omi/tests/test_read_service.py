@@ -0,0 +1,151 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import json
+import unittest
+import urllib.error
+import urllib.request
+
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import FAMILY_NAME, INDIVIDUAL, WORK
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.read_service import Catalog
+from sawtooth_omi.read_service import ReadService
+from sawtooth_omi.read_service import StateFollower
+
+
+def _individual(name, isni=''):
+    return (make_omi_address(name, INDIVIDUAL),
+            IndividualIdentity(name=name, ISNI=isni).SerializeToString())
+
+
+class Chain:
+    '''
+    Blocks and state as an OMIRestClient reads them
+    '''
+
+    def __init__(self):
+        self.blocks = {}
+        self.head = None
+        self.entries = {}
+        self.fetched = []
+
+    def commit(self, block_id, entries, parent=None):
+        parent = parent or self.head
+        block_num = self.blocks[parent]['header']['block_num'] + 1 \
+            if parent else 0
+        self.blocks[block_id] = {
+            'header_signature': block_id,
+            'header': {'block_num': block_num, 'previous_block_id': parent},
+            'batches': [{'transactions': [{'header': {
+                'family_name': FAMILY_NAME,
+                'outputs': [address for address, _ in entries],
+            }}]}],
+        }
+        self.head = block_id
+        self.entries.update(entries)
+
+    def head_block(self):
+        return self.blocks[self.head]
+
+    def block(self, block_id):
+        return self.blocks[block_id]
+
+    def state_entry(self, address, head=None):
+        self.fetched.append(address)
+        return self.entries.get(address)
+
+    def state(self, prefix=None, head=None):
+        self.fetched.append(prefix)
+        return list(self.entries.items())
+
+
+class TestReadService(unittest.TestCase):
+    def setUp(self):
+        self.catalog = Catalog()
+        self.catalog.reset(
+            [_individual('person {:03}'.format(i)) for i in range(250)],
+            'head')
+        self.service = ReadService(self.catalog, port=0)
+        self.service.start()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def _get(self, path, etag=None):
+        request = urllib.request.Request(self.service.url + path)
+        if etag:
+            request.add_header('If-None-Match', etag)
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode()), response.headers
+
+    def test_pages_follow_next_links(self):
+        names = []
+        path = '/individuals?limit=100&fields=name'
+        while path:
+            body, _ = self._get(path)
+            names.extend(obj['name'] for obj in body['data'])
+            self.assertEqual(body['paging']['total_count'], 250)
+            path = body['paging'].get('next')
+
+        self.assertEqual(
+            names, ['person {:03}'.format(i) for i in range(250)])
+
+    def test_etag_changes_with_the_collection(self):
+        body, headers = self._get('/individuals/person%20007')
+        self.assertEqual(body, {'name': 'person 007'})
+
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self._get('/individuals/person%20007', headers['ETag'])
+        self.assertEqual(context.exception.code, 304)
+
+        self.catalog.update([_individual('person 007', 'ISNI')], 'next')
+        body, _ = self._get('/individuals/person%20007', headers['ETag'])
+        self.assertEqual(body['ISNI'], 'ISNI')
+
+
+class TestStateFollower(unittest.TestCase):
+    def setUp(self):
+        self.chain = Chain()
+        self.chain.commit('b0', [_individual('Tina Turner')])
+        self.catalog = Catalog()
+        self.follower = StateFollower(self.chain, self.catalog)
+        self.follower.load()
+
+    def _names(self):
+        return [obj['name'] for obj, _ in
+                self.catalog.page(INDIVIDUAL).items]
+
+    def test_new_blocks_fetch_only_their_outputs(self):
+        self.chain.commit('b1', [_individual('Ike Turner')])
+        self.chain.commit('b2', [_individual('Tina Turner', 'ISNI')])
+        self.chain.fetched = []
+
+        self.assertEqual(self.follower.poll(), 2)
+        self.assertEqual(len(self.chain.fetched), 2)
+        self.assertEqual(self._names(), ['Ike Turner', 'Tina Turner'])
+        self.assertEqual(self.catalog.head, 'b2')
+        self.assertEqual(self.follower.poll(), 0)
+
+    def test_fork_reloads(self):
+        self.chain.commit('b1', [_individual('Ike Turner')])
+        self.follower.poll()
+
+        del self.chain.entries[make_omi_address('Ike Turner', INDIVIDUAL)]
+        self.chain.commit('c1', [_individual('Phil Spector')], parent='b0')
+
+        self.assertIsNone(self.follower.poll())
+        self.assertEqual(self._names(), ['Phil Spector', 'Tina Turner'])
+        self.assertEqual(self.catalog.page(WORK).total, 0)
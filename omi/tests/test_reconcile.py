@@ -0,0 +1,96 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import unittest
+
+from sawtooth_sdk.processor.state import StateEntry
+
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import make_owner_index_address
+from sawtooth_omi.handler import WORK, INDIVIDUAL
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.reconcile import CountingSide
+from sawtooth_omi.reconcile import DigestIndex
+from sawtooth_omi.reconcile import reconcile
+
+
+DEPTH = 3
+
+
+def _state(count):
+    state = LocalState()
+    state.set([
+        StateEntry(
+            address=make_omi_address('object {}'.format(i),
+                                     WORK if i % 2 else INDIVIDUAL),
+            data='data {}'.format(i).encode())
+        for i in range(count)
+    ])
+    return state
+
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.chain = _state(20000)
+        self.catalog = DigestIndex(self.chain.items(), DEPTH)
+
+    def _reconcile(self):
+        remote = CountingSide(DigestIndex(self.chain.items(), DEPTH))
+        return reconcile(self.catalog, remote, DEPTH), remote.reads
+
+    def test_identical_sides_cost_one_read(self):
+        result, reads = self._reconcile()
+
+        self.assertFalse(result)
+        self.assertEqual(reads, 1)
+
+    def test_finds_a_few_changes_in_few_reads(self):
+        changed = make_omi_address('object 7', WORK)
+        added = make_omi_address('new object', WORK)
+        removed = make_omi_address('object 8', INDIVIDUAL)
+
+        self.chain.set([
+            StateEntry(address=changed, data=b'changed'),
+            StateEntry(address=added, data=b'added'),
+        ])
+        self.catalog.delete(removed)
+
+        result, reads = self._reconcile()
+
+        self.assertEqual(list(result.different), [changed])
+        self.assertEqual(result.different[changed][1], b'changed')
+        self.assertEqual(
+            sorted(result.missing_locally), sorted([added, removed]))
+        self.assertEqual(result.missing_remotely, {})
+        self.assertLess(reads, 20)
+
+    def test_updates_are_order_independent(self):
+        address = make_omi_address('object 1', WORK)
+        index = DigestIndex(self.chain.items(), DEPTH)
+
+        index.put(address, b'other')
+        index.put(address, b'data 1')
+
+        self.assertEqual(index.digests(['38aa50a0']),
+                         self.catalog.digests(['38aa50a0']))
+        self.assertEqual(len(index), 20000)
+
+    def test_finds_owner_index_changes(self):
+        shard = make_owner_index_address(
+            '02' + 'ab' * 32, make_omi_address('object 1', WORK))
+        self.chain.set([StateEntry(address=shard, data=b'shard')])
+
+        result, _ = self._reconcile()
+        self.assertEqual(list(result.missing_locally), [shard])
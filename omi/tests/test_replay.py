@@ -0,0 +1,147 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from sawtooth_omi import replay as replay_module
+from sawtooth_omi.batch_stream import write_batch_list
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import WORK, INDIVIDUAL, ORGANIZATION
+from sawtooth_omi.protobuf.work_pb2 import Work
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.identity_pb2 import OrganizationalIdentity
+from sawtooth_omi.protobuf.txn_payload_pb2 import OMITransactionPayload
+from sawtooth_omi.pipeline import Prevalidator
+from sawtooth_omi.replay import COMMITTED, INVALID
+from sawtooth_omi.replay import partition
+from sawtooth_omi.replay import read_replay_batches
+from sawtooth_omi.replay import replay
+
+
+SIGNER = '02' + 'cd' * 32
+
+
+def _batch(batch_id, action, obj, inputs, outputs):
+    header = TransactionHeader(
+        signer_pubkey=SIGNER, inputs=inputs, outputs=outputs)
+    payload = OMITransactionPayload(
+        action=action, data=obj.SerializeToString())
+    return Batch(header_signature=batch_id, transactions=[Transaction(
+        header=header.SerializeToString(),
+        header_signature=batch_id + '-txn',
+        payload=payload.SerializeToString())])
+
+
+def _identity(batch_id, name, tag):
+    obj_type = IndividualIdentity if tag == INDIVIDUAL else \
+        OrganizationalIdentity
+    action = 'SetIndividualIdentity' if tag == INDIVIDUAL else \
+        'SetOrganizationalIdentity'
+    address = make_omi_address(name, tag)
+    return _batch(batch_id, action, obj_type(name=name, pubkey=SIGNER),
+                  [address], [address])
+
+
+def _work(batch_id, title, songwriter, publisher, split=100, declare=True):
+    address = make_omi_address(title, WORK)
+    references = [make_omi_address(songwriter, INDIVIDUAL),
+                  make_omi_address(publisher, ORGANIZATION)]
+    return _batch(batch_id, 'SetWork', Work(
+        title=title,
+        songwriter_publisher_splits=[Work.SongwriterPublisherSplit(
+            split=split,
+            songwriter_publisher=Work.SongwriterPublisher(
+                songwriter_name=songwriter, publisher_name=publisher))],
+        registering_pubkey=SIGNER),
+        [address] + (references if declare else []), [address])
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        batches = [
+            _identity('b0', 'David Bowie', INDIVIDUAL),
+            _identity('b1', 'EMI', ORGANIZATION),
+            _identity('b2', 'Tina Turner', INDIVIDUAL),
+            _identity('b3', 'Capitol', ORGANIZATION),
+            _work('b4', 'Tonight', 'David Bowie', 'EMI'),
+            _work('b5', 'Nutbush', 'Tina Turner', 'Capitol', split=90),
+            _work('b6', 'Nutbush', 'Tina Turner', 'Capitol'),
+            _work('b7', 'Unknown', 'Nobody', 'Capitol'),
+            _work('b8', 'Undeclared', 'Tina Turner', 'Capitol',
+                  declare=False),
+        ]
+
+        fd, self.path = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as stream:
+            for batch in batches:
+                write_batch_list(
+                    stream, BatchList(batches=[batch]).SerializeToString())
+
+        self.batches = read_replay_batches([self.path])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_partition_by_declared_addresses(self):
+        self.assertEqual(
+            partition(self.batches),
+            [[0, 1, 4], [2, 3, 5, 6, 7], [8]])
+
+    def test_verdicts(self):
+        statuses = [verdict.status for verdict in replay(self.batches, 0)]
+
+        self.assertEqual(statuses, [
+            COMMITTED, COMMITTED, COMMITTED, COMMITTED, COMMITTED,
+            INVALID, COMMITTED, INVALID, INVALID])
+
+    def test_prevalidated_matches_serial(self):
+        serial = replay(self.batches, 0)
+
+        submitted = []
+
+        class RecordingPrevalidator(Prevalidator):
+            def submit(self, transaction):
+                submitted.append(transaction.signature)
+                return super().submit(transaction)
+
+        with mock.patch.object(replay_module, 'PREVALIDATE_AHEAD', 2), \
+                mock.patch.object(
+                    replay_module, 'Prevalidator', RecordingPrevalidator):
+            prevalidated = replay(self.batches, 0, prevalidate_workers=2)
+        self.assertEqual(len(submitted), len(self.batches))
+
+        parallel = replay(self.batches, 2, prevalidate_workers=2)
+
+        for verdicts in (prevalidated, parallel):
+            self.assertEqual(
+                [(v.batch_id, v.status, v.reason) for v in verdicts],
+                [(v.batch_id, v.status, v.reason) for v in serial])
+
+    def test_parallel_matches_serial(self):
+        serial = replay(self.batches, 0)
+        parallel = replay(self.batches, 2)
+
+        self.assertEqual(
+            [(v.batch_id, v.status, v.reason) for v in serial],
+            [(v.batch_id, v.status, v.reason) for v in parallel])
@@ -0,0 +1,84 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import random
+import unittest
+
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+from sawtooth_omi.search import SearchIndex
+from sawtooth_omi.search import trigrams
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(ORGANIZATION, 'The Beatles')
+        self.index.add(INDIVIDUAL, 'Sinéad O’Connor')
+        self.index.add(WORK, 'Let It Be')
+        self.index.add(RECORDING, 'Let It Be')
+        self.index.add(RECORDING, 'Let It Bleed')
+
+    def _names(self, query, **kwargs):
+        return [(match.tag, match.name)
+                for match in self.index.search(query, **kwargs)]
+
+    def test_normalized_names_match_exactly(self):
+        match, = self.index.search('Beatles, The')
+        self.assertEqual((match.name, match.score), ('The Beatles', 1.0))
+
+        match, = self.index.search('sinead o connor')
+        self.assertEqual(match.score, 1.0)
+
+    def test_ranked_and_filtered(self):
+        self.assertEqual(self._names('let it be', tags=[RECORDING]), [
+            (RECORDING, 'Let It Be'),
+            (RECORDING, 'Let It Bleed'),
+        ])
+        self.assertEqual(self._names('Beatels'), [
+            (ORGANIZATION, 'The Beatles')])
+
+    def test_removed_and_renamed(self):
+        self.index.remove(WORK, 'Let It Be')
+        self.index.add(RECORDING, 'Let It Bleed')
+
+        self.assertEqual(self._names('let it be'), [
+            (RECORDING, 'Let It Be'),
+            (RECORDING, 'Let It Bleed'),
+        ])
+
+    def test_same_results_as_scoring_everything(self):
+        rng = random.Random(3)
+        syllables = ['la', 'ro', 'mi', 'ne', 'ka', 'tor', 'ben', 'us']
+        names = {
+            ' '.join(
+                ''.join(rng.choice(syllables) for _ in range(3))
+                for _ in range(rng.randint(1, 3)))
+            for _ in range(2000)
+        }
+        for name in names:
+            self.index.add(WORK, name)
+
+        for query in rng.sample(sorted(names), 20):
+            query_grams = trigrams(query)
+            expected = sorted(
+                len(query_grams & trigrams(name))
+                / len(query_grams | trigrams(name))
+                for name in names)
+            expected = [score for score in expected if score >= 0.4]
+
+            found = self.index.search(
+                query, limit=len(names), min_score=0.4, tags=[WORK])
+            self.assertEqual(
+                sorted(match.score for match in found), expected)
@@ -0,0 +1,132 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from sawtooth_omi.handler import make_omi_address
+from sawtooth_omi.handler import WORK, RECORDING, INDIVIDUAL, ORGANIZATION
+from sawtooth_omi.snapshot import Replica
+from sawtooth_omi.snapshot import Snapshot
+from sawtooth_omi.snapshot import write_snapshot
+
+
+def _entries(count, seed=0):
+    rng = random.Random(seed)
+    tags = (WORK, RECORDING, INDIVIDUAL, ORGANIZATION)
+    return [
+        (make_omi_address('object {}'.format(i), rng.choice(tags)),
+         'data {}'.format(i).encode() * rng.randint(0, 3))
+        for i in range(count)
+    ]
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookups_and_scans_from_spilled_runs(self):
+        entries = _entries(500)
+        self.assertEqual(
+            write_snapshot(self.path, entries, 'head', run_size=64), 500)
+
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual((len(snapshot), snapshot.head), (500, 'head'))
+            for address, data in entries:
+                self.assertEqual(snapshot.get(address), data)
+            self.assertIsNone(
+                snapshot.get(make_omi_address('missing', WORK)))
+
+            prefix = make_omi_address('', WORK)[:8]
+            works = sorted(e for e in entries if e[0].startswith(prefix))
+            self.assertEqual(
+                [(a, bytes(d)) for a, d in snapshot.section(WORK)], works)
+            self.assertEqual(
+                [(a, bytes(d)) for a, d in snapshot.scan(prefix[:7])],
+                sorted(e for e in entries if e[0].startswith(prefix[:7])))
+            self.assertEqual(
+                [a for a, _ in snapshot.scan()], sorted(a for a, _ in entries))
+
+    def test_duplicate_addresses_are_refused(self):
+        entries = _entries(10)
+        with self.assertRaises(ValueError):
+            write_snapshot(self.path, entries + entries[3:4])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class TestReplica(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'state.snapshot')
+        self.entries = dict(_entries(100))
+        self.replica = Replica(self.path, compact_after=50)
+        self.replica.reset(self.entries.items(), 'b0')
+
+    def tearDown(self):
+        self.replica.close()
+        shutil.rmtree(self.directory)
+
+    def _update(self, changes, head):
+        self.replica.update(changes, head)
+        for address, data in changes:
+            if data is None:
+                self.entries.pop(address, None)
+            else:
+                self.entries[address] = data
+
+    def _check(self):
+        self.assertEqual(len(self.replica), len(self.entries))
+        self.assertEqual(
+            [(a, bytes(d)) for a, d in self.replica.scan()],
+            sorted(self.entries.items()))
+
+    def test_delta_is_replayed_on_open(self):
+        removed, changed = sorted(self.entries)[:2]
+        added = make_omi_address('new', WORK)
+        self._update([(removed, None), (changed, b'changed')], 'b1')
+        self._update([(added, b'added')], 'b2')
+        self._check()
+        self.assertIsNone(self.replica.get(removed))
+
+        self.replica.close()
+        # a crash tore the last line
+        with open(self.path + '.delta', 'a') as fd:
+            fd.write('{"head": "b3", "chan')
+
+        self.replica = Replica(self.path)
+        self.assertEqual(self.replica.head, 'b2')
+        self._check()
+
+        self._update([(removed, b'back')], 'b3')
+        self.replica.close()
+        self.replica = Replica(self.path)
+        self.assertEqual(self.replica.head, 'b3')
+        self._check()
+
+    def test_compacts_into_a_new_snapshot(self):
+        for i, (address, _) in enumerate(_entries(60, seed=1)):
+            self._update([(address, b'x' * i)], 'b{}'.format(i))
+        self._check()
+
+        with Snapshot(self.path) as snapshot:
+            self.assertEqual(snapshot.head, 'b49')
+        self.assertEqual(self.replica.head, 'b59')
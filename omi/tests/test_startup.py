@@ -0,0 +1,54 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import os
+import unittest
+
+from sawtooth_omi.startup import measure_imports
+from sawtooth_omi.startup import parse_importtime
+from sawtooth_omi.startup import process_uptime
+
+
+OMI_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+class TestStartup(unittest.TestCase):
+    def test_parse_importtime(self):
+        times = parse_importtime(
+            'import time: self [us] | cumulative | imported package\n'
+            'import time:       166 |        166 |   _io\n'
+            'import time:       310 |        831 | encodings\n')
+
+        self.assertEqual([t.module for t in times], ['_io', 'encodings'])
+        self.assertEqual([t.depth for t in times], [1, 0])
+        self.assertEqual(times[1].cumulative_us, 831)
+
+    def test_main_defers_optional_and_processor_imports(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            p for p in (OMI_DIR, env.get('PYTHONPATH')) if p)
+
+        modules = {t.module for t in measure_imports('sawtooth_omi.main',
+                                                     env=env)}
+
+        self.assertIn('sawtooth_omi.main', modules)
+        self.assertNotIn('colorlog', modules)
+        self.assertNotIn('sawtooth_sdk.processor.core', modules)
+        self.assertFalse(any(m.endswith('_pb2') for m in modules))
+
+    def test_process_uptime(self):
+        uptime = process_uptime()
+        self.assertGreaterEqual(uptime, 0)
+        self.assertLess(uptime, 24 * 60 * 60)
@@ -0,0 +1,137 @@
+# Copyright 2017 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ------------------------------------------------------------------------------
+
+import http.server
+import json
+import threading
+import unittest
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+from sawtooth_sdk.protobuf.batch_pb2 import Batch
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import Transaction
+
+from sawtooth_omi.client import OMIRestClient
+from sawtooth_omi.handler import OMITransactionHandler
+from sawtooth_omi.local_state import LocalState
+from sawtooth_omi.protobuf.identity_pb2 import IndividualIdentity
+from sawtooth_omi.protobuf.work_pb2 import Work
+from sawtooth_omi.tracing import Tracer
+from sawtooth_omi.tracing import transaction_trace_ids
+
+from omi_builders import make_request
+from omi_builders import SIGNER
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, records):
+        self.spans.extend(records)
+
+    def close(self):
+        pass
+
+
+class RestApi(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._reply({'link': '/batch_status'})
+
+    def do_GET(self):
+        self._reply({'data': [{'id': 'batch-1', 'status': 'COMMITTED'}]})
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(202 if self.command == 'POST' else 200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        self.exporter = ListExporter()
+        self.tracer = Tracer(self.exporter, 'test')
+
+    def tearDown(self):
+        self.tracer.close()
+
+    def test_apply_records_phases_under_transaction_trace(self):
+        handler = OMITransactionHandler(tracer=self.tracer)
+        handler.apply(make_request(
+            'txn-1', 'SetIndividualIdentity',
+            IndividualIdentity(name='Tina Turner', pubkey=SIGNER)),
+            LocalState())
+        self.tracer.flush()
+
+        trace_id, root_id = transaction_trace_ids('txn-1')
+        spans = {span['name']: span for span in self.exporter.spans}
+
+        self.assertEqual(
+            sorted(spans),
+            ['apply', 'prevalidate', 'state_read', 'unpack', 'validate',
+             'write'])
+        self.assertTrue(
+            all(span['traceId'] == trace_id for span in spans.values()))
+        self.assertEqual(spans['apply']['parentId'], root_id)
+        self.assertEqual(spans['write']['parentId'], spans['apply']['id'])
+
+    def test_rejected_apply_is_tagged_with_error(self):
+        handler = OMITransactionHandler(tracer=self.tracer)
+        with self.assertRaises(InvalidTransaction):
+            handler.apply(make_request('txn-2', 'SetWork', Work(
+                title='Unregistered', registering_pubkey=SIGNER)),
+                LocalState())
+        self.tracer.flush()
+
+        apply_span, = [
+            span for span in self.exporter.spans if span['name'] == 'apply']
+        self.assertIn('error', apply_span['tags'])
+
+    def test_client_submit_span_is_transaction_root(self):
+        server = http.server.HTTPServer(('127.0.0.1', 0), RestApi)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+
+        try:
+            client = OMIRestClient(
+                'http://127.0.0.1:{}'.format(server.server_port),
+                self.tracer)
+            statuses = client.submit(BatchList(batches=[Batch(
+                header_signature='batch-1',
+                transactions=[Transaction(header_signature='txn-3')])]),
+                wait=1)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.tracer.flush()
+
+        self.assertEqual(statuses, {'batch-1': 'COMMITTED'})
+
+        trace_id, root_id = transaction_trace_ids('txn-3')
+        submit, = [
+            span for span in self.exporter.spans if span['name'] == 'submit']
+        self.assertEqual(
+            (submit['traceId'], submit['id']), (trace_id, root_id))
+        self.assertEqual(submit['tags']['omi.batch_id'], 'batch-1')
+        self.assertEqual(submit['tags']['omi.batch_status'], 'COMMITTED')
+        self.assertEqual(
+            sorted(span['name'] for span in self.exporter.spans),
+            ['batch_status', 'post_batches', 'submit'])